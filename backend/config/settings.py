@@ -1,5 +1,6 @@
 # config/settings.py
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # ... (o resto dos imports) ...
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # 2. Apps de Terceiros (Third-Party)
     'rest_framework',
@@ -58,6 +60,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Mede consultas e tempos de cada requisição (ver INSTRUMENTACAO abaixo)
+    'core.middleware.InstrumentacaoMiddleware',
+    # Leituras nas réplicas do banco (ver REPLICAS_LEITURA abaixo)
+    'core.roteamento.RoteamentoMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -153,10 +159,105 @@ CORS_ALLOWED_ORIGINS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # A ordem importa: DRF tentará cada um na sequência.
-        'rest_framework.authentication.TokenAuthentication',
+        # TokenAuthentication com cache (ver core/authentication.py e TOKEN_CACHE abaixo)
+        'core.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication', # Adicione esta linha
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-}
\ No newline at end of file
+}
+# Paginação por cursor (core.pagination.KeysetPagination) das listagens
+# de recebimentos, notas fiscais, planos de compra e inspeções.
+# O cliente pode pedir ?page_size= até o limite abaixo.
+PAGINACAO_PAGE_SIZE = 50
+PAGINACAO_MAX_PAGE_SIZE = 500
+
+# Cache do Django, compartilhado entre os processos do servidor: guarda a marca de
+# revogação dos tokens, os grupos dos usuários e a marca de escrita das réplicas.
+# Com REDIS_URL (ex.: redis://localhost:6379/0) usa o Redis, que vale também entre
+# máquinas; sem ele, arquivos em CACHE_DIR, que valem entre os processos da mesma máquina.
+# O LocMemCache é de um processo só e é recusado pelo check core.E001 (ver core/checks.py).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'zenite-cache')),
+        }
+    }
+
+# Tempo (em segundos) que os grupos de um usuário ficam no cache usado pela
+# permissão IsInGroup. Alterações em User.groups invalidam o cache na hora, em
+# todos os processos (o CACHES acima é compartilhado). 0 desliga o cache.
+GRUPOS_CACHE_TTL = 300
+
+# Cache da resolução token -> usuário (core.authentication.CachedTokenAuthentication).
+# TTL em segundos. Com USAR_CACHE_DJANGO, o LRU local de cada processo é apoiado
+# pelo CACHES do Django, compartilhado entre processos, e a revogação de um token
+# vale na hora para todos eles. Desligá-lo só é seguro com um único processo: os
+# outros aceitariam o token revogado por até TTL segundos.
+TOKEN_CACHE = {
+    'MAX_ENTRADAS': 10000,
+    'TTL': 60,
+    'USAR_CACHE_DJANGO': True,
+}
+
+# Instrumentação das requisições (core.middleware.InstrumentacaoMiddleware).
+# Requisições e consultas acima dos limites (em ms) vão para o log "core.lento";
+# os percentis de cada rota usam as últimas JANELA_PERCENTIS requisições.
+INSTRUMENTACAO = {
+    'REQUISICAO_LENTA_MS': 500,
+    'CONSULTA_LENTA_MS': 100,
+    'JANELA_PERCENTIS': 1000,
+    'MAX_CONSULTAS_LENTAS': 20,
+}
+
+# Tempo (em segundos) que os resultados do Pareto de defeitos ficam no cache.
+# Defeitos novos ou alterados invalidam o cache na hora (ver core/analise_defeitos.py).
+PARETO_CACHE_TTL = 300
+
+# Views assíncronas (core/views_async.py): por quantos segundos cada thread de
+# consultas em paralelo reaproveita a sua conexão com o banco
+PARALELO_CONN_MAX_AGE = 60
+
+# Jobs em segundo plano (core/jobs.py, executados por manage.py zenite_worker).
+# INTERVALO: segundos entre consultas à fila vazia; um job sem sinal do worker
+# (renovado a cada BATIMENTO segundos) por mais de EXPIRACAO volta para a fila.
+# Cada falha espera ESPERA_BASE * 2^(tentativa-1) segundos (até ESPERA_MAXIMA).
+JOBS = {
+    'INTERVALO': 1.0,
+    'BATIMENTO': 10,
+    'EXPIRACAO': 60,
+    'MAX_TENTATIVAS': 3,
+    'ESPERA_BASE': 5,
+    'ESPERA_MAXIMA': 600,
+}
+
+# Réplicas de leitura do PostgreSQL (core/roteamento.py): DATABASE_REPLICAS=host[:porta],...
+# cria os bancos replica1, replica2... com as mesmas credenciais do default.
+# GETs das views e análises leem de uma réplica; depois de uma escrita, as
+# leituras do usuário ficam no primário por REPLICA_JANELA_PRIMARIO segundos.
+# A marca de escrita fica no cache: com mais de um processo, use um CACHES compartilhado.
+# Para testar localmente, aponte para outra instância: DATABASE_REPLICAS=localhost:5433
+REPLICAS_LEITURA = []
+for _indice, _endereco in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), start=1):
+    _host, _, _porta = _endereco.strip().rpartition(':')
+    if not _porta.isdigit():
+        _host, _porta = _endereco.strip(), DATABASES['default']['PORT']
+    DATABASES[f'replica{_indice}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _porta,
+        # Nos testes a réplica é o próprio banco de teste do default
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICAS_LEITURA.append(f'replica{_indice}')
+DATABASE_ROUTERS = ['core.roteamento.RoteadorReplicas']
+REPLICA_JANELA_PRIMARIO = 10
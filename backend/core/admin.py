@@ -2,7 +2,7 @@ from django.contrib import admin
 from .models import (
     Fornecedor, Material, PlanoCompra, ItemPlanoCompra,
     NotaFiscal, ItemNotaFiscal, Recebimento, ItemRecebido,
-    Defeito, InspecaoQualidade, ItemInspecionadoDefeito
+    Defeito, InspecaoQualidade, ItemInspecionadoDefeito, Job
 )
 
 # -----------------------------------------------------------------------------
@@ -15,12 +15,12 @@ class ItemPlanoCompraInline(admin.TabularInline):
 
 class ItemNotaFiscalInline(admin.TabularInline):
     model = ItemNotaFiscal
-    fields = ('material', 'quantidade', 'valor_unitario')
+    fields = ('material', 'quantidade', 'valor_unitario', 'cor', 'grade_numeracao')
     extra = 1
 
 class ItemRecebidoInline(admin.TabularInline):
     model = ItemRecebido
-    fields = ('material', 'quantidade_contada')
+    fields = ('material', 'quantidade_contada', 'cor', 'grade_numeracao')
     extra = 1
 
 # -----------------------------------------------------------------------------
@@ -76,4 +76,10 @@ class InspecaoQualidadeAdmin(admin.ModelAdmin):
 @admin.register(ItemInspecionadoDefeito)
 class ItemInspecionadoDefeitoAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'item_recebido', 'defeito', 'quantidade_defeituosa')
-    list_filter = ('defeito',)
\ No newline at end of file
+    list_filter = ('defeito',)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'status', 'progresso', 'tentativas', 'criado_por', 'created_at', 'concluido_em')
+    list_filter = ('status', 'tipo')
+    readonly_fields = ('worker', 'iniciado_em', 'concluido_em', 'batimento_em')
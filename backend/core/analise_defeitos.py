@@ -0,0 +1,173 @@
+# core/analise_defeitos.py
+"""
+Análise de Pareto dos defeitos.
+
+Cada ItemInspecionadoDefeito só chega ao fornecedor por item_recebido ->
+recebimento -> plano_compra -> fornecedor. Para não repetir esse JOIN a cada
+consulta, FatoDefeito guarda uma linha por defeito apontado com as dimensões
+já resolvidas, gravada pelos signals quando o defeito é registrado (e por
+atualizar_fatos_defeito nos caminhos em lote, que não disparam signals).
+
+Os resultados do Pareto ficam no cache do Django. Em vez de apagar chave por
+chave, todas incluem uma versão que muda a cada defeito novo ou alterado.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from rest_framework import serializers
+
+from .filtros import filtrar_fatos_defeito
+from .models import FatoDefeito, ItemInspecionadoDefeito, ItemRecebido, PlanoCompra, Recebimento
+
+
+CHAVE_VERSAO_PARETO = 'zenite:pareto:versao'
+
+# agrupar -> (campo do id, campos do rótulo)
+DIMENSOES = {
+    'defeito': ('defeito_id', ('defeito__nome',)),
+    'material': ('material_id', ('material__codigo_interno', 'material__descricao')),
+    'fornecedor': ('fornecedor_id', ('fornecedor__nome_fantasia', 'fornecedor__razao_social')),
+}
+MEDIDAS = ('quantidade', 'ocorrencias')
+PARAMETROS = ('agrupar', 'medida', 'top', 'data_inicio', 'data_fim', 'fornecedor', 'material', 'defeito')
+TOP_PADRAO = 10
+
+
+# -----------------------------------------------------------------------------
+# TABELA DE FATOS
+# -----------------------------------------------------------------------------
+def atualizar_fatos_defeito(ids=None, recebimento_ids=None):
+    """
+    Grava (ou corrige) os fatos dos defeitos informados por id ou pelos
+    recebimentos a que pertencem, com uma única consulta. Sem filtros, refaz
+    todos. Devolve o número de linhas gravadas.
+    """
+    filtros = []
+    if ids is not None:
+        ids = list(ids)
+        filtros.append("d.id = ANY(%(ids)s)")
+    if recebimento_ids is not None:
+        recebimento_ids = list(recebimento_ids)
+        filtros.append("r.id = ANY(%(recebimentos)s)")
+    if (ids is not None and not ids) or (recebimento_ids is not None and not recebimento_ids):
+        return 0
+
+    fato = FatoDefeito._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {fato}
+                (item_defeito_id, defeito_id, material_id, fornecedor_id, recebimento_id, data_recebimento, quantidade)
+            SELECT d.id, d.defeito_id, ir.material_id, pl.fornecedor_id, r.id,
+                   (r.data_recebimento AT TIME ZONE %(tz)s)::date, d.quantidade_defeituosa
+            FROM {ItemInspecionadoDefeito._meta.db_table} d
+            JOIN {ItemRecebido._meta.db_table} ir ON ir.id = d.item_recebido_id
+            JOIN {Recebimento._meta.db_table} r ON r.id = ir.recebimento_id
+            JOIN {PlanoCompra._meta.db_table} pl ON pl.id = r.plano_compra_id
+            {'WHERE ' + ' AND '.join(filtros) if filtros else ''}
+            ON CONFLICT (item_defeito_id) DO UPDATE
+            SET defeito_id = EXCLUDED.defeito_id, material_id = EXCLUDED.material_id,
+                fornecedor_id = EXCLUDED.fornecedor_id, recebimento_id = EXCLUDED.recebimento_id,
+                data_recebimento = EXCLUDED.data_recebimento, quantidade = EXCLUDED.quantidade
+        """, {'ids': ids, 'recebimentos': recebimento_ids, 'tz': settings.TIME_ZONE})
+        return cursor.rowcount
+
+
+# -----------------------------------------------------------------------------
+# CACHE
+# -----------------------------------------------------------------------------
+def _nova_versao():
+    cache.set(CHAVE_VERSAO_PARETO, time.time_ns(), None)
+
+
+def invalidar_pareto():
+    """ Descarta os resultados em cache quando a transação atual for confirmada. """
+    transaction.on_commit(_nova_versao)
+
+
+def _chave_cache(params):
+    versao = cache.get_or_set(CHAVE_VERSAO_PARETO, time.time_ns, None)
+    consulta = '&'.join(f'{nome}={params.get(nome) or ""}' for nome in PARAMETROS)
+    return f'zenite:pareto:{versao}:{hashlib.sha1(consulta.encode("utf-8")).hexdigest()}'
+
+
+# -----------------------------------------------------------------------------
+# PARETO
+# -----------------------------------------------------------------------------
+def pareto(params):
+    """
+    Defeitos agrupados por `agrupar` (defeito, material ou fornecedor), em
+    ordem decrescente da `medida` (quantidade ou ocorrências), com percentual e
+    percentual acumulado. Além dos `top` primeiros grupos, o restante é somado
+    em "outros". Aceita os filtros de filtrar_fatos_defeito.
+    """
+    agrupar = params.get('agrupar') or 'defeito'
+    if agrupar not in DIMENSOES:
+        raise serializers.ValidationError({'agrupar': f"Use: {', '.join(DIMENSOES)}."})
+    medida = params.get('medida') or 'quantidade'
+    if medida not in MEDIDAS:
+        raise serializers.ValidationError({'medida': f"Use: {', '.join(MEDIDAS)}."})
+    try:
+        top = int(params.get('top') or TOP_PADRAO)
+    except ValueError:
+        top = 0
+    if top < 1:
+        raise serializers.ValidationError({'top': "Informe um número inteiro maior que zero."})
+
+    queryset = filtrar_fatos_defeito(FatoDefeito.objects.all(), params)
+    chave = _chave_cache(params)
+    resultado = cache.get(chave)
+    if resultado is None:
+        resultado = _calcular(queryset, agrupar, medida, top)
+        cache.set(chave, resultado, getattr(settings, 'PARETO_CACHE_TTL', 300))
+    return resultado
+
+
+def _calcular(queryset, agrupar, medida, top):
+    campo_id, campos_rotulo = DIMENSOES[agrupar]
+    grupos = list(
+        queryset.values(campo_id, *campos_rotulo)
+        .annotate(quantidade=Sum('quantidade'), ocorrencias=Count('pk'))
+        .order_by(f'-{medida}', campo_id)
+    )
+    total = sum(grupo[medida] for grupo in grupos)
+
+    def percentual(valor):
+        return round(float(valor / total * 100), 2) if total else 0.0
+
+    itens = []
+    acumulado = 0
+    for grupo in grupos[:top]:
+        acumulado += grupo[medida]
+        rotulo = ' - '.join(str(grupo[campo]) for campo in campos_rotulo if grupo[campo])
+        itens.append({
+            'id': grupo[campo_id],
+            'rotulo': rotulo,
+            'quantidade': grupo['quantidade'],
+            'ocorrencias': grupo['ocorrencias'],
+            'percentual': percentual(grupo[medida]),
+            'percentual_acumulado': percentual(acumulado),
+        })
+
+    restantes = grupos[top:]
+    outros = None
+    if restantes:
+        valor = sum(grupo[medida] for grupo in restantes)
+        outros = {
+            'grupos': len(restantes),
+            'quantidade': sum(grupo['quantidade'] for grupo in restantes),
+            'ocorrencias': sum(grupo['ocorrencias'] for grupo in restantes),
+            'percentual': percentual(valor),
+            'percentual_acumulado': 100.0,
+        }
+    return {
+        'agrupar': agrupar,
+        'medida': medida,
+        'total_quantidade': sum(grupo['quantidade'] for grupo in grupos),
+        'total_ocorrencias': sum(grupo['ocorrencias'] for grupo in grupos),
+        'itens': itens,
+        'outros': outros,
+    }
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Registra os signals do app (snapshot da conciliação etc.)
+        from . import signals  # noqa: F401
+        # Checks de configuração (cache compartilhado etc.)
+        from . import checks  # noqa: F401
+
+        # Mede as consultas de todas as conexões (ver core/middleware.py)
+        from django.db.backends.signals import connection_created
+        from .instrumentacao import instalar_medicao_sql
+        connection_created.connect(instalar_medicao_sql, dispatch_uid='zenite_medicao_sql')
@@ -0,0 +1,184 @@
+# core/authentication.py
+"""
+Autenticação por token com cache.
+
+O TokenAuthentication do DRF faz um JOIN Token + User a cada requisição. Aqui a
+resolução token -> usuário fica em um LRU local (por processo) com TTL e,
+opcionalmente, também no cache do Django (compartilhado entre processos).
+Excluir o token ou alterar/desativar o usuário remove a entrada na hora
+(ver core/signals.py), mas o signal só roda no processo que fez a alteração:
+
+- Com USAR_CACHE_DJANGO (o padrão), cada entrada tem uma marca no cache
+  compartilhado, conferida a cada acerto do LRU local. A revogação apaga a
+  marca e vale na hora para todos os processos. O check core.E001 recusa um
+  CACHES local de cada processo (LocMemCache), em que a marca não é compartilhada.
+- Sem ele, os demais processos continuam aceitando o token revogado até a
+  entrada expirar: a latência da revogação é limitada pelo TTL.
+"""
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+
+CONFIGURACAO_PADRAO = {
+    'MAX_ENTRADAS': 10000,
+    'TTL': 60,
+    'USAR_CACHE_DJANGO': True,
+}
+
+
+class CacheTokens:
+    """ LRU local com TTL, com segundo nível opcional no cache do Django. """
+
+    prefixo_cache = 'zenite:token:'
+
+    def __init__(self):
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.zerar_estatisticas()
+
+    @property
+    def configuracao(self):
+        return {**CONFIGURACAO_PADRAO, **getattr(settings, 'TOKEN_CACHE', {})}
+
+    def _chave_cache(self, key):
+        # O token em si não vai para o cache compartilhado, apenas o seu hash
+        return self.prefixo_cache + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _chave_marca(self, key):
+        return self._chave_cache(key) + ':marca'
+
+    def obter(self, key):
+        """ Retorna (user, token) se estiver em cache, dentro do TTL e não revogado; senão None. """
+        configuracao = self.configuracao
+        compartilhado = configuracao['USAR_CACHE_DJANGO']
+        local = None
+        with self._lock:
+            item = self._itens.get(key)
+            if item is not None:
+                expira_em, valor, marca = item
+                if expira_em > time.monotonic():
+                    self._itens.move_to_end(key)
+                    local = valor, marca
+                else:
+                    del self._itens[key]
+                    self.expirados += 1
+
+        if local is not None:
+            valor, marca = local
+            # Com o cache compartilhado, a marca diz se o token foi revogado em outro processo
+            if not compartilhado or cache.get(self._chave_marca(key)) == marca:
+                with self._lock:
+                    self.acertos += 1
+                return valor
+            with self._lock:
+                self._itens.pop(key, None)
+                self.revogados += 1
+
+        if compartilhado:
+            chave, chave_marca = self._chave_cache(key), self._chave_marca(key)
+            encontrados = cache.get_many([chave, chave_marca])
+            if chave in encontrados:
+                expira_em, marca, valor = encontrados[chave]
+                # A cópia local herda o tempo restante da entrada compartilhada, sem reiniciar o TTL
+                restante = expira_em - time.time()
+                if restante > 0 and encontrados.get(chave_marca) == marca:
+                    self._guardar_local(key, valor, marca, configuracao, restante)
+                    with self._lock:
+                        self.acertos_cache_django += 1
+                    return valor
+
+        with self._lock:
+            self.falhas += 1
+        return None
+
+    def guardar(self, key, user, token):
+        configuracao = self.configuracao
+        valor = (user, token)
+        marca = uuid.uuid4().hex
+        self._guardar_local(key, valor, marca, configuracao, configuracao['TTL'])
+        if configuracao['USAR_CACHE_DJANGO']:
+            cache.set_many({
+                self._chave_cache(key): (time.time() + configuracao['TTL'], marca, valor),
+                self._chave_marca(key): marca,
+            }, configuracao['TTL'])
+
+    def _guardar_local(self, key, valor, marca, configuracao, ttl):
+        with self._lock:
+            self._itens[key] = (time.monotonic() + ttl, valor, marca)
+            self._itens.move_to_end(key)
+            while len(self._itens) > configuracao['MAX_ENTRADAS']:
+                self._itens.popitem(last=False)
+                self.descartados += 1
+
+    def remover(self, keys):
+        """
+        Remove os tokens informados do LRU local e do cache compartilhado. Sem
+        USAR_CACHE_DJANGO, os outros processos só esquecem o token quando o TTL vence.
+        """
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                self._itens.pop(key, None)
+        if keys and self.configuracao['USAR_CACHE_DJANGO']:
+            cache.delete_many([chave for key in keys for chave in (self._chave_cache(key), self._chave_marca(key))])
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def zerar_estatisticas(self):
+        with self._lock:
+            self.acertos = 0
+            self.acertos_cache_django = 0
+            self.falhas = 0
+            self.expirados = 0
+            self.descartados = 0
+            self.revogados = 0
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.acertos_cache_django + self.falhas
+            return {
+                'entradas': len(self._itens),
+                'acertos': self.acertos,
+                'acertos_cache_django': self.acertos_cache_django,
+                'falhas': self.falhas,
+                'expirados': self.expirados,
+                'descartados': self.descartados,
+                'revogados': self.revogados,
+                'taxa_acerto': round((self.acertos + self.acertos_cache_django) / consultas, 4) if consultas else None,
+            }
+
+
+cache_tokens = CacheTokens()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Substituto direto do TokenAuthentication (mesmo cabeçalho "Token <chave>"),
+    que só vai ao banco quando o token não está em cache.
+    """
+
+    def authenticate_credentials(self, key):
+        valor = cache_tokens.obter(key)
+        if valor is None:
+            user, token = super().authenticate_credentials(key)
+            cache_tokens.guardar(key, user, token)
+        else:
+            user, token = valor
+            if not user.is_active:
+                # Não deveria acontecer (os signals invalidam), mas por segurança vai ao banco.
+                cache_tokens.remover([key])
+                return super().authenticate_credentials(key)
+
+        # Cada requisição recebe a sua própria cópia do usuário, para que atributos
+        # guardados durante a requisição (ex.: cache de grupos) não vazem para outras.
+        return copy.copy(user), token
@@ -0,0 +1,145 @@
+# core/busca.py
+"""
+Busca e autocompletar de materiais e fornecedores.
+
+1. Caminho rápido: prefixo do código interno (ou do CNPJ), respondido pelos
+   índices varchar_pattern_ops, que atendem LIKE 'termo%'.
+2. Se ainda faltarem resultados, similaridade por trigramas (pg_trgm) em
+   código/descrição ou razão social/nome fantasia, atendida pelos índices GIN
+   e ordenada pela similaridade. Termos curtos demais para trigramas ficam só
+   no prefixo.
+
+A busca por trecho usa LOWER(coluna) LIKE '%termo%', atendida pelos índices
+GIN de trigramas sobre LOWER(...) (migração 0014). O icontains do Django vira
+UPPER(coluna) LIKE, que nenhum índice atende, e dentro de um OR obrigaria a
+ler a tabela inteira a cada busca.
+
+Sem a extensão pg_trgm no banco (ver a migração 0010), o passo 2 usa ILIKE,
+sem ranking por similaridade.
+"""
+import re
+
+from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Greatest, Lower
+
+from .models import Fornecedor, Material
+
+
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+MINIMO_TRIGRAMAS = 3
+
+CAMPOS_MATERIAL = ('id', 'codigo_interno', 'descricao', 'unidade_medida')
+CAMPOS_FORNECEDOR = ('id', 'razao_social', 'nome_fantasia', 'cnpj')
+
+_trigramas_por_banco = {}
+
+
+def trigramas_disponiveis():
+    """ Indica (uma vez por processo e banco) se a extensão pg_trgm está instalada. """
+    chave = (connection.alias, connection.settings_dict['NAME'])
+    if chave not in _trigramas_por_banco:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigramas_por_banco[chave] = cursor.fetchone() is not None
+    return _trigramas_por_banco[chave]
+
+
+def _completar(prefixo, similares, limite):
+    """ Junta os resultados do prefixo (relevância 1) com os similares, sem repetir. """
+    resultados = [{**linha, 'relevancia': 1.0} for linha in prefixo]
+    vistos = {linha['id'] for linha in resultados}
+    for linha in similares:
+        if len(resultados) >= limite:
+            break
+        if linha['id'] not in vistos:
+            resultados.append({**linha, 'relevancia': round(linha['relevancia'], 3)})
+    return resultados
+
+
+def buscar_materiais(termo, limite=LIMITE_PADRAO):
+    """ Materiais pelo código interno (prefixo, depois similaridade) ou pela descrição. """
+    termo = termo.strip()
+    if not termo:
+        return []
+
+    # 1. Prefixo do código (o código exato vem primeiro)
+    prefixo = list(
+        Material.objects.filter(Q(codigo_interno__startswith=termo) | Q(codigo_interno__startswith=termo.upper()))
+        .order_by('codigo_interno')
+        .values(*CAMPOS_MATERIAL)[:limite]
+    )
+    prefixo.sort(key=lambda linha: linha['codigo_interno'].upper() != termo.upper())
+    if len(prefixo) >= limite or len(termo) < MINIMO_TRIGRAMAS:
+        return _completar(prefixo, [], limite)
+
+    # 2. Similaridade (ou ILIKE, sem pg_trgm)
+    similares = materiais_similares(termo).values(*CAMPOS_MATERIAL, 'relevancia')[:limite + len(prefixo)]
+    return _completar(prefixo, similares, limite)
+
+
+def materiais_similares(termo):
+    """ Materiais por similaridade de código/descrição ou trecho da descrição, do mais parecido. """
+    if not trigramas_disponiveis():
+        return (
+            Material.objects.filter(Q(codigo_interno__icontains=termo) | Q(descricao__icontains=termo))
+            .annotate(relevancia=Value(0.0, output_field=FloatField()))
+            .order_by('codigo_interno')
+        )
+    return (
+        Material.objects.alias(descricao_minuscula=Lower('descricao'))
+        .filter(
+            Q(codigo_interno__trigram_similar=termo)
+            | Q(descricao__trigram_word_similar=termo)
+            | Q(descricao_minuscula__contains=termo.lower())
+        )
+        .annotate(relevancia=Greatest(
+            TrigramSimilarity('codigo_interno', termo), TrigramWordSimilarity(termo, 'descricao')
+        ))
+        .order_by('-relevancia', 'codigo_interno')
+    )
+
+
+def buscar_fornecedores(termo, limite=LIMITE_PADRAO):
+    """ Fornecedores pelo CNPJ (prefixo, aceita pontuação) ou por razão social / nome fantasia. """
+    termo = termo.strip()
+    if not termo:
+        return []
+
+    # 1. Prefixo do CNPJ
+    digitos = re.sub(r'[.\-/\s]', '', termo)
+    if digitos.isdigit():
+        prefixo = Fornecedor.objects.filter(cnpj__startswith=digitos).order_by('cnpj').values(*CAMPOS_FORNECEDOR)
+        return _completar(prefixo[:limite], [], limite)
+    if len(termo) < MINIMO_TRIGRAMAS:
+        return []
+
+    # 2. Similaridade (ou ILIKE, sem pg_trgm)
+    similares = fornecedores_similares(termo).values(*CAMPOS_FORNECEDOR, 'relevancia')[:limite]
+    return _completar([], similares, limite)
+
+
+def fornecedores_similares(termo):
+    """ Fornecedores por similaridade ou trecho da razão social / nome fantasia, do mais parecido. """
+    if not trigramas_disponiveis():
+        return (
+            Fornecedor.objects.filter(Q(razao_social__icontains=termo) | Q(nome_fantasia__icontains=termo))
+            .annotate(relevancia=Value(0.0, output_field=FloatField()))
+            .order_by('razao_social')
+        )
+    trecho = termo.lower()
+    return (
+        Fornecedor.objects.alias(razao_minuscula=Lower('razao_social'), fantasia_minuscula=Lower('nome_fantasia'))
+        .filter(
+            Q(razao_social__trigram_word_similar=termo)
+            | Q(nome_fantasia__trigram_word_similar=termo)
+            | Q(razao_minuscula__contains=trecho)
+            | Q(fantasia_minuscula__contains=trecho)
+        )
+        .annotate(relevancia=Greatest(
+            TrigramWordSimilarity(termo, 'razao_social'), TrigramWordSimilarity(termo, 'nome_fantasia')
+        ))
+        .order_by('-relevancia', 'razao_social')
+    )
@@ -0,0 +1,197 @@
+# core/catalogo.py
+"""
+Importação do catálogo de materiais exportado pelo ERP (CSV ou JSONL).
+
+O arquivo é lido em streaming e gravado em lotes, cada um em uma transação:
+
+1. as linhas são validadas (código, descrição e unidade de medida entre as
+   UNIDADES_DE_MEDIDA); repetições do mesmo código no lote ficam com a última;
+2. uma consulta traz, para os códigos do lote que já existem, o MD5 do conteúdo
+   (descrição e unidade) calculado no próprio banco, comparado com o da linha:
+   materiais iguais são pulados sem escrita;
+3. os novos e os alterados vão em um único INSERT ... ON CONFLICT
+   (codigo_interno) DO UPDATE (bulk_create com update_conflicts).
+
+Reimportar o mesmo arquivo não grava nada.
+"""
+import csv
+import hashlib
+import io
+import json
+import time
+
+from django.db import transaction
+from django.db.models import TextField, Value
+from django.db.models.functions import MD5, Concat
+
+from .models import Material
+
+
+FORMATOS_CATALOGO = ('csv', 'jsonl')
+COLUNAS = ('codigo_interno', 'descricao', 'unidade_medida')
+UNIDADES = {codigo for codigo, _ in Material.UNIDADES_DE_MEDIDA}
+TAMANHO_LOTE = 2000
+MAX_ERROS = 100
+# Separa os campos no conteúdo comparado, para "ab"+"c" não ser igual a "a"+"bc"
+SEPARADOR = '\x1f'
+
+_max_codigo = Material._meta.get_field('codigo_interno').max_length
+
+
+class ErroCatalogo(Exception):
+    """ Arquivo que não pode ser importado (formato ou colunas). """
+
+
+def formato_do_arquivo(nome, formato=None):
+    """ O formato pedido ou, sem ele, o da extensão do arquivo. """
+    formato = formato or nome.rsplit('.', 1)[-1].lower()
+    if formato not in FORMATOS_CATALOGO:
+        raise ErroCatalogo(f"Formato inválido. Use: {', '.join(FORMATOS_CATALOGO)}.")
+    return formato
+
+
+def hash_conteudo(descricao, unidade_medida):
+    """ O mesmo MD5 que o banco calcula em _hashes_existentes. """
+    return hashlib.md5(f'{descricao}{SEPARADOR}{unidade_medida}'.encode('utf-8')).hexdigest()
+
+
+# -----------------------------------------------------------------------------
+# LEITURA
+# -----------------------------------------------------------------------------
+def ler_linhas(arquivo, formato):
+    """
+    Gera (número da linha, dicionário) do arquivo binário aberto, sem carregá-lo
+    inteiro. Linhas de JSONL que não são objetos geram o texto do erro no lugar do dicionário.
+    """
+    texto = io.TextIOWrapper(getattr(arquivo, 'file', arquivo), encoding='utf-8-sig', newline='')
+    try:
+        if formato == 'csv':
+            cabecalho = texto.readline()
+            # Exportações do ERP em planilha brasileira usam ';'
+            delimitador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+            colunas = [coluna.strip() for coluna in next(csv.reader([cabecalho], delimiter=delimitador), [])]
+            faltando = [coluna for coluna in COLUNAS if coluna not in colunas]
+            if faltando:
+                raise ErroCatalogo(f"Colunas ausentes no CSV: {', '.join(faltando)}.")
+            for numero, valores in enumerate(csv.reader(texto, delimiter=delimitador), start=2):
+                if any(valores):
+                    yield numero, dict(zip(colunas, valores))
+        else:
+            for numero, linha in enumerate(texto, start=1):
+                if not linha.strip():
+                    continue
+                try:
+                    objeto = json.loads(linha)
+                except ValueError as erro:
+                    yield numero, f"JSON inválido: {erro}"
+                    continue
+                yield numero, objeto if isinstance(objeto, dict) else "A linha não é um objeto JSON."
+    finally:
+        # O arquivo continua aberto para quem o passou
+        texto.detach()
+
+
+def validar(dados):
+    """ Devolve (material normalizado, None) ou (None, lista de erros). """
+    if isinstance(dados, str):
+        return None, [dados]
+    material = {coluna: str(dados.get(coluna) or '').strip() for coluna in COLUNAS}
+    erros = []
+    if not material['codigo_interno']:
+        erros.append("codigo_interno é obrigatório.")
+    elif len(material['codigo_interno']) > _max_codigo:
+        erros.append(f"codigo_interno tem mais de {_max_codigo} caracteres.")
+    if not material['descricao']:
+        erros.append("descricao é obrigatória.")
+    if material['unidade_medida'] not in UNIDADES:
+        erros.append(f"unidade_medida inválida: {material['unidade_medida']!r}. Use: {', '.join(sorted(UNIDADES))}.")
+    return (None, erros) if erros else (material, None)
+
+
+# -----------------------------------------------------------------------------
+# GRAVAÇÃO
+# -----------------------------------------------------------------------------
+def _hashes_existentes(codigos):
+    """ {codigo_interno: MD5 do conteúdo} dos códigos já cadastrados, calculado no banco. """
+    return dict(
+        Material.objects.filter(codigo_interno__in=codigos)
+        .annotate(hash=MD5(Concat('descricao', Value(SEPARADOR), 'unidade_medida', output_field=TextField())))
+        .values_list('codigo_interno', 'hash')
+    )
+
+
+def gravar_lote(materiais):
+    """
+    Grava um lote de materiais válidos ({codigo: material}) e devolve
+    (inseridos, atualizados, inalterados).
+    """
+    existentes = _hashes_existentes(list(materiais))
+    gravar, atualizados = [], 0
+    for codigo, material in materiais.items():
+        anterior = existentes.get(codigo)
+        if anterior == hash_conteudo(material['descricao'], material['unidade_medida']):
+            continue
+        atualizados += anterior is not None
+        gravar.append(Material(**material))
+
+    if gravar:
+        with transaction.atomic():
+            Material.objects.bulk_create(
+                gravar, update_conflicts=True, unique_fields=['codigo_interno'],
+                update_fields=['descricao', 'unidade_medida', 'updated_at'],
+            )
+    return len(gravar) - atualizados, atualizados, len(materiais) - len(gravar)
+
+
+def importar_catalogo(arquivo, formato, tamanho_lote=TAMANHO_LOTE):
+    """
+    Importa o catálogo do arquivo binário aberto e gera, a cada lote gravado,
+    {'linhas', 'inseridos', 'atualizados', 'inalterados', 'invalidos', 'erros'}.
+    Cada erro é {'linha', 'codigo_interno', 'erros'}.
+    """
+    materiais, lidas, erros = {}, 0, []
+
+    def concluir():
+        inseridos, atualizados, inalterados = gravar_lote(materiais) if materiais else (0, 0, 0)
+        return {
+            'linhas': lidas, 'inseridos': inseridos, 'atualizados': atualizados,
+            'inalterados': inalterados + lidas - len(erros) - len(materiais), 'invalidos': len(erros), 'erros': erros,
+        }
+
+    for numero, dados in ler_linhas(arquivo, formato):
+        lidas += 1
+        material, problemas = validar(dados)
+        if problemas:
+            codigo = dados.get('codigo_interno') if isinstance(dados, dict) else None
+            erros.append({'linha': numero, 'codigo_interno': codigo, 'erros': problemas})
+        else:
+            # A última ocorrência do código no lote prevalece (linhas repetidas contam como inalteradas)
+            materiais[material['codigo_interno']] = material
+        if lidas >= tamanho_lote:
+            yield concluir()
+            materiais, lidas, erros = {}, 0, []
+    if lidas:
+        yield concluir()
+
+
+class ResumoCatalogo:
+    """ Totais da importação, com linhas/s e os primeiros MAX_ERROS erros. """
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.totais = dict.fromkeys(('linhas', 'inseridos', 'atualizados', 'inalterados', 'invalidos'), 0)
+        self.erros = []
+
+    def registrar(self, lote):
+        for chave in self.totais:
+            self.totais[chave] += lote[chave]
+        self.erros.extend(lote['erros'][:MAX_ERROS - len(self.erros)])
+
+    def como_dict(self):
+        decorrido = max(time.monotonic() - self.inicio, 1e-6)
+        return {
+            **self.totais,
+            'segundos': round(decorrido, 3),
+            'linhas_por_segundo': round(self.totais['linhas'] / decorrido, 1),
+            'erros': self.erros,
+        }
@@ -0,0 +1,48 @@
+# core/checks.py
+"""
+Checks de configuração do app (rodam no runserver, migrate, test e check --deploy).
+
+Os caches que precisam valer para todos os processos do servidor, como a marca
+de revogação dos tokens e os grupos dos usuários, não funcionam com um CACHES
+local de cada processo: a invalidação só chegaria ao processo que a fez.
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+
+def _cache_local_do_processo():
+    return caches['default'].__class__.__name__ == 'LocMemCache'
+
+
+@checks.register(checks.Tags.caches)
+def cache_de_tokens_compartilhado(app_configs, **kwargs):
+    configuracao = getattr(settings, 'TOKEN_CACHE', {})
+    if configuracao.get('USAR_CACHE_DJANGO', True) and _cache_local_do_processo():
+        return [checks.Error(
+            'TOKEN_CACHE usa o cache do Django, mas o CACHES "default" é um LocMemCache: '
+            'a revogação de um token só valeria no processo que a recebeu.',
+            hint='Configure um CACHES compartilhado (REDIS_URL ou CACHE_DIR em config/settings.py).',
+            id='core.E001',
+        )]
+    if not configuracao.get('USAR_CACHE_DJANGO', True):
+        return [checks.Warning(
+            'TOKEN_CACHE sem USAR_CACHE_DJANGO: com mais de um processo, um token revogado '
+            'continua aceito pelos demais por até TTL segundos.',
+            hint='Ative USAR_CACHE_DJANGO ou silencie o aviso se o servidor roda um único processo.',
+            id='core.W001',
+        )]
+    return []
+
+
+@checks.register(checks.Tags.caches)
+def cache_de_grupos_compartilhado(app_configs, **kwargs):
+    if getattr(settings, 'GRUPOS_CACHE_TTL', 300) and _cache_local_do_processo():
+        return [checks.Error(
+            'GRUPOS_CACHE_TTL guarda os grupos no cache do Django, mas o CACHES "default" é um '
+            'LocMemCache: a remoção de um grupo só invalidaria o cache do processo que a recebeu.',
+            hint='Configure um CACHES compartilhado (REDIS_URL ou CACHE_DIR em config/settings.py) '
+                 'ou desligue o cache de grupos com GRUPOS_CACHE_TTL = 0.',
+            id='core.E002',
+        )]
+    return []
@@ -0,0 +1,417 @@
+# core/conciliacao.py
+"""
+Motor de conciliação entre Plano de Compra, Nota Fiscal e Recebimento Físico.
+
+Em vez de montar dicionários em Python item a item, as quantidades de cada
+fonte são somadas no banco com uma única consulta (UNION ALL + GROUP BY por
+material), o que mantém o número de consultas constante independentemente
+do tamanho do recebimento e soma corretamente materiais que aparecem em mais
+de uma linha.
+
+O resultado também pode ser persistido por recebimento (ConciliacaoItem), e
+então mantido de forma incremental pelos signals de core/signals.py.
+
+No nível 'grade', a comparação é por material, cor e numeração, expandindo a
+grade_numeracao dos itens no próprio banco (conciliar_por_grade).
+"""
+import logging
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import ConciliacaoItem, ItemNotaFiscal, ItemPlanoCompra, ItemRecebido, Material, Recebimento
+from .roteamento import escrita_de_manutencao
+
+
+# Quantidade aceita em uma célula da grade_numeracao (o JSON não impede "12 pares" ou "")
+QUANTIDADE_NUMERICA = r'^\s*-?\d+(\.\d+)?\s*$'
+
+# Textos exibidos para cada tipo de divergência (mantidos iguais aos da versão anterior)
+RECEBIDO_A_MAIS = 'Recebido a mais que a NF'
+RECEBIDO_A_MENOS = 'Recebido a menos que a NF'
+NF_DIFERENTE_PLANO = 'NF diferente do Plano de Compra'
+ITEM_FORA_DO_PLANO = 'Item não consta no Plano de Compra'
+
+# Níveis aceitos em ?nivel= na conciliação de um recebimento
+NIVEIS_CONCILIACAO = ('material', 'grade')
+
+logger = logging.getLogger(__name__)
+
+
+def _sql_totais(filtrar_materiais, apenas_divergencias):
+    """ Monta o SQL que agrega plano, NF e recebido por (recebimento, material). """
+    recebimento = Recebimento._meta.db_table
+    item_plano = ItemPlanoCompra._meta.db_table
+    item_nf = ItemNotaFiscal._meta.db_table
+    item_recebido = ItemRecebido._meta.db_table
+    material = Material._meta.db_table
+
+    filtro_material = "AND {alias}.material_id = ANY(%(materiais)s)" if filtrar_materiais else ""
+    filtro_divergencia = (
+        "WHERE NOT (t.qtd_plano = t.qtd_nf AND t.qtd_nf = t.qtd_recebida)"
+        if apenas_divergencias else ""
+    )
+
+    return f"""
+        SELECT t.recebimento_id, m.id, m.codigo_interno, m.descricao,
+               t.qtd_plano, t.qtd_nf, t.qtd_recebida
+        FROM (
+            SELECT u.recebimento_id, u.material_id,
+                   SUM(u.qtd_plano) AS qtd_plano,
+                   SUM(u.qtd_nf) AS qtd_nf,
+                   SUM(u.qtd_recebida) AS qtd_recebida
+            FROM (
+                SELECT r.id AS recebimento_id, ip.material_id,
+                       ip.quantidade_prevista AS qtd_plano, 0 AS qtd_nf, 0 AS qtd_recebida
+                FROM {recebimento} r
+                JOIN {item_plano} ip ON ip.plano_compra_id = r.plano_compra_id
+                WHERE r.id = ANY(%(recebimentos)s) {filtro_material.format(alias='ip')}
+                UNION ALL
+                SELECT r.id, inf.material_id, 0, inf.quantidade, 0
+                FROM {recebimento} r
+                JOIN {item_nf} inf ON inf.nota_fiscal_id = r.nota_fiscal_id
+                WHERE r.id = ANY(%(recebimentos)s) {filtro_material.format(alias='inf')}
+                UNION ALL
+                SELECT ir.recebimento_id, ir.material_id, 0, 0, ir.quantidade_contada
+                FROM {item_recebido} ir
+                WHERE ir.recebimento_id = ANY(%(recebimentos)s) {filtro_material.format(alias='ir')}
+            ) u
+            GROUP BY u.recebimento_id, u.material_id
+        ) t
+        JOIN {material} m ON m.id = t.material_id
+        {filtro_divergencia}
+        ORDER BY t.recebimento_id, m.codigo_interno
+    """
+
+
+def totais_por_material(recebimento_ids, material_ids=None, apenas_divergencias=False):
+    """
+    Retorna as quantidades somadas de plano, NF e recebido para cada par
+    (recebimento, material), em uma única consulta.
+
+    Cada linha é uma tupla:
+    (recebimento_id, material_id, codigo_interno, descricao, qtd_plano, qtd_nf, qtd_recebida)
+    """
+    recebimento_ids = list(recebimento_ids)
+    if not recebimento_ids:
+        return []
+
+    parametros = {'recebimentos': recebimento_ids}
+    if material_ids is not None:
+        parametros['materiais'] = list(material_ids)
+
+    sql = _sql_totais(material_ids is not None, apenas_divergencias)
+    # Leitura como as do ORM: na réplica da requisição, se houver (core/roteamento.py)
+    with connections[router.db_for_read(Recebimento)].cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
+
+
+def classificar_divergencia(qtd_plano, qtd_nf, qtd_recebida):
+    """ Retorna a lista de tipos de divergência para as quantidades informadas. """
+    tipos = []
+    if qtd_recebida > qtd_nf:
+        tipos.append(RECEBIDO_A_MAIS)
+    elif qtd_recebida < qtd_nf:
+        tipos.append(RECEBIDO_A_MENOS)
+
+    if qtd_nf != qtd_plano:
+        tipos.append(NF_DIFERENTE_PLANO)
+
+    if qtd_recebida > 0 and qtd_plano == 0:
+        tipos.append(ITEM_FORA_DO_PLANO)
+    return tipos
+
+
+def montar_divergencia(codigo, descricao, qtd_plano, qtd_nf, qtd_recebida):
+    """
+    Monta o dicionário de divergência no formato devolvido pela API.
+
+    Quantidades zeradas (a fonte que não tem o material) saem como o inteiro 0,
+    como na conciliação original, e não como Decimal('0.00').
+    """
+    return {
+        'material_codigo': codigo,
+        'material_descricao': descricao,
+        'qtd_plano': qtd_plano or 0,
+        'qtd_nf': qtd_nf or 0,
+        'qtd_recebida': qtd_recebida or 0,
+        'tipo_divergencia': classificar_divergencia(qtd_plano, qtd_nf, qtd_recebida),
+    }
+
+
+def conciliar_recebimentos(recebimento_ids):
+    """
+    Concilia vários recebimentos de uma vez.
+
+    Retorna um dicionário {recebimento_id: [divergências]} contendo apenas os
+    recebimentos que possuem alguma divergência.
+    """
+    resultado = {}
+    for recebimento_id, _, codigo, descricao, qtd_plano, qtd_nf, qtd_recebida in totais_por_material(
+        recebimento_ids, apenas_divergencias=True
+    ):
+        resultado.setdefault(recebimento_id, []).append(
+            montar_divergencia(codigo, descricao, qtd_plano, qtd_nf, qtd_recebida)
+        )
+    return resultado
+
+
+def conciliar_recebimento(recebimento_id):
+    """ Concilia um único recebimento e retorna a lista de divergências. """
+    return conciliar_recebimentos([recebimento_id]).get(recebimento_id, [])
+
+
+# -----------------------------------------------------------------------------
+# CONCILIAÇÃO POR GRADE (material, cor e numeração)
+# -----------------------------------------------------------------------------
+def _sql_totais_grade(filtrar_numeracao, apenas_divergencias):
+    """
+    Monta o SQL que agrega plano, NF e recebido por (recebimento, material, cor,
+    numeração). Cada item é expandido em uma linha por numeração da grade com
+    jsonb_each_text; itens sem grade entram inteiros, com numeração NULL.
+
+    Uma fonte sem o detalhe não pode ser comparada célula a célula: se algum
+    item do material não tem cor, o material é comparado sem cor, e se algum
+    item do material/cor não tem grade (ou tem uma célula não numérica, ex.:
+    "12 pares"), ele é comparado pelo total dos itens, sem numeração.
+    """
+    recebimento = Recebimento._meta.db_table
+    item_plano = ItemPlanoCompra._meta.db_table
+    item_nf = ItemNotaFiscal._meta.db_table
+    item_recebido = ItemRecebido._meta.db_table
+    material = Material._meta.db_table
+
+    # Com ?numeracao=, só interessam os materiais com a numeração na grade de alguma
+    # fonte (operador ?, atendido pelos índices GIN de grade_numeracao). Todos os
+    # itens desses materiais continuam entrando, para decidir o nível de comparação;
+    # a célula é filtrada só no final.
+    candidatos, filtro_material, filtro_celula = "", "", ""
+    if filtrar_numeracao:
+        candidatos = f"""
+        candidatos AS (
+            SELECT ip.material_id
+            FROM {recebimento} r
+            JOIN {item_plano} ip ON ip.plano_compra_id = r.plano_compra_id
+            WHERE r.id = ANY(%(recebimentos)s) AND ip.grade_numeracao ? %(numeracao)s
+            UNION
+            SELECT inf.material_id
+            FROM {recebimento} r
+            JOIN {item_nf} inf ON inf.nota_fiscal_id = r.nota_fiscal_id
+            WHERE r.id = ANY(%(recebimentos)s) AND inf.grade_numeracao ? %(numeracao)s
+            UNION
+            SELECT ir.material_id
+            FROM {item_recebido} ir
+            WHERE ir.recebimento_id = ANY(%(recebimentos)s) AND ir.grade_numeracao ? %(numeracao)s
+        ),"""
+        filtro_material = "AND {alias}.material_id IN (SELECT material_id FROM candidatos)"
+        filtro_celula = "WHERE g.numeracao = %(numeracao)s"
+    filtro_divergencia = (
+        "WHERE NOT (t.qtd_plano = t.qtd_nf AND t.qtd_nf = t.qtd_recebida)"
+        if apenas_divergencias else ""
+    )
+
+    return f"""
+        WITH {candidatos}
+        itens AS (
+            SELECT r.id AS recebimento_id, ip.material_id, ip.cor, ip.grade_numeracao AS grade,
+                   ip.quantidade_prevista AS quantidade, 0 AS fonte
+            FROM {recebimento} r
+            JOIN {item_plano} ip ON ip.plano_compra_id = r.plano_compra_id
+            WHERE r.id = ANY(%(recebimentos)s) {filtro_material.format(alias='ip')}
+            UNION ALL
+            SELECT r.id, inf.material_id, inf.cor, inf.grade_numeracao, inf.quantidade, 1
+            FROM {recebimento} r
+            JOIN {item_nf} inf ON inf.nota_fiscal_id = r.nota_fiscal_id
+            WHERE r.id = ANY(%(recebimentos)s) {filtro_material.format(alias='inf')}
+            UNION ALL
+            SELECT ir.recebimento_id, ir.material_id, ir.cor, ir.grade_numeracao, ir.quantidade_contada, 2
+            FROM {item_recebido} ir
+            WHERE ir.recebimento_id = ANY(%(recebimentos)s) {filtro_material.format(alias='ir')}
+        ),
+        validados AS (
+            -- Só conta como grade um objeto não vazio com todas as quantidades numéricas
+            SELECT i.recebimento_id, i.material_id, COALESCE(i.cor, '') AS cor, i.quantidade, i.fonte,
+                   CASE WHEN jsonb_typeof(i.grade) = 'object' AND i.grade <> '{{}}'::jsonb AND NOT EXISTS (
+                            SELECT 1 FROM jsonb_each_text(i.grade) AS e(numeracao, quantidade)
+                            WHERE e.quantidade IS NULL OR e.quantidade !~ %(numerico)s
+                        ) THEN i.grade END AS grade
+            FROM itens i
+        ),
+        por_cor AS (
+            SELECT v.recebimento_id, v.material_id, v.quantidade, v.fonte, v.grade,
+                   CASE WHEN BOOL_AND(v.cor <> '') OVER (PARTITION BY v.recebimento_id, v.material_id)
+                        THEN v.cor ELSE '' END AS cor
+            FROM validados v
+        ),
+        niveis AS (
+            SELECT p.recebimento_id, p.material_id, p.cor, p.quantidade, p.fonte,
+                   CASE WHEN BOOL_AND(p.grade IS NOT NULL) OVER (PARTITION BY p.recebimento_id, p.material_id, p.cor)
+                        THEN p.grade END AS grade
+            FROM por_cor p
+        ),
+        celulas AS (
+            SELECT n.recebimento_id, n.material_id, n.cor, g.numeracao, n.fonte,
+                   CASE WHEN g.numeracao IS NULL THEN n.quantidade ELSE g.quantidade::numeric END AS quantidade
+            FROM niveis n
+            LEFT JOIN LATERAL jsonb_each_text(n.grade) AS g(numeracao, quantidade) ON TRUE
+            {filtro_celula}
+        )
+        SELECT t.recebimento_id, m.id, m.codigo_interno, m.descricao, t.cor, t.numeracao,
+               t.qtd_plano, t.qtd_nf, t.qtd_recebida
+        FROM (
+            SELECT c.recebimento_id, c.material_id, c.cor, c.numeracao,
+                   SUM(CASE WHEN c.fonte = 0 THEN c.quantidade ELSE 0 END)::numeric(12, 2) AS qtd_plano,
+                   SUM(CASE WHEN c.fonte = 1 THEN c.quantidade ELSE 0 END)::numeric(12, 2) AS qtd_nf,
+                   SUM(CASE WHEN c.fonte = 2 THEN c.quantidade ELSE 0 END)::numeric(12, 2) AS qtd_recebida
+            FROM celulas c
+            GROUP BY c.recebimento_id, c.material_id, c.cor, c.numeracao
+        ) t
+        JOIN {material} m ON m.id = t.material_id
+        {filtro_divergencia}
+        ORDER BY t.recebimento_id, m.codigo_interno, t.cor, t.numeracao NULLS FIRST
+    """
+
+
+def totais_por_grade(recebimento_ids, numeracao=None, apenas_divergencias=False):
+    """
+    Retorna as quantidades de plano, NF e recebido de cada célula da grade
+    (recebimento, material, cor, numeração), em uma única consulta.
+
+    Cada linha é uma tupla:
+    (recebimento_id, material_id, codigo_interno, descricao, cor, numeracao, qtd_plano, qtd_nf, qtd_recebida)
+    """
+    recebimento_ids = list(recebimento_ids)
+    if not recebimento_ids:
+        return []
+
+    parametros = {'recebimentos': recebimento_ids, 'numeracao': numeracao, 'numerico': QUANTIDADE_NUMERICA}
+    sql = _sql_totais_grade(numeracao is not None, apenas_divergencias)
+    with connections[router.db_for_read(Recebimento)].cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
+
+
+def conciliar_por_grade(recebimento_id, numeracao=None):
+    """
+    Divergências de um recebimento por material, cor e numeração: encontra uma
+    grade trocada mesmo quando o total do material confere. Quantidades sem
+    grade aparecem com numeração None, e um material/cor sem grade (ou sem cor)
+    em alguma das fontes é comparado pelo total (ver _sql_totais_grade).
+    """
+    return [
+        {**montar_divergencia(codigo, descricao, qtd_plano, qtd_nf, qtd_recebida), 'cor': cor, 'numeracao': numero}
+        for _, _, codigo, descricao, cor, numero, qtd_plano, qtd_nf, qtd_recebida
+        in totais_por_grade([recebimento_id], numeracao, apenas_divergencias=True)
+    ]
+
+
+# -----------------------------------------------------------------------------
+# SNAPSHOT PERSISTIDO
+# -----------------------------------------------------------------------------
+def materializar_snapshot(recebimento_ids, material_ids=None):
+    """
+    Recalcula e grava o snapshot da conciliação dos recebimentos informados.
+
+    Com `material_ids`, apenas as linhas desses materiais são recalculadas
+    (atualização incremental), e somente recebimentos cujo snapshot já está
+    materializado são tocados. Sem `material_ids`, o snapshot inteiro é
+    reconstruído e o recebimento passa a ser considerado materializado.
+
+    Retorna quantas linhas do snapshot gravado estavam diferentes do cálculo atual.
+    """
+    recebimento_ids = set(recebimento_ids)
+    if material_ids is not None:
+        material_ids = set(material_ids)
+        recebimento_ids = set(
+            Recebimento.objects.filter(id__in=recebimento_ids, conciliacao_atualizada_em__isnull=False)
+            .values_list('id', flat=True)
+        )
+    if not recebimento_ids or material_ids == set():
+        return 0
+
+    with transaction.atomic():
+        # 1. Calcula os totais atuais e lê o que está gravado
+        calculado = {
+            (recebimento_id, material_id): (qtd_plano, qtd_nf, qtd_recebida)
+            for recebimento_id, material_id, _, _, qtd_plano, qtd_nf, qtd_recebida
+            in totais_por_material(recebimento_ids, material_ids)
+        }
+        gravados = ConciliacaoItem.objects.filter(recebimento_id__in=recebimento_ids)
+        if material_ids is not None:
+            gravados = gravados.filter(material_id__in=material_ids)
+        gravado = {
+            (recebimento_id, material_id): (pk, (qtd_plano, qtd_nf, qtd_recebida))
+            for pk, recebimento_id, material_id, qtd_plano, qtd_nf, qtd_recebida
+            in gravados.values_list('pk', 'recebimento_id', 'material_id', 'qtd_plano', 'qtd_nf', 'qtd_recebida')
+        }
+
+        # 2. Insere/atualiza apenas as linhas que mudaram e remove as que sumiram
+        alterados = [
+            ConciliacaoItem(
+                recebimento_id=chave[0], material_id=chave[1],
+                qtd_plano=qtds[0], qtd_nf=qtds[1], qtd_recebida=qtds[2],
+                divergente=not (qtds[0] == qtds[1] == qtds[2]),
+            )
+            for chave, qtds in calculado.items()
+            if chave not in gravado or gravado[chave][1] != qtds
+        ]
+        removidos = [pk for chave, (pk, _) in gravado.items() if chave not in calculado]
+
+        if alterados:
+            ConciliacaoItem.objects.bulk_create(
+                alterados,
+                update_conflicts=True,
+                unique_fields=['recebimento', 'material'],
+                update_fields=['qtd_plano', 'qtd_nf', 'qtd_recebida', 'divergente', 'atualizado_em'],
+            )
+        if removidos:
+            ConciliacaoItem.objects.filter(pk__in=removidos).delete()
+        if material_ids is None:
+            Recebimento.objects.filter(id__in=recebimento_ids).update(conciliacao_atualizada_em=timezone.now())
+
+    return len(alterados) + len(removidos)
+
+
+def ler_snapshot(recebimento_id):
+    """ Lê as divergências gravadas no snapshot, no mesmo formato de conciliar_recebimento. """
+    linhas = (
+        ConciliacaoItem.objects.filter(recebimento_id=recebimento_id, divergente=True)
+        .order_by('material__codigo_interno')
+        .values_list('material__codigo_interno', 'material__descricao', 'qtd_plano', 'qtd_nf', 'qtd_recebida')
+    )
+    return [montar_divergencia(*linha) for linha in linhas]
+
+
+def conciliar_com_snapshot(recebimento, fresh=False):
+    """
+    Conciliação de um recebimento pelo snapshot, recalculando-o se for pedido
+    (`fresh`) ou se ele ainda não existe. Devolve (divergências, recalculado, drift):
+    drift é quantas linhas do snapshot estavam desatualizadas.
+    """
+    materializado = recebimento.conciliacao_atualizada_em is not None
+    recalculado = fresh or not materializado
+    drift = 0
+    if recalculado:
+        # Mantém o snapshot, não é uma escrita do usuário: as próximas leituras dele podem ir à réplica
+        with escrita_de_manutencao():
+            linhas_alteradas = materializar_snapshot([recebimento.pk])
+        # Só há "drift" se o snapshot já existia antes deste recálculo
+        drift = linhas_alteradas if materializado else 0
+        if drift:
+            logger.warning(
+                "Snapshot da conciliação do recebimento %s estava desatualizado (%s linha(s)).",
+                recebimento.pk, drift
+            )
+    return ler_snapshot(recebimento.pk), recalculado, drift
+
+
+def conciliar_no_nivel(recebimento, fresh=False, nivel='material', numeracao=None):
+    """
+    Conciliação de um recebimento no nível pedido, com o mesmo retorno de
+    conciliar_com_snapshot. A grade não tem snapshot: é sempre recalculada.
+    """
+    if nivel == 'grade':
+        return conciliar_por_grade(recebimento.pk, numeracao), True, 0
+    return conciliar_com_snapshot(recebimento, fresh)
+
@@ -0,0 +1,130 @@
+# core/conciliacao_lote.py
+"""
+Conciliação em lote para o fechamento do mês.
+
+Os recebimentos são divididos em lotes de ids, cada lote é conciliado com uma
+única consulta (ver core/conciliacao.py) e os lotes podem ser distribuídos
+entre vários processos, cada um com sua própria conexão ao banco. As
+divergências são gravadas à medida que os lotes terminam, em JSONL ou CSV.
+"""
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+from .conciliacao import conciliar_recebimentos
+from .processos import inicializar_worker
+
+
+FORMATOS = ('jsonl', 'csv')
+
+COLUNAS_CSV = [
+    'recebimento_id', 'material_codigo', 'material_descricao',
+    'qtd_plano', 'qtd_nf', 'qtd_recebida', 'tipo_divergencia',
+]
+
+
+def dividir_em_lotes(ids, tamanho_lote):
+    """ Divide a lista (ordenada) de ids em lotes de no máximo `tamanho_lote` elementos. """
+    return [ids[i:i + tamanho_lote] for i in range(0, len(ids), tamanho_lote)]
+
+
+def conciliar_lote(recebimento_ids):
+    """ Concilia um lote e devolve as divergências já achatadas em linhas. """
+    linhas = []
+    for recebimento_id, divergencias in conciliar_recebimentos(recebimento_ids).items():
+        for divergencia in divergencias:
+            linhas.append({'recebimento_id': recebimento_id, **divergencia})
+    return linhas
+
+
+def executar_em_lotes(lotes, workers=1):
+    """
+    Executa a conciliação dos lotes e gera tuplas (indice_lote, ids, linhas)
+    na ordem em que os lotes terminam.
+
+    Com `workers` <= 1 tudo roda no processo atual, o que é útil em testes e em
+    volumes pequenos.
+    """
+    if workers <= 1:
+        for indice, ids in enumerate(lotes):
+            yield indice, ids, conciliar_lote(ids)
+        return
+
+    # A conexão do processo pai não pode ser compartilhada com os filhos.
+    connections.close_all()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=inicializar_worker)
+    try:
+        futuros = {executor.submit(conciliar_lote, ids): (indice, ids) for indice, ids in enumerate(lotes)}
+        for futuro in as_completed(futuros):
+            indice, ids = futuros[futuro]
+            yield indice, ids, futuro.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def formatar_linhas(linhas, formato, incluir_cabecalho=False):
+    """ Converte as linhas de divergência para texto JSONL ou CSV. """
+    if formato == 'jsonl':
+        return ''.join(json.dumps(linha, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for linha in linhas)
+
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=COLUNAS_CSV)
+    if incluir_cabecalho:
+        escritor.writeheader()
+    for linha in linhas:
+        escritor.writerow({**linha, 'tipo_divergencia': '; '.join(linha['tipo_divergencia'])})
+    return buffer.getvalue()
+
+
+class CheckpointLote:
+    """
+    Guarda, ao lado do arquivo de saída, quais lotes já foram concluídos e quantos
+    bytes da saída correspondem a eles. Ao retomar, a saída é truncada nesse ponto,
+    descartando qualquer escrita parcial de um lote que não chegou ao fim.
+    """
+
+    def __init__(self, caminho_saida, parametros):
+        self.caminho = f"{caminho_saida}.checkpoint.json"
+        self.parametros = parametros
+        self.lotes_concluidos = []
+        self.bytes_escritos = 0
+
+    def carregar(self):
+        """ Lê o checkpoint existente. Retorna False se não houver nada a retomar. """
+        if not os.path.exists(self.caminho):
+            return False
+        with open(self.caminho, encoding='utf-8') as arquivo:
+            dados = json.load(arquivo)
+        if dados.get('parametros') != self.parametros:
+            raise ValueError(
+                "O checkpoint existente foi gerado com outros filtros ou outro formato; "
+                "rode novamente sem retomar."
+            )
+        self.lotes_concluidos = dados.get('lotes_concluidos', [])
+        self.bytes_escritos = dados.get('bytes_escritos', 0)
+        return True
+
+    def ja_concluido(self, recebimento_id):
+        return any(inicio <= recebimento_id <= fim for inicio, fim in self.lotes_concluidos)
+
+    def registrar(self, ids, bytes_escritos):
+        """ Registra um lote concluído de forma atômica (escreve e renomeia). """
+        self.lotes_concluidos.append([ids[0], ids[-1]])
+        self.bytes_escritos = bytes_escritos
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump({
+                'parametros': self.parametros,
+                'lotes_concluidos': self.lotes_concluidos,
+                'bytes_escritos': self.bytes_escritos,
+            }, arquivo)
+        os.replace(temporario, self.caminho)
+
+    def remover(self):
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
@@ -0,0 +1,148 @@
+# core/condicional.py
+"""
+GET condicional (ETag e Last-Modified) nas views de detalhe e listagem.
+
+A versão de uma resposta é o maior updated_at e a quantidade de linhas do
+objeto e de tudo o que o serializer aninha (itens, plano, NF, defeitos e os
+materiais exibidos). Ambos vêm de uma única consulta agregada sobre um UNION
+ALL das tabelas envolvidas: uma alteração muda o maior updated_at e uma
+exclusão muda a contagem. Se o cliente já tem a versão atual (If-None-Match
+ou If-Modified-Since), a resposta é 304, sem carregar nem serializar o objeto.
+"""
+import hashlib
+
+from django.db import connections
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import (
+    Defeito, InspecaoQualidade, ItemInspecionadoDefeito, ItemNotaFiscal, ItemPlanoCompra, ItemRecebido,
+    Material, NotaFiscal, PlanoCompra, Recebimento
+)
+
+
+# -----------------------------------------------------------------------------
+# DEPENDÊNCIAS DE CADA REPRESENTAÇÃO: (modelo, lookup do modelo até o objeto da view)
+# -----------------------------------------------------------------------------
+DEPENDENCIAS_PLANO = [
+    (ItemPlanoCompra, 'plano_compra'),
+    (Material, 'itemplanocompra__plano_compra'),
+]
+
+DEPENDENCIAS_NOTA_FISCAL = [
+    (ItemNotaFiscal, 'nota_fiscal'),
+    (Material, 'itemnotafiscal__nota_fiscal'),
+]
+
+
+def dependencias_recebimento(sufixo=''):
+    """ Dependências do RecebimentoSerializer; `sufixo` leva do recebimento ao objeto da view. """
+    return [
+        (PlanoCompra, f'recebimento{sufixo}'),
+        (ItemPlanoCompra, f'plano_compra__recebimento{sufixo}'),
+        (Material, f'itemplanocompra__plano_compra__recebimento{sufixo}'),
+        (NotaFiscal, f'recebimento{sufixo}'),
+        (ItemNotaFiscal, f'nota_fiscal__recebimento{sufixo}'),
+        (Material, f'itemnotafiscal__nota_fiscal__recebimento{sufixo}'),
+        (ItemRecebido, f'recebimento{sufixo}'),
+        (Material, f'itemrecebido__recebimento{sufixo}'),
+        (ItemInspecionadoDefeito, f'item_recebido__recebimento{sufixo}'),
+        (Defeito, f'iteminspecionadodefeito__item_recebido__recebimento{sufixo}'),
+        (InspecaoQualidade, f'recebimento{sufixo}'),
+    ]
+
+
+DEPENDENCIAS_RECEBIMENTO = dependencias_recebimento()
+DEPENDENCIAS_INSPECAO = [(Recebimento, 'inspecao'), *dependencias_recebimento('__inspecao')]
+
+
+def versao(queryset, dependencias=()):
+    """
+    Devolve (maior updated_at, quantidade de linhas) do queryset e das dependências,
+    em uma única consulta, no mesmo banco (primário ou réplica) que o queryset lê.
+    """
+    partes = [queryset.order_by().values('updated_at')]
+    ids = queryset.order_by().values('pk')
+    for modelo, lookup in dependencias:
+        partes.append(modelo.objects.filter(**{f'{lookup}__in': ids}).order_by().values('updated_at'))
+
+    consultas, parametros = [], []
+    for parte in partes:
+        sql, params = parte.query.sql_with_params()
+        consultas.append(f'({sql})')
+        parametros.extend(params)
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"SELECT MAX(u.updated_at), COUNT(*) FROM ({' UNION ALL '.join(consultas)}) u", parametros)
+        return cursor.fetchone()
+
+
+class RespostaCondicionalMixin:
+    """
+    Acrescenta ETag e Last-Modified ao retrieve (e ao list, com `etag_na_listagem`)
+    e responde 304 quando a versão do cliente é a atual.
+
+    `dependencias_etag` lista os modelos aninhados pelo serializer, como
+    (modelo, lookup até o objeto da view). Só use `etag_na_listagem` em
+    listagens baratas de versionar por inteiro (sem itens aninhados).
+    """
+    dependencias_etag = ()
+    etag_na_listagem = False
+
+    def retrieve(self, request, *args, **kwargs):
+        campo = self.lookup_url_kwarg or self.lookup_field
+        try:
+            # get_queryset, e não o manager do modelo: a versão respeita as restrições de linha da view
+            queryset = self.get_queryset().prefetch_related(None).filter(**{self.lookup_field: self.kwargs[campo]})
+            atualizado_em, total = versao(queryset, self.dependencias_etag)
+        except (ValueError, TypeError):
+            # Identificador inválido: o retrieve normal devolve o 404
+            return super().retrieve(request, *args, **kwargs)
+        return self._responder_condicional(request, atualizado_em, total, super().retrieve, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if not self.etag_na_listagem:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        atualizado_em, total = versao(queryset, self.dependencias_etag)
+        return self._responder_condicional(request, atualizado_em, total, super().list, *args, **kwargs)
+
+    def _responder_condicional(self, request, atualizado_em, total, responder, *args, **kwargs):
+        if atualizado_em is None:
+            # Nada encontrado: sem versão para comparar
+            return responder(request, *args, **kwargs)
+        etag, ultima_modificacao, atualizado = self._validadores(request, atualizado_em, total)
+        if atualizado:
+            resposta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            resposta = responder(request, *args, **kwargs)
+        return self._marcar_validadores(resposta, etag, ultima_modificacao)
+
+    def _validadores(self, request, atualizado_em, total):
+        """ Devolve (ETag, Last-Modified, se o cliente já tem esta versão). """
+        # A mesma versão pode ter representações diferentes (query string, formato)
+        variante = f'{atualizado_em.isoformat()}|{total}|{request.get_full_path()}|{request.accepted_media_type}'
+        etag = f'"{hashlib.sha1(variante.encode("utf-8")).hexdigest()}"'
+        return etag, http_date(atualizado_em.timestamp()), self._cliente_atualizado(request, etag, atualizado_em)
+
+    @staticmethod
+    def _marcar_validadores(resposta, etag, ultima_modificacao):
+        if resposta.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            resposta['ETag'] = etag
+            resposta['Last-Modified'] = ultima_modificacao
+            # O navegador guarda a resposta e revalida a cada uso, enviando If-None-Match
+            # sozinho: as páginas do frontend recebem o 304 como 200, sem mudanças no código.
+            patch_cache_control(resposta, private=True, no_cache=True)
+            patch_vary_headers(resposta, ['Authorization'])
+        return resposta
+
+    @staticmethod
+    def _cliente_atualizado(request, etag, atualizado_em):
+        """ If-None-Match tem precedência; If-Modified-Since só vale sem ele (RFC 9110). """
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags or etag in (valor.removeprefix('W/') for valor in etags)
+        desde = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return desde is not None and int(atualizado_em.timestamp()) <= desde
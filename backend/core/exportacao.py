@@ -0,0 +1,305 @@
+# core/exportacao.py
+"""
+Exportação em streaming (CSV ou XLSX) de recebimentos, notas fiscais e planos
+de compra, com uma linha por item.
+
+As linhas são lidas com cursores do lado do servidor (.iterator(chunk_size=...))
+e convertidas em blocos de bytes à medida que o StreamingHttpResponse as envia,
+então a memória usada não depende do tamanho da exportação. O XLSX é montado
+aqui mesmo, com um ZIP gravado em sequência e células de texto "inlineStr",
+sem precisar guardar a planilha inteira; a cada 1.048.575 linhas (o limite do
+Excel) uma nova aba é aberta.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import chain, islice
+from xml.sax.saxutils import escape
+
+from django.db.models import OuterRef, Subquery
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .conciliacao import classificar_divergencia, totais_por_material
+from .models import ItemNotaFiscal, ItemPlanoCompra, ItemRecebido, ProgressoPlanoMaterial
+
+
+FORMATOS_EXPORTACAO = ('csv', 'xlsx')
+TAMANHO_CURSOR = 2000
+LINHAS_POR_BLOCO = 1000
+LINHAS_POR_PLANILHA = 1048575  # 1.048.576 linhas do Excel, menos o cabeçalho
+
+TIPOS_CONTEUDO = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _valor(valor):
+    """ Datas e horas saem no fuso local, em ISO 8601; os demais valores não mudam. """
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat(timespec='seconds') if timezone.is_aware(valor) else valor.isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+
+# -----------------------------------------------------------------------------
+# LINHAS DE CADA EXPORTAÇÃO
+# -----------------------------------------------------------------------------
+def exportar_recebimentos(queryset, conciliacao=False):
+    """
+    Uma linha por item recebido dos recebimentos do queryset. Com `conciliacao`,
+    acrescenta as quantidades somadas de plano, NF e recebido do material no
+    recebimento e o tipo de divergência (calculados com uma consulta por bloco).
+    """
+    colunas = [
+        'recebimento_id', 'data_recebimento', 'plano_compra', 'nota_fiscal', 'fornecedor_cnpj',
+        'fornecedor', 'conferente', 'material_codigo', 'material_descricao', 'quantidade_contada',
+    ]
+    if conciliacao:
+        colunas += ['qtd_plano', 'qtd_nf', 'qtd_recebida', 'tipo_divergencia']
+
+    itens = (
+        ItemRecebido.objects.filter(recebimento__in=queryset.order_by().values('pk'))
+        .order_by('recebimento_id', 'id')
+        .values_list(
+            'recebimento_id', 'recebimento__data_recebimento', 'recebimento__plano_compra__codigo_plano',
+            'recebimento__nota_fiscal__numero', 'recebimento__plano_compra__fornecedor__cnpj',
+            'recebimento__plano_compra__fornecedor__razao_social', 'recebimento__conferente__username',
+            'material__codigo_interno', 'material__descricao', 'quantidade_contada', 'material_id',
+        )
+        .iterator(chunk_size=TAMANHO_CURSOR)
+    )
+
+    def linhas():
+        while True:
+            bloco = list(islice(itens, LINHAS_POR_BLOCO))
+            if not bloco:
+                return
+            totais = {}
+            if conciliacao:
+                totais = {
+                    (recebimento_id, material_id): (qtd_plano, qtd_nf, qtd_recebida)
+                    for recebimento_id, material_id, _, _, qtd_plano, qtd_nf, qtd_recebida
+                    in totais_por_material({linha[0] for linha in bloco})
+                }
+            for *linha, material_id in bloco:
+                linha = [_valor(valor) for valor in linha]
+                if conciliacao:
+                    qtds = totais.get((linha[0], material_id), (None, None, None))
+                    tipos = classificar_divergencia(*qtds) if None not in qtds else []
+                    linha += [*qtds, '; '.join(tipos)]
+                yield linha
+
+    return colunas, linhas()
+
+
+def exportar_notas_fiscais(queryset):
+    """ Uma linha por item das notas fiscais do queryset. """
+    colunas = [
+        'nota_fiscal_id', 'numero', 'data_emissao', 'fornecedor_cnpj', 'fornecedor', 'valor_total',
+        'material_codigo', 'material_descricao', 'quantidade', 'valor_unitario',
+    ]
+    itens = (
+        ItemNotaFiscal.objects.filter(nota_fiscal__in=queryset.order_by().values('pk'))
+        .order_by('nota_fiscal_id', 'id')
+        .values_list(
+            'nota_fiscal_id', 'nota_fiscal__numero', 'nota_fiscal__data_emissao', 'nota_fiscal__fornecedor__cnpj',
+            'nota_fiscal__fornecedor__razao_social', 'nota_fiscal__valor_total',
+            'material__codigo_interno', 'material__descricao', 'quantidade', 'valor_unitario',
+        )
+        .iterator(chunk_size=TAMANHO_CURSOR)
+    )
+    return colunas, ([_valor(valor) for valor in linha] for linha in itens)
+
+
+def exportar_planos_compra(queryset, conciliacao=False):
+    """
+    Uma linha por item dos planos do queryset. Com `conciliacao`, acrescenta o
+    total já recebido do material no plano (ProgressoPlanoMaterial) e o saldo.
+    """
+    colunas = [
+        'plano_compra_id', 'codigo_plano', 'status', 'data_emissao', 'data_prevista_entrega',
+        'fornecedor_cnpj', 'fornecedor', 'material_codigo', 'material_descricao',
+        'quantidade_prevista', 'preco_unitario',
+    ]
+    campos = [
+        'plano_compra_id', 'plano_compra__codigo_plano', 'plano_compra__status', 'plano_compra__data_emissao',
+        'plano_compra__data_prevista_entrega', 'plano_compra__fornecedor__cnpj',
+        'plano_compra__fornecedor__razao_social', 'material__codigo_interno', 'material__descricao',
+        'quantidade_prevista', 'preco_unitario',
+    ]
+    itens = ItemPlanoCompra.objects.filter(plano_compra__in=queryset.order_by().values('pk'))
+    if conciliacao:
+        colunas += ['qtd_recebida', 'saldo']
+        campos.append('qtd_recebida')
+        itens = itens.annotate(qtd_recebida=Subquery(
+            ProgressoPlanoMaterial.objects.filter(
+                plano_compra_id=OuterRef('plano_compra_id'), material_id=OuterRef('material_id')
+            ).values('quantidade_recebida')[:1]
+        ))
+    itens = itens.order_by('plano_compra_id', 'id').values_list(*campos).iterator(chunk_size=TAMANHO_CURSOR)
+
+    def linhas():
+        for linha in itens:
+            linha = [_valor(valor) for valor in linha]
+            if conciliacao:
+                linha[-1] = linha[-1] or Decimal(0)
+                linha.append(linha[-3] - linha[-1])
+            yield linha
+
+    return colunas, linhas()
+
+
+# -----------------------------------------------------------------------------
+# CSV
+# -----------------------------------------------------------------------------
+def gerar_csv(colunas, linhas):
+    """ Gera o CSV em blocos de bytes. O BOM inicial faz o Excel reconhecer o UTF-8. """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write('\ufeff')
+    escritor.writerow(colunas)
+    for numero, linha in enumerate(linhas, start=1):
+        escritor.writerow(linha)
+        if numero % LINHAS_POR_BLOCO == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+# -----------------------------------------------------------------------------
+# XLSX
+# -----------------------------------------------------------------------------
+_CARACTERES_INVALIDOS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_INICIO_PLANILHA = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_FIM_PLANILHA = b'</sheetData></worksheet>'
+
+
+class _SaidaSequencial:
+    """ Destino do ZIP sem seek: acumula o que foi escrito até ser esvaziado. """
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.partes)
+        self.partes.clear()
+        return dados
+
+
+def _celula(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_CARACTERES_INVALIDOS.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _linha_xlsx(valores):
+    return ('<row>' + ''.join(_celula(valor) for valor in valores) + '</row>').encode('utf-8')
+
+
+def _arquivos_do_pacote(planilhas):
+    """ Arquivos do XLSX além das abas: workbook, relacionamentos e tipos de conteúdo. """
+    abas = ''.join(
+        f'<sheet name="Dados{f" {numero}" if numero > 1 else ""}" sheetId="{numero}" r:id="rId{numero}"/>'
+        for numero in range(1, planilhas + 1)
+    )
+    relacoes = ''.join(
+        f'<Relationship Id="rId{numero}" '
+        f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{numero}.xml"/>'
+        for numero in range(1, planilhas + 1)
+    )
+    tipos = ''.join(
+        f'<Override PartName="/xl/worksheets/sheet{numero}.xml" '
+        f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for numero in range(1, planilhas + 1)
+    )
+    cabecalho = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    return {
+        'xl/workbook.xml': (
+            f'{cabecalho}<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets>{abas}</sheets></workbook>'
+        ),
+        'xl/_rels/workbook.xml.rels': (
+            f'{cabecalho}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{relacoes}</Relationships>'
+        ),
+        '_rels/.rels': (
+            f'{cabecalho}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" '
+            f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            f'Target="xl/workbook.xml"/></Relationships>'
+        ),
+        '[Content_Types].xml': (
+            f'{cabecalho}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            f'<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            f'{tipos}</Types>'
+        ),
+    }
+
+
+def gerar_xlsx(colunas, linhas):
+    """ Gera o XLSX em blocos de bytes, abrindo uma nova aba a cada LINHAS_POR_PLANILHA linhas. """
+    saida = _SaidaSequencial()
+    linhas = iter(linhas)
+    planilhas = 0
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED) as pacote:
+        while True:
+            # A primeira aba sempre existe; as seguintes só se ainda houver linhas
+            primeira = next(linhas, None)
+            if primeira is None and planilhas:
+                break
+            planilhas += 1
+            restantes = islice(chain([primeira], linhas) if primeira is not None else (), LINHAS_POR_PLANILHA)
+            with pacote.open(f'xl/worksheets/sheet{planilhas}.xml', 'w', force_zip64=True) as planilha:
+                planilha.write(_INICIO_PLANILHA + _linha_xlsx(colunas))
+                bloco = []
+                for linha in restantes:
+                    bloco.append(_linha_xlsx(linha))
+                    if len(bloco) == LINHAS_POR_BLOCO:
+                        planilha.write(b''.join(bloco))
+                        bloco.clear()
+                        yield saida.esvaziar()
+                planilha.write(b''.join(bloco) + _FIM_PLANILHA)
+            yield saida.esvaziar()
+
+        for nome, conteudo in _arquivos_do_pacote(planilhas).items():
+            pacote.writestr(nome, conteudo)
+    yield saida.esvaziar()
+
+
+# -----------------------------------------------------------------------------
+# RESPOSTA
+# -----------------------------------------------------------------------------
+def resposta_exportacao(nome, formato, colunas, linhas):
+    """ StreamingHttpResponse com o arquivo `nome`.`formato` (csv ou xlsx). """
+    gerador = gerar_xlsx if formato == 'xlsx' else gerar_csv
+    resposta = StreamingHttpResponse(gerador(colunas, linhas), content_type=TIPOS_CONTEUDO[formato])
+    resposta['Content-Disposition'] = f'attachment; filename="{nome}.{formato}"'
+    return resposta
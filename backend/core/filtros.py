@@ -0,0 +1,129 @@
+# core/filtros.py
+"""
+Filtros reutilizados pelas listagens da API, pelos comandos de gerenciamento
+e pelos processamentos em lote.
+
+Cada função recebe um queryset e um dicionário de parâmetros (por exemplo,
+``request.query_params`` ou as opções de um comando) e devolve o queryset filtrado.
+"""
+from django.utils.dateparse import parse_date
+from rest_framework import serializers
+
+
+def _ler_data(params, nome):
+    """ Lê uma data no formato AAAA-MM-DD, levantando ValidationError se for inválida. """
+    valor = params.get(nome)
+    if not valor:
+        return None
+    try:
+        data = parse_date(str(valor))
+    except ValueError:
+        data = None
+    if data is None:
+        raise serializers.ValidationError({nome: f"Data inválida '{valor}'. Use o formato AAAA-MM-DD."})
+    return data
+
+
+def _ler_inteiro(params, nome):
+    """ Lê um identificador inteiro, levantando ValidationError se for inválido. """
+    valor = params.get(nome)
+    if valor in (None, ''):
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise serializers.ValidationError({nome: f"Valor inválido '{valor}'. Informe um número inteiro."})
+
+
+def ler_periodo(params):
+    """ Lê data_inicio e data_fim (ambas opcionais), validando que o início não é posterior ao fim. """
+    data_inicio = _ler_data(params, 'data_inicio')
+    data_fim = _ler_data(params, 'data_fim')
+    if data_inicio and data_fim and data_inicio > data_fim:
+        raise serializers.ValidationError({'data_inicio': "A data inicial é posterior à data final."})
+    return data_inicio, data_fim
+
+
+def filtrar_recebimentos(queryset, params):
+    """
+    Filtros aceitos:
+    - fornecedor: id do fornecedor do plano de compra
+    - data_inicio / data_fim: intervalo (inclusivo) da data do recebimento
+    - status_plano: status do plano de compra vinculado
+    """
+    fornecedor = _ler_inteiro(params, 'fornecedor')
+    data_inicio = _ler_data(params, 'data_inicio')
+    data_fim = _ler_data(params, 'data_fim')
+    status_plano = params.get('status_plano')
+
+    if fornecedor is not None:
+        queryset = queryset.filter(plano_compra__fornecedor_id=fornecedor)
+    if data_inicio:
+        queryset = queryset.filter(data_recebimento__date__gte=data_inicio)
+    if data_fim:
+        queryset = queryset.filter(data_recebimento__date__lte=data_fim)
+    if status_plano:
+        queryset = queryset.filter(plano_compra__status=status_plano)
+    return queryset
+
+
+def filtrar_notas_fiscais(queryset, params):
+    """
+    Filtros aceitos:
+    - fornecedor: id do fornecedor da nota
+    - data_inicio / data_fim: intervalo (inclusivo) da data de emissão
+    - numero: número da nota
+    """
+    fornecedor = _ler_inteiro(params, 'fornecedor')
+    data_inicio, data_fim = ler_periodo(params)
+    numero = params.get('numero')
+
+    if fornecedor is not None:
+        queryset = queryset.filter(fornecedor_id=fornecedor)
+    if data_inicio:
+        queryset = queryset.filter(data_emissao__gte=data_inicio)
+    if data_fim:
+        queryset = queryset.filter(data_emissao__lte=data_fim)
+    if numero:
+        queryset = queryset.filter(numero=numero)
+    return queryset
+
+
+def filtrar_planos_compra(queryset, params):
+    """
+    Filtros aceitos:
+    - fornecedor: id do fornecedor do plano
+    - data_inicio / data_fim: intervalo (inclusivo) da data de emissão
+    - status: status do plano
+    """
+    fornecedor = _ler_inteiro(params, 'fornecedor')
+    data_inicio, data_fim = ler_periodo(params)
+    status = params.get('status')
+
+    if fornecedor is not None:
+        queryset = queryset.filter(fornecedor_id=fornecedor)
+    if data_inicio:
+        queryset = queryset.filter(data_emissao__gte=data_inicio)
+    if data_fim:
+        queryset = queryset.filter(data_emissao__lte=data_fim)
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset
+
+
+def filtrar_fatos_defeito(queryset, params):
+    """
+    Filtros aceitos (sobre FatoDefeito):
+    - data_inicio / data_fim: intervalo (inclusivo) da data do recebimento
+    - fornecedor, material, defeito: ids
+    """
+    data_inicio, data_fim = ler_periodo(params)
+    if data_inicio:
+        queryset = queryset.filter(data_recebimento__gte=data_inicio)
+    if data_fim:
+        queryset = queryset.filter(data_recebimento__lte=data_fim)
+    for nome in ('fornecedor', 'material', 'defeito'):
+        valor = _ler_inteiro(params, nome)
+        if valor is not None:
+            queryset = queryset.filter(**{f'{nome}_id': valor})
+    return queryset
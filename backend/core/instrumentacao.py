@@ -0,0 +1,183 @@
+# core/instrumentacao.py
+"""
+Medições por requisição: consultas SQL, tempo de banco, tempo de serialização
+e tempo total da view (ver core/middleware.py).
+
+O estado da requisição atual fica em uma ContextVar, então as medições
+funcionam tanto em threads (WSGI) quanto em views assíncronas. Os tempos de
+cada rota ficam em uma janela em memória, por processo, usada para os
+percentis p50/p95/p99 expostos em /api/metricas/.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+CONFIGURACAO_PADRAO = {
+    'REQUISICAO_LENTA_MS': 500,
+    'CONSULTA_LENTA_MS': 100,
+    'JANELA_PERCENTIS': 1000,
+    'MAX_CONSULTAS_LENTAS': 20,
+}
+
+
+def configuracao():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'INSTRUMENTACAO', {})}
+
+
+class Medicao:
+    """ Contadores de uma requisição. """
+
+    __slots__ = ('consultas', 'tempo_db', 'tempo_serializacao', 'profundidade', 'consultas_lentas', 'lock')
+
+    def __init__(self):
+        # As views assíncronas fazem consultas em paralelo, em threads diferentes
+        self.lock = threading.Lock()
+        self.consultas = 0
+        self.tempo_db = 0.0
+        self.tempo_serializacao = 0.0
+        self.profundidade = 0
+        self.consultas_lentas = []
+
+
+_medicao_atual = ContextVar('zenite_medicao', default=None)
+
+
+def iniciar_medicao():
+    medicao = Medicao()
+    return medicao, _medicao_atual.set(medicao)
+
+
+def encerrar_medicao(token):
+    _medicao_atual.reset(token)
+
+
+def medir_sql(execute, sql, params, many, context):
+    """ Wrapper de connection.execute_wrapper que acumula consultas e tempo de banco. """
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracao = time.perf_counter() - inicio
+        limites = configuracao()
+        with medicao.lock:
+            medicao.consultas += 1
+            medicao.tempo_db += duracao
+            if duracao * 1000 >= limites['CONSULTA_LENTA_MS'] and len(medicao.consultas_lentas) < limites['MAX_CONSULTAS_LENTAS']:
+                medicao.consultas_lentas.append({
+                    'fingerprint': fingerprint_sql(sql),
+                    'sql': normalizar_sql(sql)[:500],
+                    'ms': round(duracao * 1000, 2),
+                })
+
+
+def instalar_medicao_sql(sender, connection, **kwargs):
+    """
+    Receiver de connection_created: toda conexão, de qualquer thread, passa
+    por medir_sql (que não faz nada fora de uma requisição medida).
+    """
+    if medir_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_sql)
+
+
+@contextmanager
+def cronometrar_serializacao():
+    """
+    Soma o tempo do bloco ao tempo de serialização da requisição. Serializers
+    aninhados não são contados de novo: só vale o bloco mais externo.
+    """
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        yield
+        return
+    medicao.profundidade += 1
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao.profundidade -= 1
+        if medicao.profundidade == 0:
+            medicao.tempo_serializacao += time.perf_counter() - inicio
+
+
+# -----------------------------------------------------------------------------
+# FINGERPRINT DE SQL
+# -----------------------------------------------------------------------------
+_LITERAIS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    # IN (?, ?, ?) com qualquer quantidade de elementos vira IN (...)
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalizar_sql(sql):
+    """ Troca literais e parâmetros por "?" e junta listas de IN, para agrupar consultas iguais. """
+    for padrao, substituto in _LITERAIS:
+        sql = padrao.sub(substituto, sql)
+    return sql.strip()
+
+
+def fingerprint_sql(sql):
+    return hashlib.sha1(normalizar_sql(sql).encode('utf-8')).hexdigest()[:12]
+
+
+# -----------------------------------------------------------------------------
+# PERCENTIS POR ROTA
+# -----------------------------------------------------------------------------
+class AgregadoRotas:
+    """ Últimas N durações de cada rota, em memória (por processo). """
+
+    def __init__(self):
+        self._rotas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, rota, duracao_ms, consultas):
+        tamanho = configuracao()['JANELA_PERCENTIS']
+        with self._lock:
+            dados = self._rotas.get(rota)
+            if dados is None:
+                dados = self._rotas[rota] = {'duracoes': deque(maxlen=tamanho), 'total': 0, 'consultas': 0}
+            dados['duracoes'].append(duracao_ms)
+            dados['total'] += 1
+            dados['consultas'] += consultas
+
+    def limpar(self):
+        with self._lock:
+            self._rotas.clear()
+
+    @staticmethod
+    def _percentil(ordenadas, percentil):
+        # Método nearest-rank
+        posicao = max(0, min(len(ordenadas) - 1, -(-len(ordenadas) * percentil // 100) - 1))
+        return round(ordenadas[posicao], 2)
+
+    def resumo(self):
+        with self._lock:
+            copia = {rota: (list(dados['duracoes']), dados['total'], dados['consultas']) for rota, dados in self._rotas.items()}
+        resumo = {}
+        for rota, (duracoes, total, consultas) in sorted(copia.items()):
+            ordenadas = sorted(duracoes)
+            resumo[rota] = {
+                'requisicoes': total,
+                'consultas_media': round(consultas / total, 1),
+                'p50_ms': self._percentil(ordenadas, 50),
+                'p95_ms': self._percentil(ordenadas, 95),
+                'p99_ms': self._percentil(ordenadas, 99),
+                'max_ms': round(ordenadas[-1], 2),
+            }
+        return resumo
+
+
+agregado_rotas = AgregadoRotas()
@@ -0,0 +1,385 @@
+# core/jobs.py
+"""
+Fila de tarefas em segundo plano, no próprio PostgreSQL (sem broker externo).
+
+Cada tarefa é uma linha de Job. Os workers (manage.py zenite_worker) reservam
+o próximo job pendente com SELECT ... FOR UPDATE SKIP LOCKED, então vários
+processos consomem a mesma fila sem pegar o mesmo job e sem esperar uns pelos
+outros. Durante a execução:
+
+1. uma thread do worker renova `batimento_em`; um job em execução sem sinal
+   há mais de JOBS['EXPIRACAO'] segundos (worker encerrado à força) volta para
+   a fila;
+2. a tarefa informa o progresso (0 a 100) e uma mensagem, lidos pela API em
+   /api/jobs/<id>/;
+3. uma falha agenda nova tentativa com espera exponencial (com jitter), até
+   `max_tentativas`; ErroPermanente falha o job de imediato.
+
+As tarefas são registradas com @tarefa('nome') e recebem (parametros, progresso).
+"""
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import InterfaceError, OperationalError, connection, connections, transaction
+from django.utils import timezone
+
+from .analise_defeitos import atualizar_fatos_defeito, invalidar_pareto
+from .catalogo import ErroCatalogo, ResumoCatalogo, importar_catalogo
+from .conciliacao import conciliar_no_nivel
+from .models import Job, Recebimento
+from .nfe import importar_xmls
+from .nfe_lote import ResumoImportacao, importar_arquivos
+from .scorecard import atualizar_scorecard
+
+logger = logging.getLogger(__name__)
+
+PADROES = {
+    'INTERVALO': 1.0,
+    'BATIMENTO': 10,
+    'EXPIRACAO': 60,
+    'MAX_TENTATIVAS': 3,
+    'ESPERA_BASE': 5,
+    'ESPERA_MAXIMA': 600,
+}
+
+TAREFAS = {}
+
+
+def configuracao(chave):
+    return getattr(settings, 'JOBS', {}).get(chave, PADROES[chave])
+
+
+class ErroPermanente(Exception):
+    """ Falha que não se resolve tentando de novo (ex.: arquivo inválido). """
+
+
+def tarefa(nome):
+    """ Registra a função como a tarefa `nome`. """
+    def registrar(funcao):
+        TAREFAS[nome] = funcao
+        return funcao
+    return registrar
+
+
+# -----------------------------------------------------------------------------
+# FILA
+# -----------------------------------------------------------------------------
+def enfileirar(tipo, parametros=None, usuario=None, unico=False, max_tentativas=None):
+    """
+    Cria um job pendente. Com `unico`, devolve o job do mesmo tipo e parâmetros
+    que ainda estiver pendente ou em execução, em vez de criar outro.
+    """
+    if tipo not in TAREFAS:
+        raise ValueError(f"Tarefa desconhecida: {tipo}")
+    parametros = parametros or {}
+    if unico:
+        existente = (
+            Job.objects.filter(tipo=tipo, parametros=parametros, status__in=[Job.PENDENTE, Job.EXECUTANDO])
+            .order_by('id').first()
+        )
+        if existente is not None:
+            return existente
+    return Job.objects.create(
+        tipo=tipo, parametros=parametros, criado_por=usuario if usuario and usuario.is_authenticated else None,
+        max_tentativas=max_tentativas or configuracao('MAX_TENTATIVAS'),
+    )
+
+
+def espera_nova_tentativa(tentativa):
+    """ Segundos até a próxima tentativa: ESPERA_BASE * 2^(tentativa-1), limitado e com jitter. """
+    espera = min(configuracao('ESPERA_BASE') * 2 ** (tentativa - 1), configuracao('ESPERA_MAXIMA'))
+    # O jitter evita que jobs que falharam juntos voltem todos no mesmo instante
+    return espera * random.uniform(0.5, 1.0)
+
+
+def recuperar_expirados():
+    """ Devolve à fila (ou falha, sem tentativas restantes) os jobs cujo worker parou de dar sinal. """
+    agora = timezone.now()
+    limite = agora - timedelta(seconds=configuracao('EXPIRACAO'))
+    recuperados = 0
+    with transaction.atomic():
+        expirados = Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.EXECUTANDO, batimento_em__lt=limite
+        )
+        for job in expirados:
+            logger.warning("Job %s sem sinal do worker %s desde %s.", job.pk, job.worker, job.batimento_em)
+            job.worker = ''
+            if job.tentativas >= job.max_tentativas:
+                job.status, job.concluido_em = Job.FALHOU, agora
+                job.erro = "O worker parou de responder e não há mais tentativas."
+            else:
+                job.status, job.executar_apos = Job.PENDENTE, agora
+            job.save(update_fields=['status', 'worker', 'erro', 'executar_apos', 'concluido_em', 'updated_at'])
+            recuperados += 1
+    return recuperados
+
+
+def reservar(worker):
+    """ Reserva o próximo job pendente para `worker`, ou devolve None se a fila estiver vazia. """
+    agora = timezone.now()
+    with transaction.atomic():
+        # Jobs já travados por outro worker são pulados, sem esperar a transação dele
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.PENDENTE, executar_apos__lte=agora)
+            .order_by('executar_apos', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.EXECUTANDO
+        job.tentativas += 1
+        job.worker = worker
+        job.iniciado_em = job.batimento_em = agora
+        job.save(update_fields=['status', 'tentativas', 'worker', 'iniciado_em', 'batimento_em', 'updated_at'])
+    return job
+
+
+# -----------------------------------------------------------------------------
+# EXECUÇÃO
+# -----------------------------------------------------------------------------
+class Progresso:
+    """
+    Passado às tarefas: progresso(percentual, mensagem). Grava no máximo uma vez
+    por segundo (e sempre ao chegar a 100%).
+    """
+    def __init__(self, job):
+        self.job = job
+        self.gravado_em = 0.0
+
+    def __call__(self, percentual, mensagem=''):
+        percentual = min(max(int(percentual), 0), 100)
+        agora = time.monotonic()
+        if percentual < 100 and agora - self.gravado_em < 1:
+            return
+        self.gravado_em = agora
+        Job.objects.filter(pk=self.job.pk).update(
+            progresso=percentual, mensagem=mensagem[:255], batimento_em=timezone.now(), updated_at=timezone.now()
+        )
+
+
+class Batimento(threading.Thread):
+    """ Renova `batimento_em` do job a cada JOBS['BATIMENTO'] segundos enquanto ele executa. """
+
+    def __init__(self, job):
+        super().__init__(name=f'batimento-job-{job.pk}', daemon=True)
+        self.job = job
+        self.parar = threading.Event()
+
+    def run(self):
+        try:
+            while not self.parar.wait(configuracao('BATIMENTO')):
+                Job.objects.filter(pk=self.job.pk, status=Job.EXECUTANDO, worker=self.job.worker).update(
+                    batimento_em=timezone.now()
+                )
+        finally:
+            connection.close()
+
+
+def executar(job):
+    """ Executa um job já reservado e grava o resultado, a falha ou a próxima tentativa. """
+    funcao = TAREFAS.get(job.tipo)
+    batimento = Batimento(job)
+    batimento.start()
+    inicio = time.monotonic()
+    try:
+        if funcao is None:
+            raise ErroPermanente(f"Tarefa desconhecida: {job.tipo}")
+        resultado = funcao(job.parametros, Progresso(job))
+    except Exception as erro:
+        if connection.errors_occurred and not connection.is_usable():
+            # Ex.: o banco reiniciou durante a tarefa
+            connection.close()
+        _registrar_falha(job, erro)
+    else:
+        agora = timezone.now()
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.CONCLUIDO, progresso=100, resultado=resultado, erro='',
+            concluido_em=agora, updated_at=agora,
+        )
+        logger.info("Job %s (%s) concluído em %.2fs.", job.pk, job.tipo, time.monotonic() - inicio)
+    finally:
+        batimento.parar.set()
+        batimento.join()
+
+
+def _registrar_falha(job, erro):
+    agora = timezone.now()
+    detalhe = ''.join(traceback.format_exception(erro))
+    if isinstance(erro, ErroPermanente) or job.tentativas >= job.max_tentativas:
+        logger.error("Job %s (%s) falhou na tentativa %s: %s", job.pk, job.tipo, job.tentativas, erro)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.FALHOU, erro=str(erro) or detalhe, mensagem='', concluido_em=agora, updated_at=agora
+        )
+        return
+    espera = espera_nova_tentativa(job.tentativas)
+    logger.warning(
+        "Job %s (%s) falhou na tentativa %s; nova tentativa em %.0fs.\n%s", job.pk, job.tipo, job.tentativas, espera, detalhe
+    )
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.PENDENTE, erro=str(erro), worker='', executar_apos=agora + timedelta(seconds=espera), updated_at=agora
+    )
+
+
+def processar_fila(worker, parar=None, uma_vez=False):
+    """
+    Executa jobs até `parar` ser sinalizado (ou, com `uma_vez`, até a fila de
+    jobs prontos esvaziar). Devolve quantos jobs foram executados.
+    """
+    parar = parar or threading.Event()
+    executados = 0
+    while not parar.is_set():
+        try:
+            recuperar_expirados()
+            job = reservar(worker)
+        except (InterfaceError, OperationalError):
+            logger.exception("Worker %s não conseguiu consultar a fila; reconectando.", worker)
+            connection.close()
+            parar.wait(configuracao('INTERVALO'))
+            continue
+        if job is None:
+            if uma_vez:
+                break
+            parar.wait(configuracao('INTERVALO'))
+            continue
+        executar(job)
+        executados += 1
+    return executados
+
+
+def nome_do_worker(indice=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{indice}'
+
+
+def executar_worker(indice, uma_vez=False):
+    """ Ponto de entrada de cada processo do zenite_worker. """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    # A conexão herdada do processo pai não pode ser compartilhada
+    connections.close_all()
+
+    parar = threading.Event()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        # Termina o job atual e sai
+        signal.signal(sinal, lambda *_: parar.set())
+    try:
+        return processar_fila(nome_do_worker(indice), parar, uma_vez)
+    finally:
+        connections.close_all()
+
+
+# -----------------------------------------------------------------------------
+# ARQUIVOS ENVIADOS PARA AS TAREFAS
+# -----------------------------------------------------------------------------
+def guardar_envios(arquivos):
+    """ Guarda os arquivos enviados no storage, para o worker, e devolve os caminhos. """
+    pasta = f'jobs/{uuid.uuid4().hex}'
+    return [default_storage.save(f'{pasta}/{os.path.basename(arquivo.name)}', arquivo) for arquivo in arquivos]
+
+
+def remover_envios(caminhos):
+    for caminho in caminhos:
+        default_storage.delete(caminho)
+
+
+# -----------------------------------------------------------------------------
+# TAREFAS
+# -----------------------------------------------------------------------------
+@tarefa('conciliacao')
+def conciliar(parametros, progresso):
+    """ Conciliação de um recebimento (o mesmo de /api/recebimentos/<id>/conciliar/). """
+    recebimento_id = parametros['recebimento_id']
+    recebimento = Recebimento.objects.only('id', 'conciliacao_atualizada_em').filter(pk=recebimento_id).first()
+    if recebimento is None:
+        raise ErroPermanente(f"Recebimento com ID {recebimento_id} não encontrado.")
+    divergencias, recalculado, drift = conciliar_no_nivel(
+        recebimento, parametros.get('fresh', False), parametros.get('nivel', 'material'), parametros.get('numeracao')
+    )
+    return {'origem': 'recalculado' if recalculado else 'snapshot', 'drift': drift, 'divergencias': divergencias}
+
+
+@tarefa('importacao_xml')
+def importar_xml(parametros, progresso):
+    """ XMLs de NF-e enviados a /api/notas-fiscais/importar-xml/. """
+    caminhos = parametros['arquivos']
+    arquivos = [default_storage.open(caminho) for caminho in caminhos]
+    try:
+        resultados = importar_xmls(arquivos)
+    finally:
+        for arquivo in arquivos:
+            arquivo.close()
+    remover_envios(caminhos)
+    return resultados
+
+
+@tarefa('importacao_lote')
+def importar_lote(parametros, progresso):
+    """
+    ZIP de NF-e enviado a /api/notas-fiscais/importar-lote/. Lido no próprio
+    processo: um pool de processos aqui faria fork com a thread de batimento viva.
+    """
+    caminho = parametros['arquivo']
+    resumo = ResumoImportacao()
+    arquivos = []
+    with default_storage.open(caminho) as arquivo:
+        try:
+            with zipfile.ZipFile(arquivo) as arquivo_zip:
+                total = sum(1 for nome in arquivo_zip.namelist() if nome.lower().endswith('.xml'))
+            arquivo.seek(0)
+            for resultados in importar_arquivos(arquivo):
+                resumo.registrar(resultados)
+                arquivos.extend(resultados)
+                progresso(100 * len(arquivos) // max(total, 1), f"{len(arquivos)} de {total} arquivo(s)")
+        except zipfile.BadZipFile:
+            remover_envios([caminho])
+            raise ErroPermanente('O arquivo enviado não é um ZIP válido.')
+    remover_envios([caminho])
+    return {'resumo': resumo.como_dict(), 'arquivos': arquivos}
+
+
+@tarefa('importacao_materiais')
+def importar_materiais(parametros, progresso):
+    """ Catálogo de materiais enviado a /api/materiais/importar/. """
+    caminho = parametros['arquivo']
+    tamanho = max(default_storage.size(caminho), 1)
+    resumo = ResumoCatalogo()
+    with default_storage.open(caminho) as arquivo:
+        try:
+            for lote in importar_catalogo(arquivo, parametros['formato']):
+                resumo.registrar(lote)
+                # Posição aproximada: o leitor de texto lê o arquivo à frente, em blocos
+                progresso(100 * arquivo.tell() // tamanho, f"{resumo.totais['linhas']} linha(s)")
+        except (ErroCatalogo, UnicodeDecodeError) as erro:
+            remover_envios([caminho])
+            raise ErroPermanente(str(erro))
+    remover_envios([caminho])
+    return resumo.como_dict()
+
+
+@tarefa('scorecard')
+def scorecard(parametros, progresso):
+    """ Atualização do scorecard dos fornecedores (comando atualizar_scorecard). """
+    return {'recalculados': atualizar_scorecard(completo=parametros.get('completo', False))}
+
+
+@tarefa('fatos_defeito')
+def fatos_defeito(parametros, progresso):
+    """ Reconstrução dos fatos de defeito (comando reconstruir_fatos_defeito). """
+    with transaction.atomic():
+        gravados = atualizar_fatos_defeito(recebimento_ids=parametros.get('recebimentos'))
+        invalidar_pareto()
+    return {'gravados': gravados}
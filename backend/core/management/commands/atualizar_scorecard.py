@@ -0,0 +1,34 @@
+# core/management/commands/atualizar_scorecard.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import enfileirar
+from core.scorecard import atualizar_scorecard, marca_scorecard
+
+
+class Command(BaseCommand):
+    help = (
+        "Atualiza o scorecard diário dos fornecedores, recalculando apenas os dias com "
+        "recebimentos alterados desde a última execução. Agende (ex.: a cada 15 minutos)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help="Recalcula o scorecard inteiro (ex.: após alterações feitas direto no banco).")
+        parser.add_argument('--em-segundo-plano', action='store_true',
+                            help="Apenas enfileira a atualização, para o zenite_worker.")
+
+    def handle(self, *args, **options):
+        if options['em_segundo_plano']:
+            job = enfileirar('scorecard', {'completo': options['completo']}, unico=True)
+            self.stdout.write(self.style.SUCCESS(f"Atualização enfileirada no job {job.pk}."))
+            return
+        marca_anterior = marca_scorecard()
+        inicio = time.monotonic()
+        recalculados = atualizar_scorecard(completo=options['completo'])
+        modo = 'completo' if options['completo'] or marca_anterior is None else f"desde {marca_anterior:%d/%m/%Y %H:%M:%S}"
+        self.stdout.write(self.style.SUCCESS(
+            f"Scorecard atualizado ({modo}) em {time.monotonic() - inicio:.2f}s: "
+            f"{recalculados} par(es) fornecedor/dia recalculado(s)."
+        ))
@@ -0,0 +1,96 @@
+# core/management/commands/bench_recebimento.py
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from core.models import Fornecedor, ItemRecebido, Material, NotaFiscal, PlanoCompra, Recebimento
+from core.serializers import RecebimentoSerializer
+
+
+class Reverter(Exception):
+    """ Usada para desfazer todos os dados criados pelo benchmark. """
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a criação de um recebimento linha a linha (caminho antigo) com o "
+        "RecebimentoSerializer.create em lote. Nada é gravado: tudo é desfeito no final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=10000, help="Linhas por recebimento (padrão: 10000).")
+        parser.add_argument('--materiais', type=int, default=2000, help="Materiais distintos (padrão: 2000).")
+        parser.add_argument('--repeticoes', type=int, default=3, help="Execuções de cada caminho (padrão: 3).")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._executar(options)
+                raise Reverter()
+        except Reverter:
+            pass
+
+    def _executar(self, options):
+        # 1. Dados de apoio (desfeitos ao final)
+        usuario = User.objects.create_user(username='__bench_recebimento__')
+        fornecedor = Fornecedor.objects.create(razao_social='Benchmark', cnpj='99999999999999')
+        materiais = Material.objects.bulk_create([
+            Material(codigo_interno=f'__BENCH-{n}', descricao=f'Material {n}', unidade_medida='par')
+            for n in range(options['materiais'])
+        ])
+        plano = PlanoCompra.objects.create(
+            codigo_plano='__BENCH', fornecedor=fornecedor, data_emissao='2025-01-01',
+            data_prevista_entrega='2025-01-31', usuario_criador=usuario,
+        )
+        nota = NotaFiscal.objects.create(numero='__BENCH', fornecedor=fornecedor, data_emissao='2025-01-02', valor_total=0)
+        itens = [
+            {'material_id': materiais[n % len(materiais)].pk, 'quantidade_contada': '1.00'}
+            for n in range(options['linhas'])
+        ]
+        request = APIRequestFactory().post('/api/recebimentos/')
+        request.user = usuario
+
+        def linha_a_linha():
+            recebimento = Recebimento.objects.create(plano_compra=plano, nota_fiscal=nota, conferente=usuario)
+            for item in itens:
+                ItemRecebido.objects.create(
+                    recebimento=recebimento, material_id=item['material_id'],
+                    quantidade_contada=Decimal(item['quantidade_contada']),
+                )
+
+        def em_lote():
+            serializer = RecebimentoSerializer(
+                data={'plano_compra_id': plano.pk, 'nota_fiscal_id': nota.pk, 'itens_a_receber': itens},
+                context={'request': request},
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save(conferente=usuario)
+
+        # 2. Mede os dois caminhos
+        self.stdout.write(f"{options['linhas']} linhas por recebimento, {options['repeticoes']} repetições")
+        resultados = {}
+        for nome, funcao in (('linha a linha', linha_a_linha), ('serializer em lote', em_lote)):
+            tempos = []
+            for _ in range(options['repeticoes']):
+                consultas = []
+
+                def contar(execute, sql, params, many, context):
+                    consultas.append(sql)
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(contar):
+                    inicio = time.perf_counter()
+                    funcao()
+                    tempos.append(time.perf_counter() - inicio)
+            resultados[nome] = min(tempos)
+            self.stdout.write(
+                f"  {nome:<20} melhor: {min(tempos) * 1000:9.1f} ms   "
+                f"consultas: {len(consultas)}   {options['linhas'] / min(tempos):,.0f} linhas/s"
+            )
+
+        ganho = resultados['linha a linha'] / resultados['serializer em lote']
+        self.stdout.write(self.style.SUCCESS(f"Caminho em lote {ganho:.1f}x mais rápido."))
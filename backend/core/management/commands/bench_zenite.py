@@ -0,0 +1,220 @@
+# core/management/commands/bench_zenite.py
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.models import (
+    ItemInspecionadoDefeito, ItemNotaFiscal, ItemPlanoCompra, ItemRecebido, Material,
+    NotaFiscal, PlanoCompra, Recebimento
+)
+from core.serializers import RecebimentoSerializer
+from core.urls import router
+
+
+class Reverter(Exception):
+    """ Usada para desfazer tudo o que o benchmark gravou. """
+
+
+def medir(funcao, repeticoes):
+    """
+    Executa `funcao` uma vez para aquecer caches e depois `repeticoes` vezes,
+    medindo tempo e consultas. O pico de memória vem de uma execução extra com
+    tracemalloc, separada para não distorcer os tempos.
+    """
+    funcao()
+    tempos = []
+    consultas = []
+
+    def contar(execute, sql, params, many, context):
+        consultas.append(sql)
+        return execute(sql, params, many, context)
+
+    for _ in range(repeticoes):
+        consultas.clear()
+        with connection.execute_wrapper(contar):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+    total_consultas = len(consultas)
+
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'tempo_min_ms': round(min(tempos) * 1000, 2),
+        'tempo_mediana_ms': round(statistics.median(tempos) * 1000, 2),
+        'consultas': total_consultas,
+        'memoria_pico_kb': round(pico / 1024, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede tempo, número de consultas e pico de memória dos caminhos críticos "
+        "(conciliação, listagem e detalhe de cada endpoint, criação de recebimento) "
+        "e grava o resultado em JSON. Use com a massa gerada pelo seed_zenite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('saida', help="Arquivo JSON com os resultados.")
+        parser.add_argument('--repeticoes', type=int, default=5, help="Execuções medidas por caminho (padrão: 5).")
+        parser.add_argument('--linhas', type=int, default=2000,
+                            help="Linhas do recebimento criado pelo serializer (padrão: 2000).")
+        parser.add_argument('--amostra', type=int, default=20,
+                            help="Recebimentos conciliados em sequência no caminho de conciliação (padrão: 20).")
+        parser.add_argument('--comparar', help="JSON de uma execução anterior para comparar.")
+        parser.add_argument('--limiar', type=float, default=20.0,
+                            help="Piora percentual de tempo considerada regressão (padrão: 20).")
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1:
+            raise CommandError("--repeticoes deve ser maior que zero.")
+        if not Recebimento.objects.exists():
+            raise CommandError("Não há recebimentos no banco. Gere uma massa com: manage.py seed_zenite --escala N")
+        anterior = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)
+
+        self.resultados = {}
+        try:
+            with transaction.atomic():
+                self._executar(options)
+                raise Reverter()
+        except Reverter:
+            pass
+
+        relatorio = {
+            'gerado_em': timezone.now().isoformat(),
+            'commit': self._commit_atual(),
+            'volume': self.volume,
+            'parametros': {chave: options[chave] for chave in ('repeticoes', 'linhas', 'amostra')},
+            'resultados': self.resultados,
+        }
+        with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['saida']}."))
+
+        if anterior:
+            self._comparar(anterior, options['limiar'])
+
+    def _registrar(self, nome, funcao, repeticoes):
+        resultado = medir(funcao, repeticoes)
+        self.resultados[nome] = resultado
+        self.stdout.write(
+            f"  {nome:<42} {resultado['tempo_min_ms']:9.1f} ms  {resultado['consultas']:4} consultas  "
+            f"{resultado['memoria_pico_kb']:9.1f} KB"
+        )
+
+    def _executar(self, options):
+        repeticoes = options['repeticoes']
+        self.volume = {
+            modelo._meta.model_name: modelo.objects.count()
+            for modelo in (PlanoCompra, ItemPlanoCompra, NotaFiscal, ItemNotaFiscal,
+                           Recebimento, ItemRecebido, ItemInspecionadoDefeito)
+        }
+        self.stdout.write(f"Volume: {self.volume}")
+
+        # 1. Conciliação: o maior recebimento e uma sequência de recebimentos
+        maior = (
+            Recebimento.objects.annotate(linhas=Count('itens_recebidos')).order_by('-linhas', '-id').first()
+        )
+        amostra = list(Recebimento.objects.order_by('-id')[:options['amostra']])
+        self._registrar('conciliacao.maior_recebimento', maior.realizar_conciliacao, repeticoes)
+        self._registrar(
+            f'conciliacao.sequencia_{len(amostra)}',
+            lambda: [recebimento.realizar_conciliacao() for recebimento in amostra],
+            repeticoes,
+        )
+
+        # 2. Listagem e detalhe de cada endpoint registrado no router
+        usuario = User.objects.create_user(username='__bench_zenite__')
+        for nome in ('Administrador', 'Analista', 'Revisor'):
+            usuario.groups.add(Group.objects.get_or_create(name=nome)[0])
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+
+        # O cliente de teste usa o host "testserver"
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for prefixo, viewset, _ in router.registry:
+                url = f'/api/{prefixo}/'
+                self._registrar(f'api.{prefixo}.list', self._requisicao(cliente, url), repeticoes)
+                objeto = viewset.queryset.order_by('-pk').first()
+                if objeto is not None:
+                    self._registrar(f'api.{prefixo}.detail', self._requisicao(cliente, f'{url}{objeto.pk}/'), repeticoes)
+
+        # 3. RecebimentoSerializer.create com --linhas itens
+        plano = PlanoCompra.objects.order_by('-id').first()
+        nota = NotaFiscal.objects.order_by('-id').first()
+        materiais = list(Material.objects.values_list('id', flat=True)[:options['linhas']])
+        itens = [
+            {'material_id': materiais[n % len(materiais)], 'quantidade_contada': '1.00'}
+            for n in range(options['linhas'])
+        ]
+        request = APIRequestFactory().post('/api/recebimentos/')
+        request.user = usuario
+
+        def criar_recebimento():
+            serializer = RecebimentoSerializer(
+                data={'plano_compra_id': plano.pk, 'nota_fiscal_id': nota.pk, 'itens_a_receber': itens},
+                context={'request': request},
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save(conferente=usuario)
+
+        self._registrar(f'serializer.recebimento_create_{options["linhas"]}', criar_recebimento, repeticoes)
+
+    @staticmethod
+    def _requisicao(cliente, url):
+        def executar():
+            resposta = cliente.get(url)
+            if resposta.status_code != 200:
+                raise CommandError(f"GET {url} devolveu {resposta.status_code}.")
+        return executar
+
+    @staticmethod
+    def _commit_atual():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _comparar(self, anterior, limiar):
+        self.stdout.write(f"\nComparação com {anterior.get('commit') or anterior.get('gerado_em')}:")
+        regressoes = 0
+        for nome, atual in self.resultados.items():
+            antes = anterior.get('resultados', {}).get(nome)
+            if not antes:
+                continue
+            variacao = (atual['tempo_min_ms'] - antes['tempo_min_ms']) / max(antes['tempo_min_ms'], 1e-6) * 100
+            linha = (
+                f"  {nome:<42} {variacao:+7.1f}% tempo  "
+                f"{atual['consultas'] - antes['consultas']:+4} consultas  "
+                f"{atual['memoria_pico_kb'] - antes['memoria_pico_kb']:+9.1f} KB"
+            )
+            # Variações de menos de 1 ms são ruído, mesmo que grandes em percentual
+            piorou = variacao > limiar and atual['tempo_min_ms'] - antes['tempo_min_ms'] > 1
+            if piorou or atual['consultas'] > antes['consultas']:
+                regressoes += 1
+                self.stdout.write(self.style.WARNING(linha))
+            else:
+                self.stdout.write(linha)
+        if regressoes:
+            self.stdout.write(self.style.WARNING(f"{regressoes} possível(is) regressão(ões)."))
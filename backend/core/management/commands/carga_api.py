@@ -0,0 +1,119 @@
+# core/management/commands/carga_api.py
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+def percentil(ordenadas, valor):
+    """ Percentil pelo método nearest-rank (o mesmo de /api/metricas/). """
+    posicao = max(0, min(len(ordenadas) - 1, -(-len(ordenadas) * valor // 100) - 1))
+    return round(ordenadas[posicao], 2)
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga HTTP de um servidor já em execução: cada cliente repete GETs "
+        "em uma conexão keep-alive durante --duracao segundos, e o comando mostra "
+        "requisições/s, percentis de latência e erros de cada caminho. Para comparar "
+        "os deploys, rode o mesmo teste contra um processo WSGI (ex.: gunicorn "
+        "config.wsgi --workers 1 --threads 8) e um ASGI (ex.: uvicorn config.asgi:application "
+        "--workers 1), nos caminhos /api/... e /api/async/..."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Endereço do servidor.")
+        parser.add_argument('--token', required=True, help="Token de autenticação (cabeçalho 'Token <chave>').")
+        parser.add_argument('--caminho', action='append', dest='caminhos',
+                            help="Caminho a testar (pode repetir). Padrão: listagem síncrona e assíncrona de recebimentos.")
+        parser.add_argument('--concorrencia', type=int, default=32, help="Clientes simultâneos (padrão: 32).")
+        parser.add_argument('--duracao', type=float, default=15.0, help="Segundos por caminho (padrão: 15).")
+        parser.add_argument('--saida', help="Arquivo JSON com os resultados.")
+
+    def handle(self, *args, **options):
+        if options['concorrencia'] < 1 or options['duracao'] <= 0:
+            raise CommandError("--concorrencia e --duracao devem ser maiores que zero.")
+        endereco = urlsplit(options['url'])
+        if endereco.scheme not in ('http', 'https') or not endereco.hostname:
+            raise CommandError(f"URL inválida: {options['url']}")
+        caminhos = options['caminhos'] or ['/api/recebimentos/', '/api/async/recebimentos/']
+
+        resultados = {}
+        for caminho in caminhos:
+            resultado = self._carga(endereco, caminho, options)
+            resultados[caminho] = resultado
+            self.stdout.write(
+                f"  {caminho:<45} {resultado['requisicoes_por_segundo']:9.1f} req/s  "
+                f"p50 {resultado['p50_ms']:8.1f} ms  p95 {resultado['p95_ms']:8.1f} ms  "
+                f"p99 {resultado['p99_ms']:8.1f} ms  {resultado['erros']} erro(s)"
+            )
+
+        if options['saida']:
+            relatorio = {
+                'gerado_em': timezone.now().isoformat(),
+                'url': options['url'],
+                'parametros': {chave: options[chave] for chave in ('concorrencia', 'duracao')},
+                'resultados': resultados,
+            }
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['saida']}."))
+
+    def _carga(self, endereco, caminho, options):
+        classe = http.client.HTTPSConnection if endereco.scheme == 'https' else http.client.HTTPConnection
+        cabecalhos = {'Authorization': f"Token {options['token']}", 'Accept': 'application/json'}
+        duracoes, erros, status = [], [0], {}
+        lock = threading.Lock()
+        fim = time.perf_counter() + options['duracao']
+
+        def cliente():
+            conexao = classe(endereco.hostname, endereco.port, timeout=60)
+            locais, falhas, codigos = [], 0, {}
+            try:
+                while time.perf_counter() < fim:
+                    inicio = time.perf_counter()
+                    try:
+                        conexao.request('GET', caminho, headers=cabecalhos)
+                        resposta = conexao.getresponse()
+                        resposta.read()
+                    except (OSError, http.client.HTTPException):
+                        falhas += 1
+                        conexao.close()
+                        continue
+                    locais.append((time.perf_counter() - inicio) * 1000)
+                    codigos[resposta.status] = codigos.get(resposta.status, 0) + 1
+                    if resposta.status >= 400:
+                        falhas += 1
+            finally:
+                conexao.close()
+            with lock:
+                duracoes.extend(locais)
+                erros[0] += falhas
+                for codigo, quantidade in codigos.items():
+                    status[codigo] = status.get(codigo, 0) + quantidade
+
+        inicio = time.perf_counter()
+        clientes = [threading.Thread(target=cliente) for _ in range(options['concorrencia'])]
+        for thread in clientes:
+            thread.start()
+        for thread in clientes:
+            thread.join()
+        decorrido = time.perf_counter() - inicio
+
+        if not duracoes:
+            raise CommandError(f"Nenhuma resposta de {endereco.geturl()}{caminho}.")
+        ordenadas = sorted(duracoes)
+        return {
+            'requisicoes': len(duracoes),
+            'requisicoes_por_segundo': round(len(duracoes) / decorrido, 1),
+            'p50_ms': percentil(ordenadas, 50),
+            'p95_ms': percentil(ordenadas, 95),
+            'p99_ms': percentil(ordenadas, 99),
+            'max_ms': round(ordenadas[-1], 2),
+            'erros': erros[0],
+            'status': {str(codigo): quantidade for codigo, quantidade in sorted(status.items())},
+        }
@@ -0,0 +1,107 @@
+# core/management/commands/conciliar_lote.py
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers
+
+from core.conciliacao_lote import (
+    FORMATOS, CheckpointLote, dividir_em_lotes, executar_em_lotes, formatar_linhas
+)
+from core.filtros import filtrar_recebimentos
+from core.models import Recebimento
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia em lote os recebimentos filtrados, distribuindo os lotes entre "
+        "vários processos e gravando as divergências em JSONL ou CSV."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('saida', help="Arquivo de saída (.jsonl ou .csv).")
+        parser.add_argument('--formato', choices=FORMATOS, help="Padrão: deduzido pela extensão do arquivo.")
+        parser.add_argument('--fornecedor', type=int, help="Id do fornecedor do plano de compra.")
+        parser.add_argument('--data-inicio', help="Data inicial do recebimento (AAAA-MM-DD).")
+        parser.add_argument('--data-fim', help="Data final do recebimento (AAAA-MM-DD).")
+        parser.add_argument('--status-plano', help="Status do plano de compra (ex.: Aberto, Parcial).")
+        parser.add_argument('--tamanho-lote', type=int, default=500, help="Recebimentos por lote (padrão: 500).")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Número de processos (padrão: número de CPUs).")
+        parser.add_argument('--retomar', action='store_true',
+                            help="Continua uma execução interrompida a partir do último lote concluído.")
+
+    def handle(self, *args, **options):
+        saida = options['saida']
+        formato = options['formato'] or os.path.splitext(saida)[1].lstrip('.').lower()
+        if formato not in FORMATOS:
+            raise CommandError("Informe --formato jsonl ou csv (não foi possível deduzir pela extensão).")
+        if options['tamanho_lote'] < 1:
+            raise CommandError("--tamanho-lote deve ser maior que zero.")
+
+        filtros = {
+            'fornecedor': options['fornecedor'],
+            'data_inicio': options['data_inicio'],
+            'data_fim': options['data_fim'],
+            'status_plano': options['status_plano'],
+        }
+        try:
+            queryset = filtrar_recebimentos(Recebimento.objects.all(), filtros)
+        except serializers.ValidationError as erro:
+            raise CommandError(erro.detail)
+
+        # 1. Prepara o checkpoint (e, se for o caso, retoma de onde parou)
+        checkpoint = CheckpointLote(saida, {**filtros, 'formato': formato})
+        retomando = False
+        if options['retomar']:
+            try:
+                retomando = checkpoint.carregar()
+            except ValueError as erro:
+                raise CommandError(str(erro))
+            if retomando and not os.path.exists(saida):
+                raise CommandError(f"O arquivo {saida} não existe mais; rode novamente sem --retomar.")
+        else:
+            checkpoint.remover()
+
+        # 2. Divide os recebimentos pendentes em lotes
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        if retomando:
+            ids = [recebimento_id for recebimento_id in ids if not checkpoint.ja_concluido(recebimento_id)]
+        lotes = dividir_em_lotes(ids, options['tamanho_lote'])
+        if retomando:
+            self.stdout.write(f"Retomando: {len(checkpoint.lotes_concluidos)} lote(s) já concluído(s).")
+        self.stdout.write(f"{len(ids)} recebimento(s) em {len(lotes)} lote(s), {options['workers']} worker(s).")
+
+        # 3. Executa e grava as divergências à medida que os lotes terminam
+        modo = 'r+b' if retomando else 'wb'
+        inicio = time.monotonic()
+        processados = 0
+        total_divergencias = 0
+        with open(saida, modo) as arquivo:
+            # Descarta o que foi escrito depois do último lote registrado no checkpoint
+            arquivo.truncate(checkpoint.bytes_escritos)
+            arquivo.seek(0, os.SEEK_END)
+            if formato == 'csv' and arquivo.tell() == 0:
+                arquivo.write(formatar_linhas([], formato, incluir_cabecalho=True).encode('utf-8'))
+
+            for concluidos, (_, lote_ids, linhas) in enumerate(
+                executar_em_lotes(lotes, workers=options['workers']), start=1
+            ):
+                arquivo.write(formatar_linhas(linhas, formato).encode('utf-8'))
+                arquivo.flush()
+                checkpoint.registrar(lote_ids, arquivo.tell())
+
+                processados += len(lote_ids)
+                total_divergencias += len(linhas)
+                decorrido = max(time.monotonic() - inicio, 1e-6)
+                self.stdout.write(
+                    f"[lote {concluidos}/{len(lotes)}] {processados}/{len(ids)} recebimentos, "
+                    f"{total_divergencias} divergência(s), {processados / decorrido:.1f} rec/s"
+                )
+
+        decorrido = time.monotonic() - inicio
+        checkpoint.remover()
+        self.stdout.write(self.style.SUCCESS(
+            f"Concluído em {decorrido:.1f}s: {processados} recebimento(s), "
+            f"{total_divergencias} divergência(s) gravada(s) em {saida}."
+        ))
@@ -0,0 +1,55 @@
+# core/management/commands/importar_materiais.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.catalogo import TAMANHO_LOTE, ErroCatalogo, ResumoCatalogo, formato_do_arquivo, importar_catalogo
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa o catálogo de materiais do ERP (CSV ou JSONL com codigo_interno, descricao "
+        "e unidade_medida) em lotes: cria os novos, atualiza os alterados e pula os iguais."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Arquivo .csv ou .jsonl.")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help="Padrão: pela extensão do arquivo.")
+        parser.add_argument('--tamanho-lote', type=int, default=TAMANHO_LOTE,
+                            help=f"Linhas por transação (padrão: {TAMANHO_LOTE}).")
+        parser.add_argument('--erros', help="Grava as linhas inválidas neste arquivo JSONL.")
+
+    def handle(self, *args, **options):
+        if options['tamanho_lote'] < 1:
+            raise CommandError("--tamanho-lote deve ser maior que zero.")
+        try:
+            formato = formato_do_arquivo(options['arquivo'], options['formato'])
+            arquivo = open(options['arquivo'], 'rb')
+        except (ErroCatalogo, OSError) as erro:
+            raise CommandError(str(erro))
+
+        relatorio = open(options['erros'], 'w', encoding='utf-8') if options['erros'] else None
+        resumo = ResumoCatalogo()
+        try:
+            for lote in importar_catalogo(arquivo, formato, options['tamanho_lote']):
+                resumo.registrar(lote)
+                for erro in lote['erros']:
+                    if relatorio:
+                        relatorio.write(json.dumps(erro, ensure_ascii=False) + '\n')
+                    if options['verbosity'] > 1:
+                        self.stderr.write(f"Linha {erro['linha']}: {' '.join(erro['erros'])}")
+                parcial = resumo.como_dict()
+                self.stdout.write(f"{parcial['linhas']} linha(s), {parcial['linhas_por_segundo']} linhas/s")
+        except (ErroCatalogo, UnicodeDecodeError) as erro:
+            raise CommandError(f"Não foi possível ler {options['arquivo']}: {erro}")
+        finally:
+            arquivo.close()
+            if relatorio:
+                relatorio.close()
+
+        final = resumo.como_dict()
+        self.stdout.write(self.style.SUCCESS(
+            f"Concluído em {final['segundos']:.1f}s: {final['linhas']} linha(s), {final['inseridos']} inserido(s), "
+            f"{final['atualizados']} atualizado(s), {final['inalterados']} inalterado(s), "
+            f"{final['invalidos']} inválido(s); {final['linhas_por_segundo']} linhas/s."
+        ))
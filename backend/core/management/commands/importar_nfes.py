@@ -0,0 +1,60 @@
+# core/management/commands/importar_nfes.py
+import json
+import os
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.nfe_lote import ResumoImportacao, importar_arquivos
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa as NF-e de um arquivo ZIP ou de um diretório com XMLs, lendo os "
+        "arquivos em vários processos e gravando as notas em lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('origem', help="Arquivo .zip ou diretório com os XMLs.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processos de leitura dos XMLs (padrão: número de CPUs).")
+        parser.add_argument('--tamanho-lote', type=int, default=200, help="Notas por transação (padrão: 200).")
+        parser.add_argument('--relatorio', help="Grava o resultado de cada arquivo neste arquivo JSONL.")
+
+    def handle(self, *args, **options):
+        origem = options['origem']
+        if not os.path.exists(origem):
+            raise CommandError(f"{origem} não existe.")
+        if options['tamanho_lote'] < 1:
+            raise CommandError("--tamanho-lote deve ser maior que zero.")
+
+        relatorio = open(options['relatorio'], 'w', encoding='utf-8') if options['relatorio'] else None
+        resumo = ResumoImportacao()
+        try:
+            for resultados in importar_arquivos(origem, workers=options['workers'], tamanho_lote=options['tamanho_lote']):
+                resumo.registrar(resultados)
+                for resultado in resultados:
+                    if relatorio:
+                        relatorio.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+                    if resultado['erros'] and options['verbosity'] > 1:
+                        self.stderr.write(f"{resultado['arquivo']}: {' '.join(resultado['erros'])}")
+                parcial = resumo.como_dict()
+                self.stdout.write(
+                    f"{parcial['arquivos']} arquivo(s), {parcial['linhas']} linha(s), "
+                    f"{parcial['arquivos_por_segundo']} arquivos/s, {parcial['linhas_por_segundo']} linhas/s"
+                )
+        except (OSError, zipfile.BadZipFile) as erro:
+            raise CommandError(f"Não foi possível ler {origem}: {erro}")
+        finally:
+            if relatorio:
+                relatorio.close()
+
+        final = resumo.como_dict()
+        por_status = ', '.join(
+            f"{final.get(status, 0)} {status}(s)" for status in ('criada', 'atualizada', 'duplicada', 'ignorada', 'erro')
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Concluído em {final['segundos']:.1f}s: {final['arquivos']} arquivo(s) ({por_status}), "
+            f"{final['linhas']} linha(s); {final['arquivos_por_segundo']} arquivos/s, "
+            f"{final['linhas_por_segundo']} linhas/s."
+        ))
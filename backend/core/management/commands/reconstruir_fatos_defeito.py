@@ -0,0 +1,34 @@
+# core/management/commands/reconstruir_fatos_defeito.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.analise_defeitos import atualizar_fatos_defeito, invalidar_pareto
+from core.jobs import enfileirar
+
+
+class Command(BaseCommand):
+    help = (
+        "Refaz a tabela de fatos de defeito (FatoDefeito) a partir dos defeitos apontados "
+        "e invalida o cache do Pareto. Use após cargas em lote que não disparam signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recebimento', type=int, action='append', dest='recebimentos',
+                            help="Id do recebimento (pode ser repetido). Padrão: todos.")
+        parser.add_argument('--em-segundo-plano', action='store_true',
+                            help="Apenas enfileira a reconstrução, para o zenite_worker.")
+
+    def handle(self, *args, **options):
+        if options['em_segundo_plano']:
+            job = enfileirar('fatos_defeito', {'recebimentos': options['recebimentos']}, unico=True)
+            self.stdout.write(self.style.SUCCESS(f"Reconstrução enfileirada no job {job.pk}."))
+            return
+        inicio = time.monotonic()
+        with transaction.atomic():
+            gravados = atualizar_fatos_defeito(recebimento_ids=options['recebimentos'])
+            invalidar_pareto()
+        self.stdout.write(self.style.SUCCESS(
+            f"Concluído em {time.monotonic() - inicio:.2f}s: {gravados} fato(s) de defeito gravado(s)."
+        ))
@@ -0,0 +1,43 @@
+# core/management/commands/reconstruir_progresso.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.conciliacao_lote import dividir_em_lotes
+from core.models import PlanoCompra
+from core.progresso import atualizar_status_planos, reconstruir_progresso
+
+
+class Command(BaseCommand):
+    help = (
+        "Refaz o progresso dos planos de compra (ProgressoPlanoMaterial) a partir dos "
+        "itens recebidos, corrige qualquer divergência e recalcula o status dos planos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plano', type=int, action='append', dest='planos',
+                            help="Id do plano (pode ser repetido). Padrão: todos.")
+        parser.add_argument('--tamanho-lote', type=int, default=1000, help="Planos por transação (padrão: 1000).")
+
+    def handle(self, *args, **options):
+        queryset = PlanoCompra.objects.order_by('id')
+        if options['planos']:
+            queryset = queryset.filter(pk__in=options['planos'])
+        ids = list(queryset.values_list('id', flat=True))
+        lotes = dividir_em_lotes(ids, max(1, options['tamanho_lote']))
+
+        inicio = time.monotonic()
+        corrigidas = 0
+        status_alterados = 0
+        for numero, lote in enumerate(lotes, start=1):
+            with transaction.atomic():
+                corrigidas += reconstruir_progresso(lote)
+                status_alterados += len(atualizar_status_planos(lote))
+            self.stdout.write(f"[lote {numero}/{len(lotes)}] {corrigidas} linha(s) corrigida(s), {status_alterados} status alterado(s)")
+
+        estilo = self.style.WARNING if corrigidas else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"Concluído em {time.monotonic() - inicio:.1f}s: {len(ids)} plano(s), "
+            f"{corrigidas} linha(s) de progresso corrigida(s), {status_alterados} status alterado(s)."
+        ))
@@ -0,0 +1,280 @@
+# core/management/commands/seed_zenite.py
+import random
+import time
+from datetime import date, datetime, time as hora, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.analise_defeitos import atualizar_fatos_defeito, invalidar_pareto
+from core.models import (
+    Defeito, Fornecedor, InspecaoQualidade, ItemInspecionadoDefeito, ItemNotaFiscal,
+    ItemPlanoCompra, ItemRecebido, Material, NotaFiscal, PlanoCompra, Recebimento
+)
+from core.progresso import atualizar_status_planos, reconstruir_progresso
+
+
+CORES = ['Preto', 'Branco', 'Marrom', 'Caramelo', 'Nude', 'Vermelho', 'Azul Marinho', 'Off White']
+NUMERACOES = [str(numero) for numero in range(33, 45)]
+DEFEITOS = [
+    'Costura solta', 'Mancha no couro', 'Cola aparente', 'Risco no material',
+    'Cor divergente', 'Numeração trocada', 'Solado descolando', 'Furo no cabedal',
+]
+STATUS_INSPECAO = ['Aprovado', 'Aprovado', 'Aprovado com Ressalvas', 'Reprovado', 'Pendente']
+
+# Quantidades geradas por unidade de --escala
+POR_ESCALA = {'fornecedores': 10, 'materiais': 200, 'planos': 100}
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera dados sintéticos realistas em volume (fornecedores, materiais, planos com "
+        "grade de numeração, NFs, recebimentos, inspeções e defeitos) para testes de carga."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', type=int, default=1,
+                            help="Multiplicador do volume: 1 = 100 planos; 1000 = 100 mil planos, "
+                                 "cerca de 2 milhões de linhas por tabela de itens (padrão: 1).")
+        parser.add_argument('--itens-por-documento', type=int, default=20,
+                            help="Materiais por plano, NF e recebimento (padrão: 20).")
+        parser.add_argument('--tamanho-lote', type=int, default=500, help="Planos por transação (padrão: 500).")
+        parser.add_argument('--prefixo', help="Prefixo dos códigos gerados (padrão: derivado do horário).")
+        parser.add_argument('--semente', type=int, help="Semente do gerador aleatório, para repetir a mesma massa.")
+
+    def handle(self, *args, **options):
+        escala = options['escala']
+        if escala < 1 or options['itens_por_documento'] < 1 or options['tamanho_lote'] < 1:
+            raise CommandError("--escala, --itens-por-documento e --tamanho-lote devem ser maiores que zero.")
+        self.aleatorio = random.Random(options['semente'])
+        self.prefixo = options['prefixo'] or self._prefixo_padrao()
+        if len(self.prefixo) > 8:
+            raise CommandError("--prefixo deve ter no máximo 8 caracteres (limite do código do plano).")
+        self.itens_por_documento = options['itens_por_documento']
+        inicio = time.monotonic()
+
+        # 1. Cadastros de apoio
+        self.usuario = self._usuario()
+        self.defeitos = [Defeito.objects.get_or_create(nome=nome)[0].pk for nome in DEFEITOS]
+        self.fornecedores = self._criar_fornecedores(POR_ESCALA['fornecedores'] * escala)
+        self.materiais = self._criar_materiais(POR_ESCALA['materiais'] * escala)
+        if len(self.materiais) < self.itens_por_documento:
+            raise CommandError("--itens-por-documento maior que o número de materiais gerados; aumente --escala.")
+
+        # 2. Documentos, um lote de planos por transação
+        total_planos = POR_ESCALA['planos'] * escala
+        self.linhas = 0
+        for inicio_lote in range(0, total_planos, options['tamanho_lote']):
+            quantidade = min(options['tamanho_lote'], total_planos - inicio_lote)
+            with transaction.atomic():
+                self._criar_documentos(inicio_lote, quantidade)
+            gerados = inicio_lote + quantidade
+            decorrido = max(time.monotonic() - inicio, 1e-6)
+            self.stdout.write(
+                f"{gerados}/{total_planos} planos, {self.linhas} linha(s) de itens, "
+                f"{self.linhas / decorrido:,.0f} linhas/s"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Massa '{self.prefixo}' gerada em {time.monotonic() - inicio:.1f}s: {len(self.fornecedores)} fornecedores, "
+            f"{len(self.materiais)} materiais, {total_planos} planos e {self.linhas} linhas de itens."
+        ))
+
+    # -------------------------------------------------------------------------
+    # Cadastros
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _prefixo_padrao():
+        numero, digitos = int(time.time()) % 36 ** 5, '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        prefixo = ''
+        for _ in range(5):
+            numero, resto = divmod(numero, 36)
+            prefixo = digitos[resto] + prefixo
+        return f"S{prefixo}"
+
+    def _usuario(self):
+        usuario, criado = User.objects.get_or_create(username='zenite_seed', defaults={'first_name': 'Massa de Teste'})
+        if criado:
+            usuario.set_unusable_password()
+            usuario.save()
+            usuario.groups.add(Group.objects.get_or_create(name='Analista')[0])
+        return usuario
+
+    def _criar_fornecedores(self, quantidade):
+        existentes = set(Fornecedor.objects.values_list('cnpj', flat=True))
+        fornecedores = []
+        while len(fornecedores) < quantidade:
+            cnpj = f"{self.aleatorio.randrange(10 ** 13, 10 ** 14)}"
+            if cnpj in existentes:
+                continue
+            existentes.add(cnpj)
+            numero = len(fornecedores)
+            fornecedores.append(Fornecedor(
+                razao_social=f"Calçados {self.prefixo} {numero} Ltda", nome_fantasia=f"Fornecedor {self.prefixo}-{numero}",
+                cnpj=cnpj, email=f"contato{numero}@{self.prefixo.lower()}.example.com",
+            ))
+        return [fornecedor.pk for fornecedor in Fornecedor.objects.bulk_create(fornecedores, batch_size=2000)]
+
+    def _criar_materiais(self, quantidade):
+        unidades = [codigo for codigo, _ in Material.UNIDADES_DE_MEDIDA]
+        materiais = Material.objects.bulk_create(
+            (
+                Material(
+                    codigo_interno=f"{self.prefixo}-MAT-{numero}",
+                    descricao=f"Material {numero} ({self.aleatorio.choice(CORES)})",
+                    unidade_medida=self.aleatorio.choice(unidades),
+                )
+                for numero in range(quantidade)
+            ),
+            batch_size=2000,
+        )
+        return [material.pk for material in materiais]
+
+    # -------------------------------------------------------------------------
+    # Documentos
+    # -------------------------------------------------------------------------
+    def _grade(self, quantidade):
+        """ Distribui a quantidade (em pares) por 3 a 6 numerações consecutivas. """
+        inicio = self.aleatorio.randrange(0, len(NUMERACOES) - 6)
+        numeracoes = NUMERACOES[inicio:inicio + self.aleatorio.randint(3, 6)]
+        pesos = [self.aleatorio.randint(1, 4) for _ in numeracoes]
+        grade = {numero: int(quantidade) * peso // sum(pesos) for numero, peso in zip(numeracoes, pesos)}
+        grade[numeracoes[0]] += int(quantidade) - sum(grade.values())
+        return grade
+
+    def _ajustar_grade(self, grade, quantidade):
+        """ A grade com a diferença para `quantidade` em uma numeração; às vezes troca duas numerações. """
+        grade = dict(grade)
+        numeracoes = list(grade)
+        diferenca = int(quantidade) - sum(grade.values())
+        if diferenca:
+            numero = self.aleatorio.choice([n for n in numeracoes if grade[n] + diferenca >= 0] or numeracoes)
+            grade[numero] = max(0, grade[numero] + diferenca)
+            if sum(grade.values()) != int(quantidade):
+                return self._grade(quantidade)
+        if len(numeracoes) > 1 and self.aleatorio.random() < 0.05:
+            a, b = self.aleatorio.sample(numeracoes, 2)
+            grade[a], grade[b] = grade[b], grade[a]
+        return grade
+
+    def _variar(self, quantidade, chance):
+        """ Na maior parte das vezes repete a quantidade; com `chance`, diverge um pouco. """
+        if self.aleatorio.random() >= chance:
+            return quantidade
+        return max(Decimal(1), quantidade + self.aleatorio.randint(-5, 5))
+
+    def _criar_documentos(self, inicio, quantidade):
+        aleatorio = self.aleatorio
+        hoje = date.today()
+
+        # 1. Planos e os seus itens (com cor e grade de numeração)
+        planos = []
+        for n in range(quantidade):
+            emissao = hoje - timedelta(days=aleatorio.randint(20, 720))
+            planos.append(PlanoCompra(
+                codigo_plano=f"{self.prefixo}-{inicio + n}", fornecedor_id=aleatorio.choice(self.fornecedores),
+                data_emissao=emissao, data_prevista_entrega=emissao + timedelta(days=aleatorio.randint(10, 45)),
+                # Aberto/Parcial/Concluido são calculados pelo progresso no fim do lote
+                status='Cancelado' if aleatorio.random() < 0.05 else 'Aberto',
+                usuario_criador_id=self.usuario.pk,
+            ))
+        PlanoCompra.objects.bulk_create(planos)
+        itens_plano = []
+        for plano in planos:
+            for material_id in aleatorio.sample(self.materiais, self.itens_por_documento):
+                prevista = Decimal(aleatorio.randrange(12, 600, 12))
+                itens_plano.append(ItemPlanoCompra(
+                    plano_compra_id=plano.pk, material_id=material_id, quantidade_prevista=prevista,
+                    preco_unitario=Decimal(aleatorio.randint(1500, 25000)) / 100,
+                    cor=aleatorio.choice(CORES), grade_numeracao=self._grade(prevista),
+                ))
+        ItemPlanoCompra.objects.bulk_create(itens_plano, batch_size=5000)
+
+        # 2. Notas fiscais (90% dos planos), com algumas divergências (também na grade) e itens faltando
+        por_plano = {}
+        for item in itens_plano:
+            por_plano.setdefault(item.plano_compra_id, []).append(item)
+        com_nota = [plano for plano in planos if aleatorio.random() < 0.9]
+        notas = NotaFiscal.objects.bulk_create([
+            NotaFiscal(
+                numero=f"{self.prefixo}{plano.codigo_plano.rsplit('-', 1)[1]}", fornecedor_id=plano.fornecedor_id,
+                data_emissao=plano.data_emissao + timedelta(days=aleatorio.randint(1, 15)),
+                valor_total=sum(item.quantidade_prevista * item.preco_unitario for item in por_plano[plano.pk]),
+            )
+            for plano in com_nota
+        ])
+        itens_nf = []
+        for plano, nota in zip(com_nota, notas):
+            for item in por_plano[plano.pk]:
+                if aleatorio.random() < 0.03:
+                    continue
+                quantidade = self._variar(item.quantidade_prevista, 0.08)
+                itens_nf.append(ItemNotaFiscal(
+                    nota_fiscal_id=nota.pk, material_id=item.material_id,
+                    quantidade=quantidade, valor_unitario=item.preco_unitario,
+                    cor=item.cor, grade_numeracao=self._ajustar_grade(item.grade_numeracao, quantidade),
+                ))
+        ItemNotaFiscal.objects.bulk_create(itens_nf, batch_size=5000)
+
+        # 3. Recebimentos (85% das notas), contados a partir da NF
+        por_nota = {}
+        for item in itens_nf:
+            por_nota.setdefault(item.nota_fiscal_id, []).append(item)
+        recebidos = [(plano, nota) for plano, nota in zip(com_nota, notas) if aleatorio.random() < 0.85]
+        recebimentos = Recebimento.objects.bulk_create([
+            Recebimento(plano_compra_id=plano.pk, nota_fiscal_id=nota.pk, conferente_id=self.usuario.pk)
+            for plano, nota in recebidos
+        ])
+        # data_recebimento é auto_now_add: a data realista é gravada depois, com bulk_update
+        for recebimento, (_, nota) in zip(recebimentos, recebidos):
+            recebimento.data_recebimento = self._momento(nota.data_emissao + timedelta(days=aleatorio.randint(0, 10)))
+        Recebimento.objects.bulk_update(recebimentos, ['data_recebimento'])
+
+        itens_recebidos = []
+        for recebimento, (_, nota) in zip(recebimentos, recebidos):
+            for item in por_nota.get(nota.pk, []):
+                contada = self._variar(item.quantidade, 0.1)
+                itens_recebidos.append(ItemRecebido(
+                    recebimento_id=recebimento.pk, material_id=item.material_id, quantidade_contada=contada,
+                    cor=item.cor, grade_numeracao=self._ajustar_grade(item.grade_numeracao, contada),
+                ))
+        ItemRecebido.objects.bulk_create(itens_recebidos, batch_size=5000)
+
+        # 4. Inspeções (70% dos recebimentos) e defeitos em parte dos itens inspecionados
+        inspecionados = [recebimento for recebimento in recebimentos if aleatorio.random() < 0.7]
+        inspecoes = InspecaoQualidade.objects.bulk_create([
+            InspecaoQualidade(recebimento_id=recebimento.pk, revisor_id=self.usuario.pk, status=aleatorio.choice(STATUS_INSPECAO))
+            for recebimento in inspecionados
+        ])
+        for inspecao, recebimento in zip(inspecoes, inspecionados):
+            inspecao.created_at = recebimento.data_recebimento + timedelta(hours=aleatorio.randint(1, 72))
+        InspecaoQualidade.objects.bulk_update(inspecoes, ['created_at'])
+
+        ids_inspecionados = {recebimento.pk for recebimento in inspecionados}
+        defeitos = [
+            ItemInspecionadoDefeito(
+                item_recebido_id=item.pk, defeito_id=aleatorio.choice(self.defeitos),
+                quantidade_defeituosa=Decimal(aleatorio.randint(1, max(1, int(item.quantidade_contada) // 10))),
+            )
+            for item in itens_recebidos
+            if item.recebimento_id in ids_inspecionados and aleatorio.random() < 0.15
+        ]
+        ItemInspecionadoDefeito.objects.bulk_create(defeitos, batch_size=5000)
+
+        # 5. Progresso e status dos planos e fatos de defeito (bulk_create não dispara os signals)
+        plano_ids = [plano.pk for plano in planos]
+        reconstruir_progresso(plano_ids)
+        atualizar_status_planos(plano_ids)
+        atualizar_fatos_defeito([defeito.pk for defeito in defeitos])
+        invalidar_pareto()
+
+        self.linhas += len(itens_plano) + len(itens_nf) + len(itens_recebidos) + len(defeitos)
+
+    def _momento(self, dia):
+        """ Um horário de expediente no dia informado. """
+        momento = datetime.combine(dia, hora(hour=self.aleatorio.randint(7, 17), minute=self.aleatorio.randint(0, 59)))
+        return timezone.make_aware(momento) if settings.USE_TZ else momento
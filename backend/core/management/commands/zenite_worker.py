@@ -0,0 +1,52 @@
+# core/management/commands/zenite_worker.py
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.jobs import executar_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Executa os jobs em segundo plano (conciliação, importação de NF-e, scorecard...) "
+        "em --processos processos, que dividem a fila com SELECT ... FOR UPDATE SKIP LOCKED. "
+        "SIGTERM ou Ctrl+C terminam os jobs em andamento e encerram os processos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=1, help="Processos de trabalho (padrão: 1).")
+        parser.add_argument('--uma-vez', action='store_true',
+                            help="Executa os jobs prontos e sai, em vez de esperar por novos.")
+
+    def handle(self, *args, **options):
+        processos = options['processos']
+        if processos < 1:
+            raise CommandError("--processos deve ser maior que zero.")
+        if processos == 1:
+            executados = executar_worker(0, options['uma_vez'])
+            self.stdout.write(self.style.SUCCESS(f"Worker encerrado: {executados} job(s) executado(s)."))
+            return
+
+        # A conexão do processo pai não pode ser compartilhada com os filhos.
+        connections.close_all()
+        filhos = [
+            multiprocessing.Process(target=executar_worker, args=(indice, options['uma_vez']), name=f'zenite-worker-{indice}')
+            for indice in range(processos)
+        ]
+        for filho in filhos:
+            filho.start()
+        self.stdout.write(f"{processos} worker(s) em execução.")
+
+        def repassar(sinal, _):
+            for filho in filhos:
+                if filho.is_alive():
+                    filho.terminate()
+
+        # Ctrl+C já chega a todo o grupo de processos; SIGTERM é repassado aos filhos
+        signal.signal(signal.SIGTERM, repassar)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for filho in filhos:
+            filho.join()
+        self.stdout.write(self.style.SUCCESS("Workers encerrados."))
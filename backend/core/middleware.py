@@ -0,0 +1,95 @@
+# core/middleware.py
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .instrumentacao import agregado_rotas, configuracao, encerrar_medicao, iniciar_medicao
+
+
+logger_lento = logging.getLogger('core.lento')
+
+
+class InstrumentacaoMiddleware:
+    """
+    Mede cada requisição (consultas SQL, tempo de banco, de serialização e total),
+    devolve os tempos no cabeçalho Server-Timing, alimenta os percentis por rota
+    e grava no log "core.lento" as requisições e consultas acima dos limites
+    configurados em settings.INSTRUMENTACAO.
+
+    Funciona nos dois modos (WSGI e ASGI): no ASGI não força as views
+    assíncronas (core/views_async.py) a rodar em uma thread. As consultas são
+    medidas pelo wrapper que toda conexão recebe ao ser aberta (ver
+    instalar_medicao_sql), inclusive as das threads de consultas em paralelo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        medicao, token = iniciar_medicao()
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            encerrar_medicao(token)
+        return self._registrar(request, response, medicao, time.perf_counter() - inicio)
+
+    async def __acall__(self, request):
+        medicao, token = iniciar_medicao()
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            encerrar_medicao(token)
+        return self._registrar(request, response, medicao, time.perf_counter() - inicio)
+
+    def _registrar(self, request, response, medicao, duracao):
+        # 1. Server-Timing (visível nas ferramentas de desenvolvimento do navegador)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={medicao.tempo_db * 1000:.1f};desc="{medicao.consultas} consultas"',
+            f'ser;dur={medicao.tempo_serializacao * 1000:.1f};desc="serialização"',
+            f'view;dur={duracao * 1000:.1f};desc="view"',
+        ])
+
+        # 2. Percentis por rota
+        rota, view, acao = self._identificar(request)
+        duracao_ms = duracao * 1000
+        agregado_rotas.registrar(f'{request.method} {rota}', duracao_ms, medicao.consultas)
+
+        # 3. Log estruturado das requisições (ou consultas) lentas
+        if duracao_ms >= configuracao()['REQUISICAO_LENTA_MS'] or medicao.consultas_lentas:
+            logger_lento.warning(json.dumps({
+                'metodo': request.method,
+                'caminho': request.path,
+                'rota': rota,
+                'view': view,
+                'acao': acao,
+                'status': response.status_code,
+                'total_ms': round(duracao_ms, 2),
+                'db_ms': round(medicao.tempo_db * 1000, 2),
+                'serializacao_ms': round(medicao.tempo_serializacao * 1000, 2),
+                'consultas': medicao.consultas,
+                'consultas_lentas': medicao.consultas_lentas,
+            }, ensure_ascii=False))
+        return response
+
+    @staticmethod
+    def _identificar(request):
+        """ Devolve (rota, view, ação), ex.: ('recebimento-detail', 'RecebimentoViewSet', 'retrieve'). """
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'nao_resolvida', None, None
+        funcao = match.func
+        classe = getattr(funcao, 'cls', None)
+        acoes = getattr(funcao, 'actions', None) or {}
+        view = classe.__name__ if classe else getattr(funcao, '__name__', None)
+        return match.view_name or match.route, view, acoes.get(request.method.lower())
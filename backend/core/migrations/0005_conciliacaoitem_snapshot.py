@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_alter_inspecaoqualidade_recebimento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recebimento',
+            name='conciliacao_atualizada_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Conciliação Atualizada em'),
+        ),
+        migrations.CreateModel(
+            name='ConciliacaoItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('qtd_plano', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Qtd. no Plano')),
+                ('qtd_nf', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Qtd. na NF')),
+                ('qtd_recebida', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Qtd. Recebida')),
+                ('divergente', models.BooleanField(default=False)),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.material')),
+                ('recebimento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conciliacao_itens', to='core.recebimento')),
+            ],
+            options={
+                'verbose_name': 'Item de Conciliação',
+                'verbose_name_plural': 'Itens de Conciliação',
+                'indexes': [models.Index(fields=['recebimento', 'divergente'], name='conciliacao_receb_diverg_idx')],
+                'unique_together': {('recebimento', 'material')},
+            },
+        ),
+    ]
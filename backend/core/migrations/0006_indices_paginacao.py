@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_conciliacaoitem_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inspecaoqualidade',
+            index=models.Index(fields=['-created_at', '-id'], name='inspecao_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notafiscal',
+            index=models.Index(fields=['-data_emissao', '-id'], name='notafiscal_emissao_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planocompra',
+            index=models.Index(fields=['-data_emissao', '-id'], name='planocompra_emissao_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recebimento',
+            index=models.Index(fields=['-data_recebimento', '-id'], name='recebimento_data_id_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_indices_paginacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressoPlanoMaterial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade_recebida', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Qtd. Recebida')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.material')),
+                ('plano_compra', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progresso', to='core.planocompra')),
+            ],
+            options={
+                'verbose_name': 'Progresso do Plano de Compra',
+                'verbose_name_plural': 'Progresso dos Planos de Compra',
+                'unique_together': {('plano_compra', 'material')},
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_progressoplanomaterial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaAtualizacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=50, unique=True)),
+                ('atualizado_ate', models.DateTimeField(verbose_name='Atualizado Até')),
+            ],
+            options={
+                'verbose_name': 'Marca de Atualização',
+                'verbose_name_plural': 'Marcas de Atualização',
+            },
+        ),
+        migrations.CreateModel(
+            name='ScorecardFornecedorDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(verbose_name='Dia')),
+                ('recebimentos', models.PositiveIntegerField(default=0)),
+                ('recebimentos_no_prazo', models.PositiveIntegerField(default=0, verbose_name='Recebimentos no Prazo')),
+                ('qtd_prevista', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Qtd. Prevista')),
+                ('qtd_atendida', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Qtd. Atendida')),
+                ('linhas_nf', models.PositiveIntegerField(default=0, verbose_name='Linhas Conferidas (Plano x NF)')),
+                ('linhas_nf_conformes', models.PositiveIntegerField(default=0, verbose_name='Linhas da NF Iguais ao Plano')),
+                ('qtd_inspecionada', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Qtd. Inspecionada')),
+                ('qtd_defeituosa', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Qtd. com Defeito')),
+            ],
+            options={
+                'verbose_name': 'Scorecard Diário do Fornecedor',
+                'verbose_name_plural': 'Scorecards Diários dos Fornecedores',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inspecaoqualidade',
+            index=models.Index(fields=['updated_at'], name='inspecao_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='iteminspecionadodefeito',
+            index=models.Index(fields=['updated_at'], name='itemdefeito_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notafiscal',
+            index=models.Index(fields=['updated_at'], name='notafiscal_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planocompra',
+            index=models.Index(fields=['updated_at'], name='planocompra_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recebimento',
+            index=models.Index(fields=['updated_at'], name='recebimento_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='scorecardfornecedordia',
+            name='fornecedor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scorecard_diario', to='core.fornecedor'),
+        ),
+        migrations.AddIndex(
+            model_name='scorecardfornecedordia',
+            index=models.Index(fields=['dia', 'fornecedor'], name='scorecard_dia_fornecedor_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='scorecardfornecedordia',
+            unique_together={('fornecedor', 'dia')},
+        ),
+    ]
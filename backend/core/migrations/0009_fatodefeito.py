@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_scorecard_fornecedor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FatoDefeito',
+            fields=[
+                ('item_defeito', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fato', serialize=False, to='core.iteminspecionadodefeito')),
+                ('data_recebimento', models.DateField(verbose_name='Data do Recebimento')),
+                ('quantidade', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Quantidade com Defeito')),
+                ('defeito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.defeito')),
+                ('fornecedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.fornecedor')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.material')),
+                ('recebimento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.recebimento')),
+            ],
+            options={
+                'verbose_name': 'Fato de Defeito',
+                'verbose_name_plural': 'Fatos de Defeito',
+                'indexes': [models.Index(fields=['data_recebimento'], name='fatodefeito_data_idx'), models.Index(fields=['fornecedor', 'data_recebimento'], name='fatodefeito_fornec_data_idx'), models.Index(fields=['material', 'data_recebimento'], name='fatodefeito_material_data_idx'), models.Index(fields=['defeito', 'data_recebimento'], name='fatodefeito_defeito_data_idx')],
+            },
+        ),
+    ]
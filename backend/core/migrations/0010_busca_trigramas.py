@@ -0,0 +1,56 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:36
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+# Os índices de trigramas dependem da extensão pg_trgm (pacote postgresql-contrib).
+# Se ela não estiver disponível no servidor, os índices não são criados e a busca
+# (core/busca.py) usa ILIKE, sem ranking por similaridade.
+INDICES_TRIGRAMAS = [
+    ('fornecedor', django.contrib.postgres.indexes.GinIndex(fields=['razao_social'], name='fornecedor_razao_trgm_idx', opclasses=['gin_trgm_ops'])),
+    ('fornecedor', django.contrib.postgres.indexes.GinIndex(fields=['nome_fantasia'], name='fornecedor_fantasia_trgm_idx', opclasses=['gin_trgm_ops'])),
+    ('material', django.contrib.postgres.indexes.GinIndex(fields=['codigo_interno'], name='material_codigo_trgm_idx', opclasses=['gin_trgm_ops'])),
+    ('material', django.contrib.postgres.indexes.GinIndex(fields=['descricao'], name='material_descricao_trgm_idx', opclasses=['gin_trgm_ops'])),
+]
+
+
+def criar_indices_trigramas(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for modelo, indice in INDICES_TRIGRAMAS:
+        schema_editor.add_index(apps.get_model('core', modelo), indice)
+
+
+def remover_indices_trigramas(apps, schema_editor):
+    for _, indice in INDICES_TRIGRAMAS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(indice.name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_fatodefeito'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fornecedor',
+            index=models.Index(fields=['cnpj'], name='fornecedor_cnpj_prefixo_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['codigo_interno'], name='material_codigo_prefixo_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=modelo, index=indice) for modelo, indice in INDICES_TRIGRAMAS
+            ],
+            database_operations=[
+                migrations.RunPython(criar_indices_trigramas, remover_indices_trigramas),
+            ],
+        ),
+    ]
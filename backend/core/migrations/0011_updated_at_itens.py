@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_busca_trigramas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemnotafiscal',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Data de Atualização'),
+        ),
+        migrations.AddField(
+            model_name='itemplanocompra',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Data de Atualização'),
+        ),
+        migrations.AddField(
+            model_name='itemrecebido',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Data de Atualização'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:12
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemnotafiscal',
+            name='cor',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='itemnotafiscal',
+            name='grade_numeracao',
+            field=models.JSONField(blank=True, null=True, verbose_name='Grade de Numeração'),
+        ),
+        migrations.AddField(
+            model_name='itemrecebido',
+            name='cor',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='itemrecebido',
+            name='grade_numeracao',
+            field=models.JSONField(blank=True, null=True, verbose_name='Grade de Numeração'),
+        ),
+        migrations.AddIndex(
+            model_name='itemnotafiscal',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['grade_numeracao'], name='itemnf_grade_gin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemplanocompra',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['grade_numeracao'], name='itemplano_grade_gin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemrecebido',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['grade_numeracao'], name='itemrecebido_grade_gin_idx'),
+        ),
+    ]
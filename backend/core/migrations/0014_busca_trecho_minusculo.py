@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:05
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+# Trecho do nome/descrição: LOWER(coluna) LIKE '%termo%' (core/busca.py). Como na
+# migração 0010, os índices só são criados se a extensão pg_trgm estiver disponível.
+INDICES_TRECHO = [
+    ('fornecedor', django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('razao_social'), name='gin_trgm_ops'), name='fornecedor_razao_low_trgm_idx')),
+    ('fornecedor', django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('nome_fantasia'), name='gin_trgm_ops'), name='fornecedor_fant_low_trgm_idx')),
+    ('material', django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('descricao'), name='gin_trgm_ops'), name='material_desc_low_trgm_idx')),
+]
+
+
+def criar_indices_trecho(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    for modelo, indice in INDICES_TRECHO:
+        schema_editor.add_index(apps.get_model('core', modelo), indice)
+
+
+def remover_indices_trecho(apps, schema_editor):
+    for _, indice in INDICES_TRECHO:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(indice.name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_grade_numeracao_itens'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=modelo, index=indice) for modelo, indice in INDICES_TRECHO
+            ],
+            database_operations=[
+                migrations.RunPython(criar_indices_trecho, remover_indices_trecho),
+            ],
+        ),
+    ]
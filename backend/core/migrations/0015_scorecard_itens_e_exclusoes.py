@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_busca_trecho_minusculo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScorecardDiaPendente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(verbose_name='Dia')),
+            ],
+            options={
+                'verbose_name': 'Dia Pendente do Scorecard',
+                'verbose_name_plural': 'Dias Pendentes do Scorecard',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='itemnotafiscal',
+            index=models.Index(fields=['updated_at'], name='itemnf_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemplanocompra',
+            index=models.Index(fields=['updated_at'], name='itemplano_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemrecebido',
+            index=models.Index(fields=['updated_at'], name='itemrecebido_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='scorecarddiapendente',
+            name='fornecedor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.fornecedor'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='scorecarddiapendente',
+            unique_together={('fornecedor', 'dia')},
+        ),
+    ]
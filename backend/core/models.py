@@ -2,6 +2,11 @@
 
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import Lower
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
 
 # Modelo Base para adicionar timestamps
 class BaseModel(models.Model):
@@ -25,6 +30,15 @@ class Fornecedor(BaseModel):
     class Meta:
         verbose_name = "Fornecedor"
         verbose_name_plural = "Fornecedores"
+        # Busca (core/busca.py): prefixo do CNPJ e trigramas dos nomes (pg_trgm)
+        indexes = [
+            models.Index(fields=['cnpj'], name='fornecedor_cnpj_prefixo_idx', opclasses=['varchar_pattern_ops']),
+            GinIndex(fields=['razao_social'], name='fornecedor_razao_trgm_idx', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['nome_fantasia'], name='fornecedor_fantasia_trgm_idx', opclasses=['gin_trgm_ops']),
+            # Trecho do nome: LOWER(coluna) LIKE '%termo%'
+            GinIndex(OpClass(Lower('razao_social'), name='gin_trgm_ops'), name='fornecedor_razao_low_trgm_idx'),
+            GinIndex(OpClass(Lower('nome_fantasia'), name='gin_trgm_ops'), name='fornecedor_fant_low_trgm_idx'),
+        ]
 
 class Material(BaseModel):
     UNIDADES_DE_MEDIDA = [
@@ -43,6 +57,14 @@ class Material(BaseModel):
     class Meta:
         verbose_name = "Material"
         verbose_name_plural = "Materiais"
+        # Busca (core/busca.py): prefixo do código e trigramas de código e descrição (pg_trgm)
+        indexes = [
+            models.Index(fields=['codigo_interno'], name='material_codigo_prefixo_idx', opclasses=['varchar_pattern_ops']),
+            GinIndex(fields=['codigo_interno'], name='material_codigo_trgm_idx', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['descricao'], name='material_descricao_trgm_idx', opclasses=['gin_trgm_ops']),
+            # Trecho da descrição: LOWER(descricao) LIKE '%termo%'
+            GinIndex(OpClass(Lower('descricao'), name='gin_trgm_ops'), name='material_desc_low_trgm_idx'),
+        ]
 
 class PlanoCompra(BaseModel):
     STATUS_CHOICES = [
@@ -64,6 +86,12 @@ class PlanoCompra(BaseModel):
     class Meta:
         verbose_name = "Plano de Compra"
         verbose_name_plural = "Planos de Compra"
+        indexes = [
+            # Ordenação da listagem paginada por cursor (id como desempate)
+            models.Index(fields=['-data_emissao', '-id'], name='planocompra_emissao_id_idx'),
+            # Alterações desde a última atualização do scorecard (core/scorecard.py)
+            models.Index(fields=['updated_at'], name='planocompra_updated_idx'),
+        ]
 
 class ItemPlanoCompra(models.Model): # Note que este não herda de BaseModel
     plano_compra = models.ForeignKey(PlanoCompra, on_delete=models.CASCADE, related_name="itens")
@@ -71,7 +99,10 @@ class ItemPlanoCompra(models.Model): # Note que este não herda de BaseModel
     quantidade_prevista = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Qtd. Prevista")
     preco_unitario = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Preço Unitário")
     cor = models.CharField(max_length=50, blank=True, null=True)
+    # Quantidade por numeração, ex.: {"37": 12, "38": 24} (ver conciliar_por_grade)
     grade_numeracao = models.JSONField(blank=True, null=True, verbose_name="Grade de Numeração")
+    # Usado nos ETags (core/condicional.py)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
 
     def __str__(self):
         return f"Item {self.material.codigo_interno} do plano {self.plano_compra.codigo_plano}"
@@ -79,6 +110,13 @@ class ItemPlanoCompra(models.Model): # Note que este não herda de BaseModel
     class Meta:
         verbose_name = "Item do Plano de Compra"
         verbose_name_plural = "Itens dos Planos de Compra"
+        indexes = [
+            # Materiais com a numeração na grade (grade_numeracao ? '38'), no filtro
+            # ?numeracao= da conciliação por grade (conciliacao._sql_totais_grade)
+            GinIndex(fields=['grade_numeracao'], name='itemplano_grade_gin_idx'),
+            # Atualização incremental do scorecard (core/scorecard.py)
+            models.Index(fields=['updated_at'], name='itemplano_updated_idx'),
+        ]
 
 class NotaFiscal(BaseModel):
     numero = models.CharField(max_length=50, verbose_name="Número da NF")
@@ -95,12 +133,20 @@ class NotaFiscal(BaseModel):
         verbose_name_plural = "Notas Fiscais"
         # Garante que um fornecedor não pode ter duas notas com o mesmo número
         unique_together = ('numero', 'fornecedor')
+        indexes = [
+            models.Index(fields=['-data_emissao', '-id'], name='notafiscal_emissao_id_idx'),
+            models.Index(fields=['updated_at'], name='notafiscal_updated_idx'),
+        ]
 
 class ItemNotaFiscal(models.Model):
     nota_fiscal = models.ForeignKey(NotaFiscal, on_delete=models.CASCADE, related_name="itens_nf")
     material = models.ForeignKey(Material, on_delete=models.PROTECT)
     quantidade = models.DecimalField(max_digits=10, decimal_places=2)
     valor_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    cor = models.CharField(max_length=50, blank=True, null=True)
+    grade_numeracao = models.JSONField(blank=True, null=True, verbose_name="Grade de Numeração")
+    # Usado nos ETags (core/condicional.py)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
 
     def __str__(self):
         return f"Item {self.material.codigo_interno} da NF {self.nota_fiscal.numero}"
@@ -108,6 +154,10 @@ class ItemNotaFiscal(models.Model):
     class Meta:
         verbose_name = "Item da Nota Fiscal"
         verbose_name_plural = "Itens das Notas Fiscais"
+        indexes = [
+            GinIndex(fields=['grade_numeracao'], name='itemnf_grade_gin_idx'),
+            models.Index(fields=['updated_at'], name='itemnf_updated_idx'),
+        ]
 
 
 class Recebimento(BaseModel):
@@ -116,6 +166,8 @@ class Recebimento(BaseModel):
     conferente = models.ForeignKey(User, on_delete=models.PROTECT, verbose_name="Conferente")
     data_recebimento = models.DateTimeField(auto_now_add=True, verbose_name="Data do Recebimento")
     observacoes = models.TextField(blank=True, null=True, verbose_name="Observações")
+    # Preenchido quando o snapshot da conciliação (ConciliacaoItem) está materializado
+    conciliacao_atualizada_em = models.DateTimeField(blank=True, null=True, editable=False, verbose_name="Conciliação Atualizada em")
 
     def __str__(self):
         return f"Recebimento do Plano {self.plano_compra.codigo_plano} em {self.data_recebimento.strftime('%d/%m/%Y')}"
@@ -123,67 +175,31 @@ class Recebimento(BaseModel):
     class Meta:
         verbose_name = "Recebimento Físico"
         verbose_name_plural = "Recebimentos Físicos"
+        indexes = [
+            models.Index(fields=['-data_recebimento', '-id'], name='recebimento_data_id_idx'),
+            models.Index(fields=['updated_at'], name='recebimento_updated_idx'),
+        ]
 
     def realizar_conciliacao(self):
         """
         Este método compara os itens do plano, da nota fiscal e do recebimento físico
         para encontrar divergências.
+
+        As quantidades são somadas por material no próprio banco (ver core/conciliacao.py),
+        então o número de consultas não cresce com o tamanho do recebimento.
         """
-        from .models import Material # Importação local para evitar importação circular
-
-        # 1. Agrupar os dados de cada fonte por material.
-        itens_plano = {item.material.id: item.quantidade_prevista for item in self.plano_compra.itens.all()}
-        itens_nf = {item.material.id: item.quantidade for item in self.nota_fiscal.itens_nf.all()}
-        itens_recebidos = {item.material.id: item.quantidade_contada for item in self.itens_recebidos.all()}
-
-        # 2. Obter a lista de todos os materiais únicos e buscar seus objetos.
-        todos_materiais_ids = set(itens_plano.keys()) | set(itens_nf.keys()) | set(itens_recebidos.keys())
-        materiais_obj = {m.id: m for m in Material.objects.filter(id__in=todos_materiais_ids)}
-
-        # 3. Iterar sobre cada material e comparar as quantidades.
-        resultado_conciliacao = []
-        for material_id in todos_materiais_ids:
-            material = materiais_obj.get(material_id)
-            
-            # Usamos .get(chave, 0) para retornar 0 se o material não existir em uma das fontes.
-            qtd_plano = itens_plano.get(material_id, 0)
-            qtd_nf = itens_nf.get(material_id, 0)
-            qtd_recebida = itens_recebidos.get(material_id, 0)
-
-            # Se tudo bate, não há divergência para este item.
-            if qtd_plano == qtd_nf == qtd_recebida:
-                continue # Pula para o próximo material
-
-            # Se chegamos aqui, há uma divergência. Vamos registrá-la.
-            divergencia = {
-                'material_codigo': material.codigo_interno,
-                'material_descricao': material.descricao,
-                'qtd_plano': qtd_plano,
-                'qtd_nf': qtd_nf,
-                'qtd_recebida': qtd_recebida,
-                'tipo_divergencia': [] # Uma lista para armazenar os problemas
-            }
-
-            # Lógica para identificar os tipos de divergência
-            if qtd_recebida > qtd_nf:
-                divergencia['tipo_divergencia'].append('Recebido a mais que a NF')
-            elif qtd_recebida < qtd_nf:
-                divergencia['tipo_divergencia'].append('Recebido a menos que a NF')
-
-            if qtd_nf != qtd_plano:
-                divergencia['tipo_divergencia'].append('NF diferente do Plano de Compra')
-            
-            if qtd_recebida > 0 and qtd_plano == 0:
-                 divergencia['tipo_divergencia'].append('Item não consta no Plano de Compra')
-
-            resultado_conciliacao.append(divergencia)
-
-        return resultado_conciliacao
+        from .conciliacao import conciliar_recebimento # Importação local para evitar importação circular
+
+        return conciliar_recebimento(self.pk)
 
 class ItemRecebido(models.Model):
     recebimento = models.ForeignKey(Recebimento, on_delete=models.CASCADE, related_name="itens_recebidos")
     material = models.ForeignKey(Material, on_delete=models.PROTECT)
     quantidade_contada = models.DecimalField(max_digits=10, decimal_places=2)
+    cor = models.CharField(max_length=50, blank=True, null=True)
+    grade_numeracao = models.JSONField(blank=True, null=True, verbose_name="Grade de Numeração")
+    # Usado nos ETags (core/condicional.py)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
     
     def __str__(self):
         return f"{self.quantidade_contada} x {self.material.codigo_interno} no recebimento {self.recebimento.id}"
@@ -191,6 +207,49 @@ class ItemRecebido(models.Model):
     class Meta:
         verbose_name = "Item Recebido"
         verbose_name_plural = "Itens Recebidos"
+        indexes = [
+            GinIndex(fields=['grade_numeracao'], name='itemrecebido_grade_gin_idx'),
+            models.Index(fields=['updated_at'], name='itemrecebido_updated_idx'),
+        ]
+
+class ConciliacaoItem(models.Model):
+    """ Snapshot persistido da conciliação de um recebimento, com uma linha por material. """
+    recebimento = models.ForeignKey(Recebimento, on_delete=models.CASCADE, related_name="conciliacao_itens")
+    material = models.ForeignKey(Material, on_delete=models.CASCADE)
+    qtd_plano = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Qtd. no Plano")
+    qtd_nf = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Qtd. na NF")
+    qtd_recebida = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Qtd. Recebida")
+    divergente = models.BooleanField(default=False)
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+
+    def __str__(self):
+        return f"Conciliação do material {self.material_id} no recebimento {self.recebimento_id}"
+
+    class Meta:
+        verbose_name = "Item de Conciliação"
+        verbose_name_plural = "Itens de Conciliação"
+        unique_together = ('recebimento', 'material')
+        indexes = [
+            models.Index(fields=['recebimento', 'divergente'], name='conciliacao_receb_diverg_idx'),
+        ]
+
+class ProgressoPlanoMaterial(models.Model):
+    """
+    Total recebido de cada material de um plano de compra, somando todos os seus
+    recebimentos. Mantido de forma incremental (ver core/progresso.py).
+    """
+    plano_compra = models.ForeignKey(PlanoCompra, on_delete=models.CASCADE, related_name="progresso")
+    material = models.ForeignKey(Material, on_delete=models.CASCADE)
+    quantidade_recebida = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Qtd. Recebida")
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+
+    def __str__(self):
+        return f"{self.quantidade_recebida} do material {self.material_id} no plano {self.plano_compra_id}"
+
+    class Meta:
+        verbose_name = "Progresso do Plano de Compra"
+        verbose_name_plural = "Progresso dos Planos de Compra"
+        unique_together = ('plano_compra', 'material')
 
 class Defeito(BaseModel):
     """ Um catálogo dos possíveis tipos de defeito que podem ser encontrados. """
@@ -224,6 +283,10 @@ class InspecaoQualidade(BaseModel):
     class Meta:
         verbose_name = "Inspeção de Qualidade"
         verbose_name_plural = "Inspeções de Qualidade"
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='inspecao_created_id_idx'),
+            models.Index(fields=['updated_at'], name='inspecao_updated_idx'),
+        ]
 
 
 class ItemInspecionadoDefeito(BaseModel):
@@ -237,4 +300,142 @@ class ItemInspecionadoDefeito(BaseModel):
 
     class Meta:
         verbose_name = "Defeito de Item Inspecionado"
-        verbose_name_plural = "Defeitos de Itens Inspecionados"
\ No newline at end of file
+        verbose_name_plural = "Defeitos de Itens Inspecionados"
+        indexes = [
+            models.Index(fields=['updated_at'], name='itemdefeito_updated_idx'),
+        ]
+
+
+class FatoDefeito(models.Model):
+    """
+    Cópia desnormalizada de cada ItemInspecionadoDefeito com as dimensões já
+    resolvidas (defeito, material, fornecedor e data do recebimento), para as
+    análises de Pareto sem o JOIN de cinco tabelas (ver core/analise_defeitos.py).
+    """
+    item_defeito = models.OneToOneField(
+        ItemInspecionadoDefeito, on_delete=models.CASCADE, primary_key=True, related_name="fato"
+    )
+    defeito = models.ForeignKey(Defeito, on_delete=models.CASCADE)
+    material = models.ForeignKey(Material, on_delete=models.CASCADE)
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE)
+    recebimento = models.ForeignKey(Recebimento, on_delete=models.CASCADE)
+    data_recebimento = models.DateField(verbose_name="Data do Recebimento")
+    quantidade = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Quantidade com Defeito")
+
+    def __str__(self):
+        return f"{self.quantidade} x defeito {self.defeito_id} no material {self.material_id}"
+
+    class Meta:
+        verbose_name = "Fato de Defeito"
+        verbose_name_plural = "Fatos de Defeito"
+        indexes = [
+            models.Index(fields=['data_recebimento'], name='fatodefeito_data_idx'),
+            models.Index(fields=['fornecedor', 'data_recebimento'], name='fatodefeito_fornec_data_idx'),
+            models.Index(fields=['material', 'data_recebimento'], name='fatodefeito_material_data_idx'),
+            models.Index(fields=['defeito', 'data_recebimento'], name='fatodefeito_defeito_data_idx'),
+        ]
+
+
+class ScorecardFornecedorDia(models.Model):
+    """
+    Indicadores de um fornecedor em um dia (data do recebimento), pré-agregados
+    para que qualquer período seja respondido somando poucas linhas. Todos os
+    campos são somas, nunca percentuais (ver core/scorecard.py).
+    """
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, related_name="scorecard_diario")
+    dia = models.DateField(verbose_name="Dia")
+    recebimentos = models.PositiveIntegerField(default=0)
+    recebimentos_no_prazo = models.PositiveIntegerField(default=0, verbose_name="Recebimentos no Prazo")
+    qtd_prevista = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name="Qtd. Prevista")
+    qtd_atendida = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name="Qtd. Atendida")
+    linhas_nf = models.PositiveIntegerField(default=0, verbose_name="Linhas Conferidas (Plano x NF)")
+    linhas_nf_conformes = models.PositiveIntegerField(default=0, verbose_name="Linhas da NF Iguais ao Plano")
+    qtd_inspecionada = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name="Qtd. Inspecionada")
+    qtd_defeituosa = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name="Qtd. com Defeito")
+
+    def __str__(self):
+        return f"Scorecard do fornecedor {self.fornecedor_id} em {self.dia}"
+
+    class Meta:
+        verbose_name = "Scorecard Diário do Fornecedor"
+        verbose_name_plural = "Scorecards Diários dos Fornecedores"
+        unique_together = ('fornecedor', 'dia')
+        indexes = [
+            # Ranking por período: varre apenas os dias do intervalo
+            models.Index(fields=['dia', 'fornecedor'], name='scorecard_dia_fornecedor_idx'),
+        ]
+
+
+class ScorecardDiaPendente(models.Model):
+    """
+    Par (fornecedor, dia) a recalcular na próxima atualização do scorecard por
+    causa de uma exclusão, que não deixa updated_at para a marca encontrar.
+    """
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, related_name="+")
+    dia = models.DateField(verbose_name="Dia")
+
+    def __str__(self):
+        return f"Scorecard pendente do fornecedor {self.fornecedor_id} em {self.dia}"
+
+    class Meta:
+        verbose_name = "Dia Pendente do Scorecard"
+        verbose_name_plural = "Dias Pendentes do Scorecard"
+        unique_together = ('fornecedor', 'dia')
+
+
+class MarcaAtualizacao(models.Model):
+    """ Até quando um processamento incremental (ex.: o scorecard) já foi aplicado. """
+    nome = models.CharField(max_length=50, unique=True)
+    atualizado_ate = models.DateTimeField(verbose_name="Atualizado Até")
+
+    def __str__(self):
+        return f"{self.nome}: {self.atualizado_ate}"
+
+    class Meta:
+        verbose_name = "Marca de Atualização"
+        verbose_name_plural = "Marcas de Atualização"
+
+
+class Job(BaseModel):
+    """
+    Tarefa executada em segundo plano pelos workers (manage.py zenite_worker),
+    com tentativas, progresso e resultado (ver core/jobs.py).
+    """
+    PENDENTE = 'pendente'
+    EXECUTANDO = 'executando'
+    CONCLUIDO = 'concluido'
+    FALHOU = 'falhou'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (EXECUTANDO, 'Executando'),
+        (CONCLUIDO, 'Concluído'),
+        (FALHOU, 'Falhou'),
+    ]
+    tipo = models.CharField(max_length=50, verbose_name="Tipo")
+    parametros = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name="Parâmetros")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDENTE)
+    tentativas = models.PositiveIntegerField(default=0)
+    max_tentativas = models.PositiveIntegerField(default=3, verbose_name="Máximo de Tentativas")
+    executar_apos = models.DateTimeField(default=timezone.now, verbose_name="Executar Após")
+    progresso = models.PositiveSmallIntegerField(default=0, verbose_name="Progresso (%)")
+    mensagem = models.CharField(max_length=255, blank=True, default='')
+    # Codificado como as respostas da API, para o resultado ser igual ao da execução síncrona
+    resultado = models.JSONField(null=True, blank=True, encoder=JSONEncoder)
+    erro = models.TextField(blank=True, default='')
+    criado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    iniciado_em = models.DateTimeField(null=True, blank=True, verbose_name="Iniciado em")
+    concluido_em = models.DateTimeField(null=True, blank=True, verbose_name="Concluído em")
+    batimento_em = models.DateTimeField(null=True, blank=True, verbose_name="Último Sinal do Worker")
+
+    def __str__(self):
+        return f"Job {self.id} ({self.tipo}) - {self.status}"
+
+    class Meta:
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+        indexes = [
+            # Fila: próximos pendentes e execuções sem sinal do worker
+            models.Index(fields=['status', 'executar_apos'], name='job_status_executar_idx'),
+            models.Index(fields=['-created_at', '-id'], name='job_created_id_idx'),
+        ]
@@ -0,0 +1,225 @@
+# core/nfe.py
+"""
+Importação de NF-e a partir do XML.
+
+A leitura é feita em streaming (iterparse), retirando da árvore cada elemento
+assim que ele é processado, então o consumo de memória não depende do tamanho
+da nota.
+A gravação recebe um lote de notas já lidas e resolve fornecedores (CNPJ) e
+materiais (cProd -> Material.codigo_interno) com uma consulta cada, antes de
+gravar notas e itens em lote.
+"""
+import os
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from xml.etree.ElementTree import ParseError, iterparse
+
+from django.db import transaction
+
+from .models import Fornecedor, ItemNotaFiscal, Material, NotaFiscal, Recebimento
+from .signals import adiar_conciliacao, registrar_alteracao_conciliacao
+
+
+CENTAVOS = Decimal('0.01')
+
+
+class ErroNFe(Exception):
+    """ XML que não pôde ser lido como uma NF-e. """
+
+
+def _nome(elemento):
+    """ Nome da tag sem o namespace ({http://www.portalfiscal.inf.br/nfe}det -> det). """
+    return elemento.tag.rsplit('}', 1)[-1]
+
+
+def _filho(elemento, nome):
+    for filho in elemento:
+        if _nome(filho) == nome:
+            return (filho.text or '').strip()
+    return ''
+
+
+def _decimal(valor, campo):
+    try:
+        return Decimal(valor).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError):
+        raise ErroNFe(f"Valor inválido em {campo}: {valor!r}.")
+
+
+def ler_nfe(arquivo):
+    """
+    Lê uma NF-e (ou nfeProc) e devolve um dicionário com numero, cnpj_emitente,
+    data_emissao, valor_total e itens (codigo, quantidade, valor_unitario).
+    `arquivo` pode ser um caminho ou um objeto de arquivo binário.
+    """
+    nota = {'numero': '', 'cnpj_emitente': '', 'data_emissao': '', 'valor_total': None, 'itens': []}
+    # Ancestrais do elemento corrente: o ElementTree da stdlib não tem getparent()
+    pilha = []
+    try:
+        for evento, elemento in iterparse(arquivo, events=('start', 'end')):
+            if evento == 'start':
+                pilha.append(elemento)
+                continue
+            pilha.pop()
+            nome = _nome(elemento)
+            if nome == 'ide':
+                nota['numero'] = _filho(elemento, 'nNF')
+                # dhEmi (versão 3.10+) vem com hora e fuso; dEmi (versão 2.00) só com a data
+                nota['data_emissao'] = (_filho(elemento, 'dhEmi') or _filho(elemento, 'dEmi'))[:10]
+            elif nome == 'emit':
+                nota['cnpj_emitente'] = _filho(elemento, 'CNPJ')
+            elif nome == 'prod':
+                nota['itens'].append({
+                    'codigo': _filho(elemento, 'cProd'),
+                    'quantidade': _decimal(_filho(elemento, 'qCom'), 'qCom'),
+                    'valor_unitario': _decimal(_filho(elemento, 'vUnCom'), 'vUnCom'),
+                })
+            elif nome == 'ICMSTot':
+                nota['valor_total'] = _decimal(_filho(elemento, 'vNF'), 'vNF')
+            elif nome not in ('det', 'total'):
+                continue
+            # Já processado: retira o elemento do pai. Só o clear() deixaria um nó
+            # vazio por <det> pendurado no infNFe, crescendo com o tamanho da nota.
+            if pilha:
+                pilha[-1].remove(elemento)
+            else:
+                elemento.clear()
+    except ParseError as erro:
+        raise ErroNFe(f"XML inválido: {erro}.")
+
+    faltando = [campo for campo in ('numero', 'cnpj_emitente', 'data_emissao') if not nota[campo]]
+    if nota['valor_total'] is None:
+        faltando.append('valor_total')
+    if faltando:
+        raise ErroNFe(f"Campos obrigatórios ausentes na NF-e: {', '.join(faltando)}.")
+    try:
+        nota['data_emissao'] = date.fromisoformat(nota['data_emissao'])
+    except ValueError:
+        raise ErroNFe(f"Data de emissão inválida: {nota['data_emissao']!r}.")
+    return nota
+
+
+def importar_notas(notas):
+    """
+    Grava um lote de notas lidas por `ler_nfe`. Notas já existentes (mesmo número
+    e fornecedor) são atualizadas e têm os itens substituídos.
+
+    Devolve uma lista, na mesma ordem de `notas`, com o resultado de cada uma:
+    {'numero', 'cnpj_emitente', 'status': 'criada'|'atualizada'|'ignorada'|'erro', 'nota_fiscal_id', 'itens', 'erros'}.
+    """
+    # 1. Fornecedores e materiais do lote inteiro, com uma consulta cada
+    fornecedores = dict(
+        Fornecedor.objects.filter(cnpj__in={nota['cnpj_emitente'] for nota in notas}).values_list('cnpj', 'id')
+    )
+    codigos = {item['codigo'] for nota in notas for item in nota['itens']}
+    materiais = dict(Material.objects.filter(codigo_interno__in=codigos).values_list('codigo_interno', 'id'))
+
+    # 2. Valida cada nota; no lote, a última ocorrência de (numero, fornecedor) prevalece
+    resultados = []
+    validas = {}
+    for nota in notas:
+        resultado = {
+            'numero': nota['numero'], 'cnpj_emitente': nota['cnpj_emitente'],
+            'status': 'erro', 'nota_fiscal_id': None, 'itens': len(nota['itens']), 'erros': [],
+        }
+        resultados.append(resultado)
+        fornecedor_id = fornecedores.get(nota['cnpj_emitente'])
+        if fornecedor_id is None:
+            resultado['erros'].append(f"Fornecedor com CNPJ {nota['cnpj_emitente']} não cadastrado.")
+        desconhecidos = sorted({item['codigo'] for item in nota['itens']} - materiais.keys())
+        if desconhecidos:
+            resultado['erros'].append(f"Materiais não cadastrados: {', '.join(desconhecidos)}.")
+        if resultado['erros']:
+            continue
+        chave = (nota['numero'], fornecedor_id)
+        if chave in validas:
+            anterior = validas[chave][1]
+            anterior['status'] = 'ignorada'
+            anterior['erros'].append("Nota repetida no lote; prevaleceu a última ocorrência.")
+        validas[chave] = (nota, resultado)
+
+    if not validas:
+        return resultados
+
+    with transaction.atomic(), adiar_conciliacao():
+        # 3. Upsert das notas pela chave única (numero, fornecedor)
+        existentes = set(
+            NotaFiscal.objects.filter(
+                numero__in={numero for numero, _ in validas}, fornecedor_id__in={f for _, f in validas}
+            ).values_list('numero', 'fornecedor_id')
+        )
+        objetos = [
+            NotaFiscal(
+                numero=nota['numero'], fornecedor_id=fornecedor_id,
+                data_emissao=nota['data_emissao'], valor_total=nota['valor_total'],
+            )
+            for (_, fornecedor_id), (nota, _) in validas.items()
+        ]
+        NotaFiscal.objects.bulk_create(
+            objetos, update_conflicts=True, unique_fields=['numero', 'fornecedor'],
+            update_fields=['data_emissao', 'valor_total', 'updated_at'],
+        )
+
+        # 4. Substitui os itens das notas atualizadas e grava os novos em lote
+        nota_ids = [objeto.pk for objeto in objetos]
+        # Exclusão com signals: dentro do adiar_conciliacao eles só acumulam as notas
+        # e os materiais dos itens antigos, sem consultas por item; o snapshot e o
+        # scorecard são atualizados uma vez ao final do bloco.
+        ItemNotaFiscal.objects.filter(nota_fiscal_id__in=nota_ids).delete()
+        materiais_afetados = set()
+
+        itens = []
+        for objeto, (chave, (nota, resultado)) in zip(objetos, validas.items()):
+            resultado['status'] = 'atualizada' if chave in existentes else 'criada'
+            resultado['nota_fiscal_id'] = objeto.pk
+            for item in nota['itens']:
+                material_id = materiais[item['codigo']]
+                materiais_afetados.add(material_id)
+                itens.append(ItemNotaFiscal(
+                    nota_fiscal_id=objeto.pk, material_id=material_id,
+                    quantidade=item['quantidade'], valor_unitario=item['valor_unitario'],
+                ))
+        ItemNotaFiscal.objects.bulk_create(itens, batch_size=2000)
+
+        # 5. Recebimentos já conciliados que usam estas notas
+        recebimentos = Recebimento.objects.filter(
+            nota_fiscal_id__in=nota_ids, conciliacao_atualizada_em__isnull=False
+        ).values_list('id', flat=True)
+        registrar_alteracao_conciliacao(recebimentos, materiais_afetados)
+
+    return resultados
+
+
+def importar_xmls(arquivos):
+    """
+    Lê e grava os XMLs enviados (arquivos abertos, com `name`) e guarda cada XML
+    original junto da sua nota. Arquivos inválidos não impedem os demais.
+
+    Devolve o resultado de cada arquivo, na ordem recebida: o de `importar_notas`
+    com a chave 'arquivo', ou {'arquivo', 'status': 'erro', 'erros'}.
+    """
+    # 1. Lê cada XML em streaming
+    notas, lidos, resultados = [], [], []
+    for arquivo in arquivos:
+        try:
+            notas.append(ler_nfe(arquivo))
+            lidos.append(arquivo)
+            resultados.append(None)
+        except ErroNFe as erro:
+            resultados.append({'arquivo': os.path.basename(arquivo.name), 'status': 'erro', 'erros': [str(erro)]})
+
+    # 2. Grava todas as notas válidas de uma vez
+    importadas = iter(zip(lidos, importar_notas(notas)))
+    for posicao, resultado in enumerate(resultados):
+        if resultado is not None:
+            continue
+        arquivo, resultado = next(importadas)
+        nome = os.path.basename(arquivo.name)
+        resultados[posicao] = {'arquivo': nome, **resultado}
+        if resultado['nota_fiscal_id'] and resultado['status'] != 'ignorada':
+            # 3. Guarda o XML original junto da nota
+            arquivo.seek(0)
+            nota = NotaFiscal(pk=resultado['nota_fiscal_id'])
+            nota.arquivo_xml.save(nome, arquivo, save=False)
+            NotaFiscal.objects.filter(pk=nota.pk).update(arquivo_xml=nota.arquivo_xml.name)
+    return resultados
@@ -0,0 +1,159 @@
+# core/nfe_lote.py
+"""
+Importação em lote de NF-e (arquivos ZIP ou diretórios com milhares de XMLs).
+
+A leitura dos XMLs é distribuída entre vários processos; o processo atual é o
+único que grava, um lote de notas por transação (ver core/nfe.py). Notas já
+cadastradas (mesmo número e CNPJ do fornecedor) são puladas sem ir ao banco,
+usando um conjunto de chaves carregado uma vez no início.
+"""
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections
+
+from .models import NotaFiscal
+from .nfe import ErroNFe, importar_notas, ler_nfe
+from .processos import inicializar_worker
+
+
+def arquivos_xml(origem):
+    """
+    Gera (nome, dados) para cada XML da origem: um ZIP (caminho ou arquivo aberto)
+    ou um diretório. `dados` são os bytes do XML (ZIP) ou o caminho do arquivo (diretório).
+    """
+    if isinstance(origem, (str, os.PathLike)) and os.path.isdir(origem):
+        for raiz, _, nomes in os.walk(origem):
+            for nome in sorted(nomes):
+                if nome.lower().endswith('.xml'):
+                    caminho = os.path.join(raiz, nome)
+                    yield os.path.relpath(caminho, origem), caminho
+        return
+
+    with zipfile.ZipFile(origem) as arquivo_zip:
+        for info in arquivo_zip.infolist():
+            if not info.is_dir() and info.filename.lower().endswith('.xml'):
+                yield info.filename, arquivo_zip.read(info)
+
+
+def ler_arquivo(nome, dados):
+    """ Executado nos workers: devolve (nome, nota, erro), com apenas um de nota/erro preenchido. """
+    try:
+        nota = ler_nfe(io.BytesIO(dados) if isinstance(dados, bytes) else dados)
+        return nome, nota, None
+    except (ErroNFe, OSError) as erro:
+        return nome, None, str(erro)
+
+
+def _ler_lote(lote):
+    return [ler_arquivo(nome, dados) for nome, dados in lote]
+
+
+def _agrupar(iteravel, tamanho):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def chaves_existentes():
+    """ Conjunto (numero, cnpj do fornecedor) de todas as notas já cadastradas. """
+    return set(NotaFiscal.objects.values_list('numero', 'fornecedor__cnpj'))
+
+
+def _ler_em_paralelo(lotes, workers):
+    """
+    Gera os lotes já lidos, na ordem original. Mantém no máximo `workers` lotes
+    em leitura ao mesmo tempo, para não carregar o ZIP inteiro na memória.
+    """
+    if workers <= 1:
+        for lote in lotes:
+            yield _ler_lote(lote)
+        return
+
+    # A conexão do processo pai não pode ser compartilhada com os filhos.
+    connections.close_all()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=inicializar_worker)
+    try:
+        em_leitura = []
+        for lote in lotes:
+            em_leitura.append(executor.submit(_ler_lote, lote))
+            if len(em_leitura) > workers:
+                yield em_leitura.pop(0).result()
+        for futuro in em_leitura:
+            yield futuro.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def importar_arquivos(origem, workers=1, tamanho_lote=200):
+    """
+    Importa os XMLs da origem e gera, para cada lote gravado, a lista de
+    resultados por arquivo: {'arquivo', 'status', 'numero', 'cnpj_emitente',
+    'nota_fiscal_id', 'itens', 'erros'}. O status é 'criada', 'duplicada',
+    'ignorada' ou 'erro'.
+    """
+    # 1. Chaves já cadastradas, carregadas uma única vez
+    existentes = chaves_existentes()
+
+    for lidos in _ler_em_paralelo(_agrupar(arquivos_xml(origem), tamanho_lote), workers):
+        resultados, notas, posicoes = [], [], []
+        for nome, nota, erro in lidos:
+            if erro is not None:
+                resultados.append({'arquivo': nome, 'status': 'erro', 'erros': [erro]})
+                continue
+            chave = (nota['numero'], nota['cnpj_emitente'])
+            if chave in existentes:
+                # 2. Duplicada (no banco ou em um arquivo anterior): pulada sem consulta
+                resultados.append({
+                    'arquivo': nome, 'status': 'duplicada', 'numero': nota['numero'],
+                    'cnpj_emitente': nota['cnpj_emitente'], 'nota_fiscal_id': None,
+                    'itens': len(nota['itens']), 'erros': [],
+                })
+                continue
+            notas.append(nota)
+            posicoes.append(len(resultados))
+            resultados.append(None)
+
+        # 3. Grava o lote em uma transação
+        if notas:
+            for posicao, resultado in zip(posicoes, importar_notas(notas)):
+                resultados[posicao] = {'arquivo': lidos[posicao][0], **resultado}
+                if resultado['status'] in ('criada', 'atualizada'):
+                    existentes.add((resultado['numero'], resultado['cnpj_emitente']))
+        yield resultados
+
+
+class ResumoImportacao:
+    """ Contadores da importação e as taxas de arquivos/s e linhas/s. """
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.por_status = {}
+        self.arquivos = 0
+        self.linhas = 0
+
+    def registrar(self, resultados):
+        for resultado in resultados:
+            self.arquivos += 1
+            self.por_status[resultado['status']] = self.por_status.get(resultado['status'], 0) + 1
+            if resultado['status'] in ('criada', 'atualizada'):
+                self.linhas += resultado['itens']
+
+    def como_dict(self):
+        decorrido = max(time.monotonic() - self.inicio, 1e-6)
+        return {
+            'arquivos': self.arquivos,
+            **self.por_status,
+            'linhas': self.linhas,
+            'segundos': round(decorrido, 3),
+            'arquivos_por_segundo': round(self.arquivos / decorrido, 1),
+            'linhas_por_segundo': round(self.linhas / decorrido, 1),
+        }
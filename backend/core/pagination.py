@@ -0,0 +1,183 @@
+# core/pagination.py
+"""
+Paginação por cursor (keyset) para as listagens da API.
+
+Em vez de OFFSET, cada página continua a partir dos valores da última linha
+da página anterior (ex.: data_recebimento e id), o que permite ao banco usar
+o índice composto da ordenação e faz a página 1000 custar o mesmo que a primeira.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    A ordenação vem do atributo `ordering` da view e deve terminar em um
+    campo único (normalmente o id), usado como critério de desempate.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-id',)
+    invalid_cursor_message = 'Cursor inválido.'
+
+    @property
+    def page_size(self):
+        return getattr(settings, 'PAGINACAO_PAGE_SIZE', 50)
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'PAGINACAO_MAX_PAGE_SIZE', 500)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._concluir(list(self._fatiar(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """ Igual a paginate_queryset, com o ORM assíncrono (ver core/views_async.py). """
+        return self._concluir([objeto async for objeto in self._fatiar(queryset, request, view)])
+
+    def _fatiar(self, queryset, request, view):
+        """ Monta (sem executar) a consulta da página pedida. """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(getattr(view, 'ordering', None) or self.ordering)
+        self.page_size_atual = self.get_page_size(request)
+
+        posicao, reverso = self.decode_cursor(request)
+
+        # 1. Ordena (invertendo a ordenação quando voltamos uma página)
+        ordenacao = self._inverter(self.ordering) if reverso else self.ordering
+        queryset = queryset.order_by(*ordenacao)
+
+        # 2. Continua a partir da posição do cursor, sem OFFSET
+        if posicao is not None:
+            try:
+                queryset = queryset.filter(self._filtro_keyset(ordenacao, posicao))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # 3. Busca uma linha a mais para saber se existe outra página
+        self.reverso = reverso
+        self.posicao = posicao
+        return queryset[:self.page_size_atual + 1]
+
+    def _concluir(self, resultados):
+        reverso, posicao = self.reverso, self.posicao
+        ha_mais = len(resultados) > self.page_size_atual
+        resultados = resultados[:self.page_size_atual]
+
+        if reverso:
+            resultados.reverse()
+            self.tem_proxima, self.tem_anterior = True, ha_mais
+        else:
+            self.tem_proxima, self.tem_anterior = ha_mais, posicao is not None
+
+        self.page = resultados
+        return resultados
+
+    def get_page_size(self, request):
+        valor = request.query_params.get(self.page_size_query_param)
+        if valor:
+            try:
+                tamanho = int(valor)
+            except ValueError:
+                tamanho = 0
+            if tamanho > 0:
+                return min(tamanho, self.max_page_size)
+        return self.page_size
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.tem_proxima or not self.page:
+            return None
+        return self.encode_cursor(self._posicao(self.page[-1]), reverso=False)
+
+    def get_previous_link(self):
+        if not self.tem_anterior:
+            return None
+        if not self.page:
+            # Página vazia depois do fim: volta para o início
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self._posicao(self.page[0]), reverso=True)
+
+    # -------------------------------------------------------------------------
+    # Cursor
+    # -------------------------------------------------------------------------
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            dados = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            posicao = dados['p']
+            reverso = bool(dados.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(posicao, list) or len(posicao) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return posicao, reverso
+
+    def encode_cursor(self, posicao, reverso):
+        dados = json.dumps({'p': posicao, 'r': int(reverso)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(dados.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    # -------------------------------------------------------------------------
+    # Auxiliares
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _inverter(ordenacao):
+        return tuple(campo[1:] if campo.startswith('-') else f'-{campo}' for campo in ordenacao)
+
+    def _posicao(self, objeto):
+        """ Valores dos campos de ordenação do objeto, em formato serializável. """
+        posicao = []
+        for campo in self.ordering:
+            valor = getattr(objeto, campo.lstrip('-'))
+            posicao.append(valor.isoformat() if hasattr(valor, 'isoformat') else valor)
+        return posicao
+
+    @staticmethod
+    def _filtro_keyset(ordenacao, posicao):
+        """
+        Monta (a < x) OR (a = x AND b < y) ..., respeitando a direção de cada campo.
+
+        O limite redundante "a <= x" na frente permite ao planner do PostgreSQL
+        transformar o filtro em uma varredura de intervalo no índice composto.
+        """
+        primeiro = ordenacao[0]
+        limite = 'lte' if primeiro.startswith('-') else 'gte'
+        filtro = Q()
+        for indice, campo in enumerate(ordenacao):
+            nome = campo.lstrip('-')
+            operador = 'lt' if campo.startswith('-') else 'gt'
+            condicao = Q(**{f'{nome}__{operador}': posicao[indice]})
+            for anterior, valor in zip(ordenacao[:indice], posicao[:indice]):
+                condicao &= Q(**{anterior.lstrip('-'): valor})
+            filtro |= condicao
+        return Q(**{f'{primeiro.lstrip("-")}__{limite}': posicao[0]}) & filtro
@@ -1,6 +1,43 @@
 # backend/core/permissions.py
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework import permissions
 
+
+CHAVE_CACHE_GRUPOS = 'zenite:grupos:{}'
+
+
+def grupos_do_usuario(user):
+    """
+    Retorna os nomes dos grupos do usuário.
+
+    O resultado fica guardado no próprio objeto do usuário (vale durante a
+    requisição) e no cache do Django por GRUPOS_CACHE_TTL segundos (vale entre
+    requisições). Alterações em User.groups invalidam o cache (ver core/signals.py);
+    como o CACHES é compartilhado (check core.E002), a invalidação vale para todos
+    os processos. Com GRUPOS_CACHE_TTL = 0 os grupos vêm sempre do banco.
+    """
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    grupos = getattr(user, '_grupos_cache', None)
+    if grupos is None:
+        ttl = getattr(settings, 'GRUPOS_CACHE_TTL', 300)
+        chave = CHAVE_CACHE_GRUPOS.format(user.pk)
+        grupos = cache.get(chave) if ttl else None
+        if grupos is None:
+            grupos = frozenset(user.groups.values_list('name', flat=True))
+            if ttl:
+                cache.set(chave, grupos, ttl)
+        user._grupos_cache = grupos
+    return grupos
+
+
+def invalidar_grupos(user_ids):
+    """ Remove do cache os grupos dos usuários informados. """
+    cache.delete_many([CHAVE_CACHE_GRUPOS.format(user_id) for user_id in user_ids])
+
+
 class IsInGroup(permissions.BasePermission):
     """
     Permissão customizada que permite acesso apenas a usuários
@@ -11,12 +48,13 @@ class IsInGroup(permissions.BasePermission):
 
     def has_permission(self, request, view):
         # Verifica se o usuário está autenticado e pertence a um dos grupos necessários.
+        # Os grupos vêm do cache, sem ir ao banco a cada requisição.
         return (
             request.user and
             request.user.is_authenticated and
-            request.user.groups.filter(name__in=self.groups).exists()
+            not grupos_do_usuario(request.user).isdisjoint(self.groups)
         )
 
     # Precisamos instanciar a classe na view, então redefinimos o __call__
     def __call__(self):
-        return self
\ No newline at end of file
+        return self
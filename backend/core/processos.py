@@ -0,0 +1,17 @@
+# core/processos.py
+"""
+Apoio aos trabalhos distribuídos entre processos (ProcessPoolExecutor), como a
+conciliação em lote e a importação de NF-e em lote.
+"""
+from django.db import connections
+
+
+def inicializar_worker():
+    """ Prepara o processo filho: Django configurado e nenhuma conexão herdada. """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    # Cada worker abre a sua própria conexão na primeira consulta.
+    connections.close_all()
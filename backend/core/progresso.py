@@ -0,0 +1,237 @@
+# core/progresso.py
+"""
+Progresso dos planos de compra.
+
+ProgressoPlanoMaterial guarda o total recebido de cada material de cada plano.
+Em vez de somar todos os ItemRecebido a cada consulta, os totais recebem
+deltas (+/- quantidade) na mesma transação que grava os itens, com um único
+INSERT ... ON CONFLICT DO UPDATE por lote. O status do plano (Aberto, Parcial,
+Concluido) é recalculado a partir desses totais; planos cancelados não mudam.
+
+Dentro de adiar_progresso(), os deltas registrados são acumulados e aplicados
+de uma vez ao final do bloco.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Sum
+
+from .models import ItemPlanoCompra, ItemRecebido, PlanoCompra, ProgressoPlanoMaterial, Recebimento
+
+
+def somar_deltas(destino, plano_compra_id, material_id, quantidade):
+    """ Acumula um delta em um dicionário {(plano, material): quantidade}. """
+    if plano_compra_id is None or material_id is None or not quantidade:
+        return
+    destino[(plano_compra_id, material_id)] = destino.get((plano_compra_id, material_id), Decimal(0)) + quantidade
+
+
+def aplicar_deltas(deltas):
+    """
+    Soma os deltas {(plano_compra_id, material_id): quantidade} aos totais, com
+    uma única consulta, e recalcula o status dos planos afetados.
+    """
+    deltas = {chave: quantidade for chave, quantidade in deltas.items() if quantidade}
+    if not deltas:
+        return
+    tabela = ProgressoPlanoMaterial._meta.db_table
+    valores = ', '.join(['(%s, %s, %s, NOW())'] * len(deltas))
+    parametros = [valor for (plano, material), quantidade in deltas.items() for valor in (plano, material, quantidade)]
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {tabela} (plano_compra_id, material_id, quantidade_recebida, atualizado_em)
+            VALUES {valores}
+            ON CONFLICT (plano_compra_id, material_id) DO UPDATE
+            SET quantidade_recebida = {tabela}.quantidade_recebida + EXCLUDED.quantidade_recebida,
+                atualizado_em = EXCLUDED.atualizado_em
+        """, parametros)
+    atualizar_status_planos({plano for plano, _ in deltas})
+
+
+_estado = threading.local()
+
+
+@contextmanager
+def adiar_progresso():
+    """
+    Acumula os deltas e os planos de registrar_progresso durante o bloco e
+    aplica todos de uma vez ao final.
+    """
+    if getattr(_estado, 'pendentes', None) is not None:
+        # Já estamos dentro de outro bloco adiado; ele fará a atualização.
+        yield
+        return
+
+    _estado.pendentes = pendentes = {'progresso': {}, 'planos': set()}
+    try:
+        yield
+    finally:
+        _estado.pendentes = None
+    aplicar_deltas(pendentes['progresso'])
+    atualizar_status_planos(pendentes['planos'] - {plano for plano, _ in pendentes['progresso']})
+
+
+def registrar_progresso(deltas, planos=()):
+    """
+    Aplica (ou agenda, se estiver adiado) deltas {(plano, material): quantidade}
+    ao progresso e recalcula o status dos planos afetados e dos `planos` informados.
+    """
+    pendentes = getattr(_estado, 'pendentes', None)
+    if pendentes is not None:
+        for (plano_compra_id, material_id), quantidade in deltas.items():
+            somar_deltas(pendentes['progresso'], plano_compra_id, material_id, quantidade)
+        pendentes['planos'] |= set(planos)
+        return
+    aplicar_deltas(deltas)
+    atualizar_status_planos(set(planos) - {plano for plano, _ in deltas})
+
+
+def deltas_de_recebimentos(recebimento_ids, sinal=1):
+    """ Deltas com os itens dos recebimentos informados (sinal -1 para retirá-los). """
+    deltas = {}
+    totais = (
+        ItemRecebido.objects.filter(recebimento_id__in=recebimento_ids)
+        .values_list('recebimento__plano_compra_id', 'material_id')
+        .annotate(total=Sum('quantidade_contada'))
+        .order_by()
+    )
+    for plano_compra_id, material_id, total in totais:
+        somar_deltas(deltas, plano_compra_id, material_id, total * sinal)
+    return deltas
+
+
+def _sql_status(filtrar_planos):
+    plano = PlanoCompra._meta.db_table
+    item_plano = ItemPlanoCompra._meta.db_table
+    progresso = ProgressoPlanoMaterial._meta.db_table
+    filtro = "AND pl.id = ANY(%(planos)s)" if filtrar_planos else ""
+    return f"""
+        WITH previsto AS (
+            SELECT ip.plano_compra_id, ip.material_id, SUM(ip.quantidade_prevista) AS qtd
+            FROM {item_plano} ip
+            JOIN {plano} pl ON pl.id = ip.plano_compra_id
+            WHERE pl.status <> 'Cancelado' {filtro}
+            GROUP BY ip.plano_compra_id, ip.material_id
+        ),
+        situacao AS (
+            SELECT pl.id,
+                   CASE
+                       WHEN EXISTS (SELECT 1 FROM previsto pv WHERE pv.plano_compra_id = pl.id)
+                        AND NOT EXISTS (
+                            SELECT 1 FROM previsto pv
+                            LEFT JOIN {progresso} pr
+                              ON pr.plano_compra_id = pv.plano_compra_id AND pr.material_id = pv.material_id
+                            WHERE pv.plano_compra_id = pl.id AND COALESCE(pr.quantidade_recebida, 0) < pv.qtd
+                        ) THEN 'Concluido'
+                       WHEN EXISTS (
+                            SELECT 1 FROM {progresso} pr WHERE pr.plano_compra_id = pl.id AND pr.quantidade_recebida > 0
+                        ) THEN 'Parcial'
+                       ELSE 'Aberto'
+                   END AS status
+            FROM {plano} pl
+            WHERE pl.status <> 'Cancelado' {filtro}
+        )
+        UPDATE {plano} pl SET status = s.status, updated_at = NOW()
+        FROM situacao s
+        WHERE pl.id = s.id AND pl.status <> s.status
+        RETURNING pl.id, pl.status
+    """
+
+
+def atualizar_status_planos(plano_ids=None):
+    """
+    Recalcula o status dos planos (todos, se `plano_ids` for None) a partir dos
+    totais recebidos. Devolve {plano_id: novo_status} apenas dos que mudaram.
+    """
+    if plano_ids is not None:
+        plano_ids = list(plano_ids)
+        if not plano_ids:
+            return {}
+    with connection.cursor() as cursor:
+        cursor.execute(_sql_status(plano_ids is not None), {'planos': plano_ids})
+        return dict(cursor.fetchall())
+
+
+def reconstruir_progresso(plano_ids=None):
+    """
+    Refaz os totais a partir dos ItemRecebido (todos os planos, se `plano_ids`
+    for None), corrigindo qualquer divergência. Devolve o número de linhas
+    corrigidas (gravadas ou removidas).
+    """
+    if plano_ids is not None:
+        plano_ids = list(plano_ids)
+        if not plano_ids:
+            return 0
+    recebimento = Recebimento._meta.db_table
+    item_recebido = ItemRecebido._meta.db_table
+    progresso = ProgressoPlanoMaterial._meta.db_table
+    filtro_recebimento = "WHERE r.plano_compra_id = ANY(%(planos)s)" if plano_ids is not None else ""
+    filtro_progresso = "AND p.plano_compra_id = ANY(%(planos)s)" if plano_ids is not None else ""
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH correto AS (
+                SELECT r.plano_compra_id, ir.material_id, SUM(ir.quantidade_contada) AS qtd
+                FROM {item_recebido} ir
+                JOIN {recebimento} r ON r.id = ir.recebimento_id
+                {filtro_recebimento}
+                GROUP BY r.plano_compra_id, ir.material_id
+            ),
+            removidos AS (
+                DELETE FROM {progresso} p
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM correto c
+                    WHERE c.plano_compra_id = p.plano_compra_id AND c.material_id = p.material_id
+                ) {filtro_progresso}
+                RETURNING p.quantidade_recebida
+            ),
+            gravados AS (
+                INSERT INTO {progresso} (plano_compra_id, material_id, quantidade_recebida, atualizado_em)
+                SELECT plano_compra_id, material_id, qtd, NOW() FROM correto
+                ON CONFLICT (plano_compra_id, material_id) DO UPDATE
+                SET quantidade_recebida = EXCLUDED.quantidade_recebida, atualizado_em = EXCLUDED.atualizado_em
+                WHERE {progresso}.quantidade_recebida IS DISTINCT FROM EXCLUDED.quantidade_recebida
+                RETURNING 1
+            )
+            -- Linhas zeradas (todos os itens foram removidos) não contam como divergência
+            SELECT (SELECT COUNT(*) FROM removidos WHERE quantidade_recebida <> 0) + (SELECT COUNT(*) FROM gravados)
+        """, {'planos': plano_ids})
+        return cursor.fetchone()[0]
+
+
+def progresso_do_plano(plano):
+    """ Previsto x recebido por material do plano, lido dos totais (sem varrer recebimentos). """
+    materiais = defaultdict(lambda: {'qtd_prevista': Decimal(0), 'qtd_recebida': Decimal(0)})
+    previstos = (
+        ItemPlanoCompra.objects.filter(plano_compra=plano)
+        .values_list('material_id', 'material__codigo_interno', 'material__descricao')
+        .annotate(total=Sum('quantidade_prevista'))
+        .order_by()
+    )
+    for material_id, codigo, descricao, total in previstos:
+        materiais[material_id].update(material_codigo=codigo, material_descricao=descricao, qtd_prevista=total)
+    recebidos = ProgressoPlanoMaterial.objects.filter(plano_compra=plano).values_list(
+        'material_id', 'material__codigo_interno', 'material__descricao', 'quantidade_recebida'
+    )
+    for material_id, codigo, descricao, total in recebidos:
+        materiais[material_id].update(material_codigo=codigo, material_descricao=descricao, qtd_recebida=total)
+
+    itens = []
+    for material_id, dados in sorted(materiais.items(), key=lambda item: item[1]['material_codigo']):
+        percentual = (
+            round(dados['qtd_recebida'] / dados['qtd_prevista'] * 100, 1) if dados['qtd_prevista'] else None
+        )
+        itens.append({'material_id': material_id, **dados, 'percentual': percentual})
+
+    total_previsto = sum(item['qtd_prevista'] for item in itens)
+    total_recebido = sum(min(item['qtd_recebida'], item['qtd_prevista']) for item in itens)
+    return {
+        'plano_compra_id': plano.pk,
+        'status': plano.status,
+        'qtd_prevista': total_previsto,
+        'qtd_recebida': sum(item['qtd_recebida'] for item in itens),
+        'percentual': round(total_recebido / total_previsto * 100, 1) if total_previsto else None,
+        'itens': itens,
+    }
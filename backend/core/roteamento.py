@@ -0,0 +1,198 @@
+# core/roteamento.py
+"""
+Leituras em réplicas do PostgreSQL, sem perder as próprias escritas.
+
+O RoteamentoMiddleware sorteia, para cada requisição GET/HEAD/OPTIONS, uma
+das réplicas de settings.REPLICAS_LEITURA e guarda a escolha em uma
+ContextVar (que acompanha a requisição também nas threads das views
+assíncronas). O RoteadorReplicas manda as leituras do ORM para ela, exceto:
+
+1. dentro de uma transação (a leitura pode depender do que acabou de ser escrito);
+2. depois de uma escrita na mesma requisição;
+3. se o usuário escreveu algo nos últimos REPLICA_JANELA_PRIMARIO segundos
+   (marca no cache do Django, gravada pelo middleware): assim ele nunca vê um
+   recebimento que acabou de criar ainda "atrasado" na réplica;
+4. autenticação, tokens e sessões, que ficam sempre no primário.
+
+Escritas e requisições sem o middleware (comandos, workers) usam o primário.
+Respostas em streaming (exportações, conciliar-lote) geram o conteúdo depois
+que a view retorna: o middleware reativa a escolha da requisição a cada bloco.
+Escritas feitas em escrita_de_manutencao() (ex.: o snapshot da conciliação
+montado em um GET) levam as leituras da requisição ao primário, mas não prendem
+o usuário a ele nas próximas.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+CHAVE_CACHE_PRIMARIO = 'zenite:primario:{}'
+METODOS_LEITURA = ('GET', 'HEAD', 'OPTIONS')
+APPS_NO_PRIMARIO = {'auth', 'authtoken', 'sessions', 'contenttypes'}
+
+_estado = ContextVar('zenite_roteamento', default=None)
+
+
+class EstadoRoteamento:
+    """ Escolha de banco de uma requisição. """
+    __slots__ = ('request', 'replica', 'escreveu', 'usuario_escreveu', 'manutencao', 'usuario_verificado')
+
+    def __init__(self, request, replica):
+        self.request = request
+        self.replica = replica
+        self.escreveu = False
+        # Escritas do usuário (fora de escrita_de_manutencao), que abrem a janela do primário
+        self.usuario_escreveu = False
+        self.manutencao = False
+        self.usuario_verificado = False
+
+    def replica_para_leitura(self):
+        """ A réplica da requisição, ou None se a leitura deve ir ao primário. """
+        if self.replica is None or self.escreveu:
+            return None
+        if not self.usuario_verificado:
+            # O usuário só é conhecido depois da autenticação do DRF (feita no primário)
+            usuario = getattr(self.request, 'user', None)
+            if usuario is not None and usuario.is_authenticated:
+                self.usuario_verificado = True
+                if cache.get(CHAVE_CACHE_PRIMARIO.format(usuario.pk)):
+                    self.replica = None
+        return self.replica
+
+
+def replicas():
+    return getattr(settings, 'REPLICAS_LEITURA', [])
+
+
+@contextmanager
+def escrita_de_manutencao():
+    """
+    Escritas derivadas que a requisição faz por conta própria: as leituras
+    seguintes da requisição vão ao primário (que tem o que acabou de ser
+    gravado), mas o usuário não fica preso a ele por REPLICA_JANELA_PRIMARIO.
+    """
+    estado = _estado.get()
+    if estado is None or estado.manutencao:
+        yield
+        return
+    estado.manutencao = True
+    try:
+        yield
+    finally:
+        estado.manutencao = False
+
+
+def marcar_escrita(usuario):
+    """ As leituras do usuário ficam no primário pelos próximos REPLICA_JANELA_PRIMARIO segundos. """
+    if usuario is not None and usuario.is_authenticated:
+        cache.set(CHAVE_CACHE_PRIMARIO.format(usuario.pk), True, getattr(settings, 'REPLICA_JANELA_PRIMARIO', 10))
+
+
+class RoteadorReplicas:
+    """ Router do Django (settings.DATABASE_ROUTERS). """
+
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        if estado is None or model._meta.app_label in APPS_NO_PRIMARIO:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return estado.replica_para_leitura() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None:
+            estado.escreveu = True
+            estado.usuario_escreveu = estado.usuario_escreveu or not estado.manutencao
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas têm os mesmos dados do primário
+        bancos = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in bancos and obj2._state.db in bancos:
+            return True
+        return None
+
+
+def _em_contexto(estado, conteudo):
+    """ Itera `conteudo` com o roteamento da requisição ativo durante cada bloco. """
+    iterador = iter(conteudo)
+    while True:
+        token = _estado.set(estado)
+        try:
+            parte = next(iterador)
+        except StopIteration:
+            return
+        finally:
+            _estado.reset(token)
+        yield parte
+
+
+async def _em_contexto_assincrono(estado, conteudo):
+    iterador = aiter(conteudo)
+    while True:
+        token = _estado.set(estado)
+        try:
+            parte = await anext(iterador)
+        except StopAsyncIteration:
+            return
+        finally:
+            _estado.reset(token)
+        yield parte
+
+
+class RoteamentoMiddleware:
+    """
+    Escolhe a réplica das leituras de cada requisição e, depois de uma escrita,
+    prende as leituras do usuário ao primário (ver RoteadorReplicas). Fica
+    antes de tudo o que consulta o banco. Funciona em WSGI e ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        estado, token = self._iniciar(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado.reset(token)
+        self._concluir(request, response, estado)
+        return response
+
+    async def __acall__(self, request):
+        estado, token = self._iniciar(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _estado.reset(token)
+        self._concluir(request, response, estado)
+        return response
+
+    def _iniciar(self, request):
+        disponiveis = replicas()
+        replica = random.choice(disponiveis) if disponiveis and request.method in METODOS_LEITURA else None
+        estado = EstadoRoteamento(request, replica)
+        return estado, _estado.set(estado)
+
+    def _concluir(self, request, response, estado):
+        # request.user já é o autenticado pelo DRF
+        if estado.usuario_escreveu or (request.method not in METODOS_LEITURA and response.status_code < 400):
+            marcar_escrita(getattr(request, 'user', None))
+        if response.streaming:
+            conteudo = response.streaming_content
+            response.streaming_content = (
+                _em_contexto_assincrono(estado, conteudo) if response.is_async else _em_contexto(estado, conteudo)
+            )
@@ -0,0 +1,293 @@
+# core/scorecard.py
+"""
+Scorecard dos fornecedores.
+
+Os indicadores (pontualidade, atendimento do plano, acurácia da NF em relação
+ao plano e taxa de defeitos) são pré-agregados por fornecedor e por dia do
+recebimento em ScorecardFornecedorDia. A atualização é incremental: só os
+pares (fornecedor, dia) com recebimentos alterados desde a última marca
+(MarcaAtualizacao) são recalculados. Como a tabela guarda somas, qualquer
+período é respondido somando as linhas dos dias do intervalo.
+
+Alterações são detectadas pelo updated_at de Recebimento, PlanoCompra,
+NotaFiscal, InspecaoQualidade, ItemInspecionadoDefeito e dos itens do plano,
+da NF e do recebimento (pela data dos recebimentos a que pertencem).
+Exclusões não deixam updated_at: os signals gravam o dia afetado em
+ScorecardDiaPendente (registrar_exclusoes), consumido na atualização seguinte.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import (
+    InspecaoQualidade, ItemInspecionadoDefeito, ItemNotaFiscal, ItemPlanoCompra, ItemRecebido,
+    MarcaAtualizacao, NotaFiscal, PlanoCompra, Recebimento, ScorecardDiaPendente, ScorecardFornecedorDia
+)
+
+
+MARCA_SCORECARD = 'scorecard_fornecedor'
+
+# Transações que ainda não tinham sido confirmadas na atualização anterior podem
+# ter updated_at um pouco anterior à marca; a janela de sobreposição as cobre.
+SOBREPOSICAO = timedelta(minutes=5)
+
+CAMPOS_SOMADOS = [
+    'recebimentos', 'recebimentos_no_prazo', 'qtd_prevista', 'qtd_atendida',
+    'linhas_nf', 'linhas_nf_conformes', 'qtd_inspecionada', 'qtd_defeituosa',
+]
+
+INDICADORES = ('pontualidade', 'atendimento', 'acuracia_nf', 'taxa_defeitos')
+
+
+def _tabelas():
+    return {
+        'recebimento': Recebimento._meta.db_table,
+        'plano': PlanoCompra._meta.db_table,
+        'nota': NotaFiscal._meta.db_table,
+        'inspecao': InspecaoQualidade._meta.db_table,
+        'item_defeito': ItemInspecionadoDefeito._meta.db_table,
+        'item_plano': ItemPlanoCompra._meta.db_table,
+        'item_nf': ItemNotaFiscal._meta.db_table,
+        'item_recebido': ItemRecebido._meta.db_table,
+        'scorecard': ScorecardFornecedorDia._meta.db_table,
+        'pendente': ScorecardDiaPendente._meta.db_table,
+    }
+
+
+def _sql_dias_alterados():
+    """ Pares (fornecedor, dia) com algum recebimento alterado desde %(desde)s ou com exclusões pendentes. """
+    return """
+        WITH pendentes AS (
+            -- Consome as exclusões pendentes (só as já confirmadas, visíveis aqui)
+            DELETE FROM {pendente} RETURNING fornecedor_id, dia
+        ),
+        alterados AS (
+            SELECT id AS recebimento_id FROM {recebimento} WHERE updated_at > %(desde)s
+            UNION
+            SELECT r.id FROM {recebimento} r
+            JOIN {plano} pl ON pl.id = r.plano_compra_id WHERE pl.updated_at > %(desde)s
+            UNION
+            SELECT r.id FROM {recebimento} r
+            JOIN {nota} nf ON nf.id = r.nota_fiscal_id WHERE nf.updated_at > %(desde)s
+            UNION
+            SELECT recebimento_id FROM {inspecao} WHERE updated_at > %(desde)s
+            UNION
+            SELECT ir.recebimento_id FROM {item_defeito} d
+            JOIN {item_recebido} ir ON ir.id = d.item_recebido_id WHERE d.updated_at > %(desde)s
+            UNION
+            SELECT recebimento_id FROM {item_recebido} WHERE updated_at > %(desde)s
+            UNION
+            SELECT r.id FROM {recebimento} r
+            JOIN {item_plano} ip ON ip.plano_compra_id = r.plano_compra_id WHERE ip.updated_at > %(desde)s
+            UNION
+            SELECT r.id FROM {recebimento} r
+            JOIN {item_nf} inf ON inf.nota_fiscal_id = r.nota_fiscal_id WHERE inf.updated_at > %(desde)s
+        )
+        SELECT DISTINCT pl.fornecedor_id, (r.data_recebimento AT TIME ZONE %(tz)s)::date
+        FROM alterados a
+        JOIN {recebimento} r ON r.id = a.recebimento_id
+        JOIN {plano} pl ON pl.id = r.plano_compra_id
+        UNION
+        SELECT fornecedor_id, dia FROM pendentes
+    """.format(**_tabelas())
+
+
+def _sql_recalcular(filtrar_dias):
+    """ Recalcula e grava as linhas do scorecard (de todos os dias ou dos pares informados). """
+    filtro = """
+        JOIN unnest(%(fornecedores)s::bigint[], %(dias)s::date[]) AS alvo(fornecedor_id, dia)
+          ON alvo.fornecedor_id = pl.fornecedor_id
+         AND alvo.dia = (r.data_recebimento AT TIME ZONE %(tz)s)::date
+    """ if filtrar_dias else ""
+    return """
+        WITH recebimentos AS (
+            SELECT r.id, r.plano_compra_id, r.nota_fiscal_id, pl.fornecedor_id,
+                   (r.data_recebimento AT TIME ZONE %(tz)s)::date AS dia,
+                   (r.data_recebimento AT TIME ZONE %(tz)s)::date <= pl.data_prevista_entrega AS no_prazo,
+                   EXISTS (SELECT 1 FROM {inspecao} iq WHERE iq.recebimento_id = r.id) AS inspecionado
+            FROM {recebimento} r
+            JOIN {plano} pl ON pl.id = r.plano_compra_id
+            {filtro}
+        ),
+        por_material AS (
+            SELECT u.recebimento_id, u.material_id,
+                   SUM(u.qtd_plano) AS qtd_plano, SUM(u.qtd_nf) AS qtd_nf, SUM(u.qtd_recebida) AS qtd_recebida
+            FROM (
+                SELECT rc.id AS recebimento_id, ip.material_id,
+                       ip.quantidade_prevista AS qtd_plano, 0 AS qtd_nf, 0 AS qtd_recebida
+                FROM recebimentos rc JOIN {item_plano} ip ON ip.plano_compra_id = rc.plano_compra_id
+                UNION ALL
+                SELECT rc.id, inf.material_id, 0, inf.quantidade, 0
+                FROM recebimentos rc JOIN {item_nf} inf ON inf.nota_fiscal_id = rc.nota_fiscal_id
+                UNION ALL
+                SELECT ir.recebimento_id, ir.material_id, 0, 0, ir.quantidade_contada
+                FROM recebimentos rc JOIN {item_recebido} ir ON ir.recebimento_id = rc.id
+            ) u
+            GROUP BY u.recebimento_id, u.material_id
+        ),
+        por_recebimento AS (
+            SELECT rc.id, rc.fornecedor_id, rc.dia, rc.no_prazo, rc.inspecionado,
+                   COALESCE(SUM(pm.qtd_plano), 0) AS qtd_prevista,
+                   COALESCE(SUM(LEAST(pm.qtd_recebida, pm.qtd_plano)), 0) AS qtd_atendida,
+                   COALESCE(SUM(pm.qtd_recebida), 0) AS qtd_recebida,
+                   COUNT(pm.material_id) FILTER (WHERE pm.qtd_plano > 0 OR pm.qtd_nf > 0) AS linhas_nf,
+                   COUNT(pm.material_id) FILTER (WHERE (pm.qtd_plano > 0 OR pm.qtd_nf > 0) AND pm.qtd_nf = pm.qtd_plano) AS linhas_nf_conformes
+            FROM recebimentos rc
+            LEFT JOIN por_material pm ON pm.recebimento_id = rc.id
+            GROUP BY rc.id, rc.fornecedor_id, rc.dia, rc.no_prazo, rc.inspecionado
+        ),
+        defeitos AS (
+            SELECT ir.recebimento_id, SUM(d.quantidade_defeituosa) AS qtd
+            FROM recebimentos rc
+            JOIN {item_recebido} ir ON ir.recebimento_id = rc.id
+            JOIN {item_defeito} d ON d.item_recebido_id = ir.id
+            GROUP BY ir.recebimento_id
+        )
+        INSERT INTO {scorecard} (
+            fornecedor_id, dia, recebimentos, recebimentos_no_prazo, qtd_prevista, qtd_atendida,
+            linhas_nf, linhas_nf_conformes, qtd_inspecionada, qtd_defeituosa
+        )
+        SELECT pr.fornecedor_id, pr.dia, COUNT(*), COUNT(*) FILTER (WHERE pr.no_prazo),
+               SUM(pr.qtd_prevista), SUM(pr.qtd_atendida), SUM(pr.linhas_nf), SUM(pr.linhas_nf_conformes),
+               COALESCE(SUM(pr.qtd_recebida) FILTER (WHERE pr.inspecionado), 0), COALESCE(SUM(df.qtd), 0)
+        FROM por_recebimento pr
+        LEFT JOIN defeitos df ON df.recebimento_id = pr.id
+        GROUP BY pr.fornecedor_id, pr.dia
+    """.format(filtro=filtro, **_tabelas())
+
+
+def atualizar_scorecard(completo=False):
+    """
+    Atualiza o scorecard a partir da última marca (ou inteiro, com `completo`).
+    Devolve o número de pares (fornecedor, dia) recalculados.
+    """
+    agora = timezone.now()
+    parametros = {'tz': settings.TIME_ZONE}
+    with transaction.atomic():
+        # Trava a marca: duas atualizações simultâneas não se sobrepõem
+        marca = MarcaAtualizacao.objects.select_for_update().filter(nome=MARCA_SCORECARD).first()
+        completo = completo or marca is None
+        with connection.cursor() as cursor:
+            if completo:
+                cursor.execute(f"DELETE FROM {ScorecardDiaPendente._meta.db_table}")
+                cursor.execute(f"DELETE FROM {ScorecardFornecedorDia._meta.db_table}")
+                cursor.execute(_sql_recalcular(filtrar_dias=False), parametros)
+                recalculados = cursor.rowcount
+            else:
+                cursor.execute(_sql_dias_alterados(), {**parametros, 'desde': marca.atualizado_ate - SOBREPOSICAO})
+                pares = cursor.fetchall()
+                if pares:
+                    fornecedores = [fornecedor for fornecedor, _ in pares]
+                    dias = [dia for _, dia in pares]
+                    # Pares que ficaram sem recebimentos são removidos e não voltam no INSERT
+                    cursor.execute(f"""
+                        DELETE FROM {ScorecardFornecedorDia._meta.db_table} s
+                        USING unnest(%(fornecedores)s::bigint[], %(dias)s::date[]) AS alvo(fornecedor_id, dia)
+                        WHERE s.fornecedor_id = alvo.fornecedor_id AND s.dia = alvo.dia
+                    """, {'fornecedores': fornecedores, 'dias': dias})
+                    cursor.execute(
+                        _sql_recalcular(filtrar_dias=True),
+                        {**parametros, 'fornecedores': fornecedores, 'dias': dias},
+                    )
+                recalculados = len(pares)
+        MarcaAtualizacao.objects.update_or_create(nome=MARCA_SCORECARD, defaults={'atualizado_ate': agora})
+    return recalculados
+
+
+def registrar_exclusoes(recebimentos=(), planos=(), notas=(), itens_recebidos=()):
+    """
+    Grava em ScorecardDiaPendente os pares (fornecedor, dia) dos recebimentos
+    afetados por uma exclusão: os próprios `recebimentos`, os que usam os
+    `planos` ou as `notas` informados e os dos `itens_recebidos`. Deve rodar
+    antes de os recebimentos sumirem (pre_delete).
+    """
+    parametros = {
+        'recebimentos': list(recebimentos), 'planos': list(planos),
+        'notas': list(notas), 'itens_recebidos': list(itens_recebidos), 'tz': settings.TIME_ZONE,
+    }
+    if not any(parametros[chave] for chave in ('recebimentos', 'planos', 'notas', 'itens_recebidos')):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO {pendente} (fornecedor_id, dia)
+            SELECT DISTINCT pl.fornecedor_id, (r.data_recebimento AT TIME ZONE %(tz)s)::date
+            FROM {recebimento} r
+            JOIN {plano} pl ON pl.id = r.plano_compra_id
+            WHERE r.id = ANY(%(recebimentos)s::bigint[])
+               OR r.plano_compra_id = ANY(%(planos)s::bigint[])
+               OR r.nota_fiscal_id = ANY(%(notas)s::bigint[])
+               OR r.id IN (SELECT recebimento_id FROM {item_recebido} WHERE id = ANY(%(itens_recebidos)s::bigint[]))
+            ON CONFLICT (fornecedor_id, dia) DO NOTHING
+        """.format(**_tabelas()), parametros)
+
+
+def marca_scorecard():
+    return MarcaAtualizacao.objects.filter(nome=MARCA_SCORECARD).values_list('atualizado_ate', flat=True).first()
+
+
+def _indicadores(totais):
+    """ Converte as somas em percentuais (None quando não há base de cálculo). """
+    def percentual(parte, todo):
+        return round(float(parte) / float(todo) * 100, 2) if todo else None
+
+    return {
+        'recebimentos': totais['recebimentos'] or 0,
+        'pontualidade': percentual(totais['recebimentos_no_prazo'], totais['recebimentos']),
+        'atendimento': percentual(totais['qtd_atendida'], totais['qtd_prevista']),
+        'acuracia_nf': percentual(totais['linhas_nf_conformes'], totais['linhas_nf']),
+        'taxa_defeitos': percentual(totais['qtd_defeituosa'], totais['qtd_inspecionada']),
+    }
+
+
+def _no_periodo(queryset, data_inicio, data_fim):
+    if data_inicio:
+        queryset = queryset.filter(dia__gte=data_inicio)
+    if data_fim:
+        queryset = queryset.filter(dia__lte=data_fim)
+    return queryset
+
+
+def scorecard_do_fornecedor(fornecedor_id, data_inicio=None, data_fim=None):
+    """ Indicadores de um fornecedor no período, somando as linhas diárias. """
+    queryset = _no_periodo(ScorecardFornecedorDia.objects.filter(fornecedor_id=fornecedor_id), data_inicio, data_fim)
+    totais = queryset.aggregate(**{campo: Sum(campo) for campo in CAMPOS_SOMADOS})
+    return {
+        'fornecedor_id': fornecedor_id,
+        'data_inicio': data_inicio,
+        'data_fim': data_fim,
+        **_indicadores(totais),
+        'atualizado_ate': marca_scorecard(),
+    }
+
+
+def ranking_fornecedores(data_inicio=None, data_fim=None, ordenar='pontualidade', minimo_recebimentos=1):
+    """
+    Fornecedores com ao menos `minimo_recebimentos` no período, do melhor para o
+    pior no indicador `ordenar` (para taxa_defeitos, menor é melhor).
+    """
+    linhas = (
+        _no_periodo(ScorecardFornecedorDia.objects.all(), data_inicio, data_fim)
+        .values('fornecedor_id', 'fornecedor__razao_social', 'fornecedor__nome_fantasia')
+        .annotate(**{campo: Sum(campo) for campo in CAMPOS_SOMADOS})
+        .filter(recebimentos__gte=minimo_recebimentos)
+        .order_by()
+    )
+    ranking = [
+        {
+            'fornecedor_id': linha['fornecedor_id'],
+            'fornecedor': linha['fornecedor__nome_fantasia'] or linha['fornecedor__razao_social'],
+            **_indicadores(linha),
+        }
+        for linha in linhas
+    ]
+    # Sem base de cálculo (None) vai para o fim, independentemente da direção
+    if ordenar == 'taxa_defeitos':
+        ranking.sort(key=lambda item: (item[ordenar] is None, item[ordenar] or 0))
+    else:
+        ranking.sort(key=lambda item: (item[ordenar] is None, -(item[ordenar] or 0)))
+    for posicao, item in enumerate(ranking, start=1):
+        item['posicao'] = posicao
+    return ranking
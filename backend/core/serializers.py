@@ -1,61 +1,307 @@
+import json
+from decimal import Decimal
+
 from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from .instrumentacao import cronometrar_serializacao
+from .permissions import grupos_do_usuario
+from .analise_defeitos import atualizar_fatos_defeito, invalidar_pareto
+from .progresso import registrar_progresso, somar_deltas
 from .models import (
     PlanoCompra, ItemPlanoCompra, Material, Fornecedor, 
     NotaFiscal, ItemNotaFiscal, Recebimento, ItemRecebido,
-    Defeito, InspecaoQualidade, ItemInspecionadoDefeito
+    Defeito, InspecaoQualidade, ItemInspecionadoDefeito, Job
 )
 
 
-class UserSerializer(serializers.ModelSerializer):
-    groups = serializers.SlugRelatedField(
-        many=True,
-        read_only=True,
-        slug_field='name'
-    )
+def mesclar_itens_por_material(itens):
+    """
+    Soma as quantidades (e as grades) de linhas repetidas do mesmo material e
+    cor, preservando a ordem. Linhas com e sem grade ficam em itens separados:
+    somar a quantidade de uma linha sem grade a um item com grade quebraria a
+    regra de que a grade soma a quantidade.
+    """
+    mesclados = {}
+    for item in itens:
+        chave = (item['material_id'], item.get('cor'), bool(item.get('grade_numeracao')))
+        if chave not in mesclados:
+            mesclados[chave] = dict(item)
+            continue
+        mesclado = mesclados[chave]
+        mesclado['quantidade_contada'] += item['quantidade_contada']
+        if item.get('grade_numeracao'):
+            grade = dict(mesclado.get('grade_numeracao') or {})
+            for numero, quantidade in item['grade_numeracao'].items():
+                grade[numero] = grade.get(numero, 0) + quantidade
+            mesclado['grade_numeracao'] = grade
+    return list(mesclados.values())
+
+
+def validar_grade_numeracao(grade):
+    """ A grade é um objeto {"numeração": quantidade}, com quantidades numéricas não negativas. """
+    if grade is None:
+        return
+    if not isinstance(grade, dict) or not grade:
+        raise serializers.ValidationError('Informe a grade como {"numeração": quantidade}.')
+    invalidas = [
+        numero for numero, quantidade in grade.items()
+        if isinstance(quantidade, bool) or not isinstance(quantidade, (int, float)) or quantidade < 0
+    ]
+    if invalidas:
+        raise serializers.ValidationError(f"Quantidade inválida na grade para: {', '.join(invalidas)}.")
+
+
+class GradeNumeracaoMixin:
+    """ Itens com grade: a soma da grade precisa ser a quantidade do item (`campo_quantidade`). """
+    campo_quantidade = None
+
+    def validate(self, dados):
+        dados = super().validate(dados)
+        grade = dados.get('grade_numeracao')
+        quantidade = dados.get(self.campo_quantidade)
+        if grade and quantidade is not None and sum(Decimal(str(valor)) for valor in grade.values()) != quantidade:
+            raise serializers.ValidationError(
+                {'grade_numeracao': f"A soma da grade deve ser igual a {self.campo_quantidade} ({quantidade})."}
+            )
+        return dados
+
+
+class ItensAReceberField(serializers.Field):
+    """
+    Itens de um novo recebimento: lista de {material_id, quantidade_contada, cor,
+    grade_numeracao}, validada em uma única passada sobre os dicionários. Um
+    ItemRecebidoSerializer por linha custa mais do que a própria gravação em
+    recebimentos com milhares de linhas. Os erros vêm por linha, como no many=True.
+    """
+    default_error_messages = {'not_a_list': 'Informe uma lista de itens.'}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.quantidade = serializers.DecimalField(max_digits=10, decimal_places=2)
+        self.max_cor = ItemRecebido._meta.get_field('cor').max_length
+
+    def to_internal_value(self, dados):
+        if not isinstance(dados, list):
+            self.fail('not_a_list')
+        itens, erros = [], []
+        for linha in dados:
+            item, erro = self._validar_linha(linha)
+            itens.append(item)
+            erros.append(erro)
+        if any(erros):
+            raise serializers.ValidationError(erros)
+        return itens
+
+    def _validar_linha(self, linha):
+        if not isinstance(linha, dict):
+            return None, {'non_field_errors': ['Cada item deve ser um objeto.']}
+        erros = {}
+        material_id = linha.get('material_id')
+        if material_id is None:
+            erros['material_id'] = ['Este campo é obrigatório.']
+        elif isinstance(material_id, bool) or not str(material_id).strip().isdigit():
+            erros['material_id'] = ['Informe um número inteiro válido.']
+        else:
+            material_id = int(material_id)
+
+        quantidade = linha.get('quantidade_contada')
+        if quantidade is None:
+            erros['quantidade_contada'] = ['Este campo é obrigatório.']
+        else:
+            try:
+                quantidade = self.quantidade.to_internal_value(quantidade)
+            except serializers.ValidationError as erro:
+                erros['quantidade_contada'] = erro.detail
+
+        cor = linha.get('cor')
+        if cor is not None and (not isinstance(cor, str) or len(cor) > self.max_cor):
+            erros['cor'] = [f"Informe um texto de até {self.max_cor} caracteres."]
+
+        grade = linha.get('grade_numeracao')
+        try:
+            validar_grade_numeracao(grade)
+        except serializers.ValidationError as erro:
+            erros['grade_numeracao'] = erro.detail
+        else:
+            if grade and 'quantidade_contada' not in erros and sum(Decimal(str(valor)) for valor in grade.values()) != quantidade:
+                erros['grade_numeracao'] = [f"A soma da grade deve ser igual a quantidade_contada ({quantidade})."]
+
+        if erros:
+            return None, erros
+        return {'material_id': material_id, 'quantidade_contada': quantidade, 'cor': cor, 'grade_numeracao': grade}, {}
+
+
+def inserir_itens_recebidos(recebimento_id, itens):
+    """
+    Grava os itens de um recebimento com um único INSERT ... SELECT FROM unnest(...),
+    sem instanciar um modelo por linha. Assim como o bulk_create, não dispara signals.
+    """
+    if not itens:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {ItemRecebido._meta.db_table}
+                (recebimento_id, material_id, quantidade_contada, cor, grade_numeracao, updated_at)
+            SELECT %(recebimento)s, u.material_id, u.quantidade, u.cor, u.grade::jsonb, NOW()
+            FROM unnest(%(materiais)s::bigint[], %(quantidades)s::numeric[], %(cores)s::text[], %(grades)s::text[])
+                AS u(material_id, quantidade, cor, grade)
+        """, {
+            'recebimento': recebimento_id,
+            'materiais': [item['material_id'] for item in itens],
+            'quantidades': [item['quantidade_contada'] for item in itens],
+            'cores': [item.get('cor') for item in itens],
+            'grades': [None if item.get('grade_numeracao') is None else json.dumps(item['grade_numeracao']) for item in itens],
+        })
+
+
+# -----------------------------------------------------------------------------
+# FORMA DA RESPOSTA: ?fields= e ?expand=
+# -----------------------------------------------------------------------------
+def ler_arvore(valor):
+    """ Converte 'a,b.c,b.d' em {'a': {}, 'b': {'c': {}, 'd': {}}}. """
+    arvore = {}
+    for caminho in (valor or '').split(','):
+        no = arvore
+        for nome in caminho.strip().split('.'):
+            if nome:
+                no = no.setdefault(nome, {})
+    return arvore
+
+
+def forma_da_requisicao(request):
+    """
+    Devolve (campos, expandir) de ?fields= e ?expand=. `campos` é None quando
+    todos os campos foram pedidos. Só vale para leituras: escritas usam a
+    representação padrão, para não esconder campos graváveis.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, {}
+    params = getattr(request, 'query_params', request.GET)
+    campos = ler_arvore(params['fields']) if params.get('fields') else None
+    return campos, ler_arvore(params.get('expand'))
+
+
+class CamposDinamicosMixin:
+    """
+    Relações listadas em Meta.expansiveis (nome -> serializer) só são aninhadas
+    quando pedidas em ?expand= (com ponto para os níveis seguintes, como
+    expand=plano_compra.itens). Fora disso, a relação para um vem como id e a
+    coleção fica de fora, sem nenhuma consulta.
+
+    ?fields= limita os campos de cada nível (fields=id,plano_compra.codigo_plano);
+    os níveis aninhados seguem o que foi expandido. As views montam os prefetch
+    com a mesma árvore (ver core/views.py).
+    """
+
+    def __init__(self, *args, campos=None, expandir=None, **kwargs):
+        self._campos = campos
+        self._expandir = expandir
+        super().__init__(*args, **kwargs)
+
+    def _forma(self):
+        if self._expandir is None:
+            # Só o serializer raiz (ou o filho da lista raiz) lê a requisição
+            raiz = self.parent is None or (
+                isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
+            )
+            if raiz:
+                self._campos, self._expandir = forma_da_requisicao(self.context.get('request'))
+            else:
+                self._expandir = {}
+        return self._campos, self._expandir
+
+    def get_fields(self):
+        fields = super().get_fields()
+        campos, expandir = self._forma()
+        opcoes = self.Meta.model._meta
+        for nome, classe in getattr(self.Meta, 'expansiveis', {}).items():
+            colecao = opcoes.get_field(nome).one_to_many
+            if nome in expandir:
+                fields[nome] = classe(
+                    many=colecao, read_only=True,
+                    campos=(campos.get(nome) or None) if campos else None, expandir=expandir[nome],
+                )
+            elif colecao:
+                fields.pop(nome, None)
+            else:
+                fields[nome] = serializers.PrimaryKeyRelatedField(read_only=True)
+        if campos:
+            fields = {nome: campo for nome, campo in fields.items() if nome in campos or campo.write_only}
+        return fields
+
+
+class ModelSerializerCronometrado(CamposDinamicosMixin, serializers.ModelSerializer):
+    """ ModelSerializer que soma o tempo de to_representation à medição da requisição. """
+
+    def to_representation(self, instance):
+        with cronometrar_serializacao():
+            return super().to_representation(instance)
+
+
+class UserSerializer(ModelSerializerCronometrado):
+    # Usa o mesmo cache de grupos da permissão IsInGroup
+    groups = serializers.SerializerMethodField()
+
+    def get_groups(self, obj):
+        return sorted(grupos_do_usuario(obj))
+
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'groups']
 
 
-class ItemPlanoCompraSerializer(serializers.ModelSerializer):
+class ItemPlanoCompraSerializer(GradeNumeracaoMixin, ModelSerializerCronometrado):
+    campo_quantidade = 'quantidade_prevista'
     material_descricao = serializers.CharField(source='material.descricao', read_only=True)
     class Meta:
         model = ItemPlanoCompra
         fields = ['id', 'material', 'material_descricao', 'quantidade_prevista', 'preco_unitario', 'cor', 'grade_numeracao']
+        extra_kwargs = {'grade_numeracao': {'validators': [validar_grade_numeracao]}}
 
 
-class PlanoCompraSerializer(serializers.ModelSerializer):
-    itens = ItemPlanoCompraSerializer(many=True, read_only=True)
+class PlanoCompraSerializer(ModelSerializerCronometrado):
     class Meta:
         model = PlanoCompra
         fields = ['id', 'codigo_plano', 'fornecedor', 'data_emissao', 'data_prevista_entrega', 'status', 'usuario_criador', 'created_at', 'updated_at', 'itens']
+        expansiveis = {'itens': ItemPlanoCompraSerializer}
 
 
-class FornecedorSerializer(serializers.ModelSerializer):
+class MaterialSerializer(ModelSerializerCronometrado):
+    class Meta:
+        model = Material
+        fields = ['id', 'codigo_interno', 'descricao', 'unidade_medida']
+
+
+class FornecedorSerializer(ModelSerializerCronometrado):
     class Meta:
         model = Fornecedor
         fields = ['id', 'razao_social', 'nome_fantasia', 'cnpj']
 
 
-class ItemNotaFiscalSerializer(serializers.ModelSerializer):
+class ItemNotaFiscalSerializer(GradeNumeracaoMixin, ModelSerializerCronometrado):
+    campo_quantidade = 'quantidade'
     material_descricao = serializers.CharField(source='material.descricao', read_only=True)
     class Meta:
         model = ItemNotaFiscal
-        fields = ['id', 'material', 'material_descricao', 'quantidade', 'valor_unitario']
+        fields = ['id', 'material', 'material_descricao', 'quantidade', 'valor_unitario', 'cor', 'grade_numeracao']
+        extra_kwargs = {'grade_numeracao': {'validators': [validar_grade_numeracao]}}
 
 
-class NotaFiscalSerializer(serializers.ModelSerializer):
-    itens_nf = ItemNotaFiscalSerializer(many=True, read_only=True)
+class NotaFiscalSerializer(ModelSerializerCronometrado):
     class Meta:
         model = NotaFiscal
         fields = ['id', 'numero', 'fornecedor', 'data_emissao', 'valor_total', 'arquivo_xml', 'itens_nf']
+        expansiveis = {'itens_nf': ItemNotaFiscalSerializer}
 
 
 # --- ORDEM CORRIGIDA AQUI ---
 
 # DEFINIMOS PRIMEIRO O SERIALIZER DO "FILHO"
-class ItemInspecionadoDefeitoSerializer(serializers.ModelSerializer):
+class ItemInspecionadoDefeitoSerializer(ModelSerializerCronometrado):
     defeito_nome = serializers.CharField(source='defeito.nome', read_only=True)
     class Meta:
         model = ItemInspecionadoDefeito
@@ -63,26 +309,28 @@ class ItemInspecionadoDefeitoSerializer(serializers.ModelSerializer):
 
 
 # AGORA PODEMOS USÁ-LO NO SERIALIZER DO "PAI"
-class ItemRecebidoSerializer(serializers.ModelSerializer):
+class ItemRecebidoSerializer(GradeNumeracaoMixin, ModelSerializerCronometrado):
+    campo_quantidade = 'quantidade_contada'
     material_descricao = serializers.CharField(source='material.descricao', read_only=True)
-    defeitos_encontrados = ItemInspecionadoDefeitoSerializer(many=True, read_only=True)
 
     # CAMPO PARA ESCRITA (write)
     material_id = serializers.IntegerField(write_only=True)
 
     class Meta:
         model = ItemRecebido
-        fields = ['id', 'material', 'material_descricao', 'quantidade_contada', 'defeitos_encontrados', 'material_id']
-        read_only_fields = ['material', 'defeitos_encontrados']
+        fields = [
+            'id', 'material', 'material_descricao', 'quantidade_contada', 'cor', 'grade_numeracao',
+            'defeitos_encontrados', 'material_id',
+        ]
+        read_only_fields = ['material']
+        extra_kwargs = {'grade_numeracao': {'validators': [validar_grade_numeracao]}}
+        expansiveis = {'defeitos_encontrados': ItemInspecionadoDefeitoSerializer}
 
 
-class RecebimentoSerializer(serializers.ModelSerializer):
+class RecebimentoSerializer(ModelSerializerCronometrado):
     # --- CAMPOS PARA LEITURA (read_only) ---
     conferente_username = serializers.CharField(source='conferente.username', read_only=True)
-    plano_compra = PlanoCompraSerializer(read_only=True)
-    nota_fiscal = NotaFiscalSerializer(read_only=True)
     inspecao_id = serializers.ReadOnlyField(source='inspecao.id')
-    itens_recebidos = ItemRecebidoSerializer(many=True, read_only=True)
 
     # --- CAMPOS PARA ESCRITA (write_only) ---
     plano_compra_id = serializers.PrimaryKeyRelatedField(
@@ -92,7 +340,9 @@ class RecebimentoSerializer(serializers.ModelSerializer):
         queryset=NotaFiscal.objects.all(), source='nota_fiscal', write_only=True, required=False, allow_null=True
     )
     # Este é o nosso novo campo para receber os itens do formulário
-    itens_a_receber = ItemRecebidoSerializer(many=True, write_only=True)
+    itens_a_receber = ItensAReceberField(write_only=True)
+    # Quando verdadeiro, linhas repetidas do mesmo material são somadas em uma só
+    mesclar_duplicados = serializers.BooleanField(write_only=True, required=False, default=False)
 
     class Meta:
         model = Recebimento
@@ -105,37 +355,59 @@ class RecebimentoSerializer(serializers.ModelSerializer):
             'observacoes', 
             'itens_recebidos',   # para ler
             'itens_a_receber',   # para escrever
+            'mesclar_duplicados',
             'inspecao_id'
         ]
+        read_only_fields = ['plano_compra', 'nota_fiscal']
+        expansiveis = {
+            'plano_compra': PlanoCompraSerializer,
+            'nota_fiscal': NotaFiscalSerializer,
+            'itens_recebidos': ItemRecebidoSerializer,
+        }
+
+    def validate_itens_a_receber(self, itens):
+        """ Valida todos os materiais informados com uma única consulta. """
+        material_ids = {item['material_id'] for item in itens}
+        existentes = set(Material.objects.filter(id__in=material_ids).values_list('id', flat=True))
+        erros = [
+            {} if item['material_id'] in existentes
+            else {'material_id': [f"Material com ID {item['material_id']} não encontrado."]}
+            for item in itens
+        ]
+        if any(erros):
+            raise serializers.ValidationError(erros)
+        return itens
 
     def create(self, validated_data):
         # Agora pegamos os itens do nosso novo campo 'itens_a_receber'
         itens_data = validated_data.pop('itens_a_receber')
-
-        # Removemos os outros campos de escrita para passar para o create do Recebimento
-        validated_data.pop('plano_compra')
-        validated_data.pop('nota_fiscal', None) # Usamos .pop com default para o campo não obrigatório
-
-        # Criamos o recebimento
-        recebimento = Recebimento.objects.create(**validated_data, conferente=self.context['request'].user)
-
-        # Criamos os itens recebidos
-        for item_data in itens_data:
-            # O 'material_id' que definimos no ItemRecebidoSerializer será usado aqui
-            ItemRecebido.objects.create(recebimento=recebimento, **item_data)
+        if validated_data.pop('mesclar_duplicados', False):
+            itens_data = mesclar_itens_por_material(itens_data)
+
+        # O conferente normalmente vem do perform_create da view (serializer.save(conferente=...))
+        validated_data.setdefault('conferente', self.context['request'].user)
+
+        # Cabeçalho e itens são gravados juntos: ou entra o recebimento inteiro, ou nada.
+        with transaction.atomic():
+            recebimento = Recebimento.objects.create(**validated_data)
+            inserir_itens_recebidos(recebimento.pk, itens_data)
+            # Progresso do plano atualizado na mesma transação (a inserção em lote não dispara signals)
+            deltas = {}
+            for item_data in itens_data:
+                somar_deltas(deltas, recebimento.plano_compra_id, item_data['material_id'], item_data['quantidade_contada'])
+            registrar_progresso(deltas)
 
         return recebimento
 
 
-class DefeitoSerializer(serializers.ModelSerializer):
+class DefeitoSerializer(ModelSerializerCronometrado):
     class Meta:
         model = Defeito
         fields = ['id', 'nome', 'descricao']
 
 
-class InspecaoQualidadeSerializer(serializers.ModelSerializer):
+class InspecaoQualidadeSerializer(ModelSerializerCronometrado):
     revisor_username = serializers.CharField(source='revisor.username', read_only=True)
-    recebimento = RecebimentoSerializer(read_only=True)
     recebimento_id = serializers.PrimaryKeyRelatedField(
         queryset=Recebimento.objects.all(), source='recebimento', write_only=True
     )
@@ -145,10 +417,96 @@ class InspecaoQualidadeSerializer(serializers.ModelSerializer):
             'id', 'recebimento', 'recebimento_id', 'revisor_username', 
             'status', 'observacoes_gerais', 'created_at'
         ]
-        read_only_fields = ['revisor_username']
+        read_only_fields = ['recebimento', 'revisor_username']
+        expansiveis = {'recebimento': RecebimentoSerializer}
 
 
 class RegistrarDefeitoSerializer(serializers.Serializer):
     item_recebido_id = serializers.IntegerField()
     defeito_id = serializers.IntegerField()
-    quantidade_defeituosa = serializers.DecimalField(max_digits=10, decimal_places=2)
\ No newline at end of file
+    quantidade_defeituosa = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class RegistrarDefeitosSerializer(serializers.Serializer):
+    """
+    Vários defeitos de uma inspeção de uma vez. O recebimento da inspeção vem
+    em context['recebimento_id']. Valide e grave dentro de uma transação: os
+    itens recebidos ficam travados até o fim, para que dois lotes simultâneos
+    não passem juntos do limite da quantidade contada.
+    """
+    defeitos = RegistrarDefeitoSerializer(many=True, allow_empty=False, max_length=2000)
+
+    def validate_defeitos(self, defeitos):
+        """ Valida itens, defeitos e quantidades com duas consultas; os erros vêm por linha. """
+        # 1. Itens do recebimento, com o total de defeitos já apontados em cada um
+        ja_apontado = (
+            ItemInspecionadoDefeito.objects.filter(item_recebido=OuterRef('pk'))
+            .values('item_recebido').annotate(total=Sum('quantidade_defeituosa')).values('total')
+        )
+        itens = {
+            item_id: [quantidade_contada, apontado]
+            for item_id, quantidade_contada, apontado in ItemRecebido.objects.select_for_update().filter(
+                id__in={linha['item_recebido_id'] for linha in defeitos},
+                recebimento_id=self.context['recebimento_id'],
+            ).annotate(
+                apontado=Coalesce(Subquery(ja_apontado), Value(Decimal('0')), output_field=DecimalField())
+            ).values_list('id', 'quantidade_contada', 'apontado')
+        }
+        # 2. Tipos de defeito
+        existentes = set(Defeito.objects.filter(id__in={linha['defeito_id'] for linha in defeitos}).values_list('id', flat=True))
+
+        # 3. Cada linha, somando as quantidades do lote às já apontadas no item
+        erros = []
+        for linha in defeitos:
+            erro = {}
+            item = itens.get(linha['item_recebido_id'])
+            if item is None:
+                erro['item_recebido_id'] = [f"Item {linha['item_recebido_id']} não pertence a este recebimento."]
+            if linha['defeito_id'] not in existentes:
+                erro['defeito_id'] = [f"Defeito com ID {linha['defeito_id']} não encontrado."]
+            if linha['quantidade_defeituosa'] <= 0:
+                erro['quantidade_defeituosa'] = ["A quantidade com defeito deve ser maior que zero."]
+            elif item is not None:
+                quantidade_contada, apontado = item
+                if apontado + linha['quantidade_defeituosa'] > quantidade_contada:
+                    erro['quantidade_defeituosa'] = [
+                        f"Os defeitos do item somariam {apontado + linha['quantidade_defeituosa']}, "
+                        f"acima da quantidade contada ({quantidade_contada})."
+                    ]
+                else:
+                    item[1] = apontado + linha['quantidade_defeituosa']
+            erros.append(erro)
+        if any(erros):
+            raise serializers.ValidationError(erros)
+        return defeitos
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            defeitos = ItemInspecionadoDefeito.objects.bulk_create(
+                [
+                    ItemInspecionadoDefeito(
+                        item_recebido_id=linha['item_recebido_id'],
+                        defeito_id=linha['defeito_id'],
+                        quantidade_defeituosa=linha['quantidade_defeituosa'],
+                    )
+                    for linha in validated_data['defeitos']
+                ],
+                batch_size=2000,
+            )
+            # Fatos do Pareto gravados na mesma transação (bulk_create não dispara signals)
+            atualizar_fatos_defeito(ids=[defeito.pk for defeito in defeitos])
+            invalidar_pareto()
+        return defeitos
+
+
+class JobSerializer(ModelSerializerCronometrado):
+    criado_por_username = serializers.CharField(source='criado_por.username', read_only=True, default=None)
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'tipo', 'status', 'progresso', 'mensagem', 'resultado', 'erro',
+            'tentativas', 'max_tentativas', 'executar_apos', 'criado_por_username',
+            'created_at', 'iniciado_em', 'concluido_em', 'updated_at',
+        ]
+        read_only_fields = fields
@@ -0,0 +1,325 @@
+# core/signals.py
+"""
+Signals do app core.
+
+Mantêm o snapshot da conciliação (ConciliacaoItem) atualizado de forma
+incremental: quando um item de plano, de NF ou de recebimento muda, apenas as
+linhas dos materiais afetados, nos recebimentos afetados, são recalculadas.
+Da mesma forma, aplicam os deltas de quantidade ao progresso dos planos de
+compra (ProgressoPlanoMaterial) e recalculam o status dos planos.
+
+Gravam ainda os fatos de defeito (FatoDefeito) usados na análise de Pareto
+e invalidam o cache dessa análise, e marcam para o scorecard os dias afetados
+por exclusões (core/scorecard.py).
+
+Também invalidam o cache de grupos dos usuários (core/permissions.py) e o
+cache de tokens da autenticação (core/authentication.py).
+"""
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.models import Group, User
+from django.db.models import Q, QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .analise_defeitos import atualizar_fatos_defeito, invalidar_pareto
+from .authentication import cache_tokens
+from .conciliacao import materializar_snapshot
+from .models import (
+    InspecaoQualidade, ItemInspecionadoDefeito, ItemNotaFiscal, ItemPlanoCompra, ItemRecebido, Recebimento
+)
+from .permissions import invalidar_grupos
+from .progresso import adiar_progresso, deltas_de_recebimentos, registrar_progresso, somar_deltas
+from .scorecard import registrar_exclusoes
+
+
+_estado = threading.local()
+
+
+@contextmanager
+def adiar_conciliacao():
+    """
+    Acumula as atualizações do snapshot e do progresso dos planos (ver
+    progresso.adiar_progresso) durante o bloco e aplica todas de uma vez ao
+    final. Útil em importações e gravações em lote.
+
+    Os signals dos itens não consultam o banco dentro do bloco: os recebimentos
+    dos planos e notas alterados e os dias do scorecard afetados por exclusões
+    são resolvidos uma vez ao final, e não uma vez por item.
+    """
+    pendentes = getattr(_estado, 'pendentes', None)
+    if pendentes is not None:
+        # Já estamos dentro de outro bloco adiado; ele fará a atualização.
+        yield
+        return
+
+    _estado.pendentes = pendentes = {
+        'recebimentos': set(), 'materiais': set(),
+        # Planos e notas com itens alterados, pelo campo do recebimento que aponta para eles
+        'documentos': {'plano_compra_id': set(), 'nota_fiscal_id': set()},
+        # Parâmetros de registrar_exclusoes
+        'exclusoes': {'recebimentos': set(), 'planos': set(), 'notas': set()},
+    }
+    try:
+        with adiar_progresso():
+            yield
+    finally:
+        _estado.pendentes = None
+    registrar_exclusoes(**pendentes['exclusoes'])
+    documentos = pendentes['documentos']
+    if pendentes['materiais'] and any(documentos.values()):
+        pendentes['recebimentos'] |= set(
+            Recebimento.objects.filter(
+                Q(plano_compra_id__in=documentos['plano_compra_id']) | Q(nota_fiscal_id__in=documentos['nota_fiscal_id']),
+                conciliacao_atualizada_em__isnull=False,
+            ).values_list('id', flat=True)
+        )
+    materializar_snapshot(pendentes['recebimentos'], pendentes['materiais'])
+
+
+def registrar_alteracao_conciliacao(recebimento_ids, material_ids):
+    """ Recalcula (ou agenda, se estiver adiado) o snapshot dos materiais afetados. """
+    recebimento_ids = set(recebimento_ids)
+    material_ids = {material_id for material_id in material_ids if material_id is not None}
+    if not recebimento_ids or not material_ids:
+        return
+
+    pendentes = getattr(_estado, 'pendentes', None)
+    if pendentes is not None:
+        pendentes['recebimentos'] |= recebimento_ids
+        pendentes['materiais'] |= material_ids
+    else:
+        materializar_snapshot(recebimento_ids, material_ids)
+
+
+def _registrar_alteracao_de_documento(campo, documento_id, material_ids):
+    """
+    Item de plano (`campo` plano_compra_id) ou de NF (nota_fiscal_id) alterado: o
+    snapshot muda nos recebimentos já conciliados que apontam para o documento.
+    """
+    pendentes = getattr(_estado, 'pendentes', None)
+    if pendentes is not None:
+        # Adiado: os recebimentos de todos os documentos são buscados uma vez ao final
+        pendentes['documentos'][campo].add(documento_id)
+        pendentes['materiais'] |= {material_id for material_id in material_ids if material_id is not None}
+        return
+    recebimentos = Recebimento.objects.filter(
+        **{campo: documento_id}, conciliacao_atualizada_em__isnull=False
+    ).values_list('id', flat=True)
+    registrar_alteracao_conciliacao(recebimentos, material_ids)
+
+
+def _materiais_afetados(instance):
+    return {instance.material_id, getattr(instance, '_material_id_anterior', None)}
+
+
+def _exclusao_em_cascata(origin, modelo):
+    """ Indica se a exclusão começou em outro modelo (ex.: ao excluir o recebimento inteiro). """
+    if isinstance(origin, QuerySet):
+        return origin.model is not modelo
+    return not isinstance(origin, modelo)
+
+
+@receiver(pre_save, sender=ItemPlanoCompra)
+@receiver(pre_save, sender=ItemNotaFiscal)
+@receiver(pre_save, sender=ItemRecebido)
+def guardar_material_anterior(sender, instance, **kwargs):
+    """
+    Guarda o material atual do banco para que uma troca de material atualize as
+    duas linhas (e, no item recebido, a quantidade anterior para o progresso).
+    """
+    if instance.pk and not kwargs.get('raw'):
+        if sender is ItemRecebido:
+            anterior = sender.objects.filter(pk=instance.pk).values_list('material_id', 'quantidade_contada').first()
+            instance._material_id_anterior, instance._quantidade_anterior = anterior or (None, None)
+        else:
+            instance._material_id_anterior = (
+                sender.objects.filter(pk=instance.pk).values_list('material_id', flat=True).first()
+            )
+
+
+@receiver(post_save, sender=ItemPlanoCompra)
+@receiver(post_delete, sender=ItemPlanoCompra)
+def item_plano_alterado(sender, instance, origin=None, raw=False, **kwargs):
+    if raw or (origin is not None and _exclusao_em_cascata(origin, sender)):
+        return
+    _registrar_alteracao_de_documento('plano_compra_id', instance.plano_compra_id, _materiais_afetados(instance))
+    # A quantidade prevista mudou: o plano pode ter passado a (ou deixado de) estar concluído
+    registrar_progresso({}, planos=[instance.plano_compra_id])
+
+
+@receiver(post_save, sender=ItemNotaFiscal)
+@receiver(post_delete, sender=ItemNotaFiscal)
+def item_nota_fiscal_alterado(sender, instance, origin=None, raw=False, **kwargs):
+    if raw or (origin is not None and _exclusao_em_cascata(origin, sender)):
+        return
+    _registrar_alteracao_de_documento('nota_fiscal_id', instance.nota_fiscal_id, _materiais_afetados(instance))
+
+
+@receiver(post_save, sender=ItemRecebido)
+@receiver(post_delete, sender=ItemRecebido)
+def item_recebido_alterado(sender, instance, origin=None, raw=False, created=False, **kwargs):
+    if raw or (origin is not None and _exclusao_em_cascata(origin, sender)):
+        return
+
+    # 1. Progresso do plano: retira a quantidade anterior e soma a atual
+    if ItemRecebido.recebimento.is_cached(instance):
+        plano_compra_id = instance.recebimento.plano_compra_id
+    else:
+        plano_compra_id = Recebimento.objects.values_list('plano_compra_id', flat=True).get(pk=instance.recebimento_id)
+    deltas = {}
+    if kwargs['signal'] is post_delete:
+        somar_deltas(deltas, plano_compra_id, instance.material_id, -instance.quantidade_contada)
+    else:
+        if not created and getattr(instance, '_quantidade_anterior', None) is not None:
+            somar_deltas(deltas, plano_compra_id, instance._material_id_anterior, -instance._quantidade_anterior)
+        somar_deltas(deltas, plano_compra_id, instance.material_id, instance.quantidade_contada)
+    registrar_progresso(deltas)
+
+    # 2. Fatos de defeito do item, se o material mudou
+    anterior = getattr(instance, '_material_id_anterior', None)
+    if kwargs['signal'] is post_save and anterior is not None and anterior != instance.material_id:
+        if atualizar_fatos_defeito(recebimento_ids=[instance.recebimento_id]):
+            invalidar_pareto()
+
+    # 3. Snapshot da conciliação (materializar_snapshot ignora recebimentos ainda sem snapshot;
+    #    o recebimento carregado no item pode estar desatualizado e não serve para decidir)
+    registrar_alteracao_conciliacao([instance.recebimento_id], _materiais_afetados(instance))
+
+
+@receiver(pre_save, sender=Recebimento)
+def guardar_plano_anterior(sender, instance, raw=False, update_fields=None, **kwargs):
+    if instance.pk and not raw and (update_fields is None or 'plano_compra' in update_fields):
+        instance._plano_compra_anterior = (
+            Recebimento.objects.filter(pk=instance.pk).values_list('plano_compra_id', flat=True).first()
+        )
+
+
+@receiver(pre_delete, sender=Recebimento)
+def recebimento_excluido(sender, instance, **kwargs):
+    """ Os itens saem em cascata (sem signals próprios): retira o total deles do progresso do plano. """
+    registrar_progresso(deltas_de_recebimentos([instance.pk], sinal=-1))
+
+
+@receiver(post_save, sender=Recebimento)
+def recebimento_alterado(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """ Se o plano ou a NF vinculados mudarem, o snapshot inteiro precisa ser refeito. """
+    if created or raw:
+        return
+    plano_anterior = getattr(instance, '_plano_compra_anterior', None)
+    if plano_anterior is not None and plano_anterior != instance.plano_compra_id:
+        # Os itens passam a contar para o novo plano
+        deltas = deltas_de_recebimentos([instance.pk])
+        for (_, material_id), quantidade in list(deltas.items()):
+            somar_deltas(deltas, plano_anterior, material_id, -quantidade)
+        registrar_progresso(deltas)
+        # E os defeitos passam a contar para o fornecedor do novo plano
+        if atualizar_fatos_defeito(recebimento_ids=[instance.pk]):
+            invalidar_pareto()
+    if instance.conciliacao_atualizada_em is None:
+        return
+    if update_fields is not None and not {'plano_compra', 'nota_fiscal'} & set(update_fields):
+        return
+    materializar_snapshot([instance.pk])
+
+
+# -----------------------------------------------------------------------------
+# FATOS DE DEFEITO
+# -----------------------------------------------------------------------------
+@receiver(post_save, sender=ItemInspecionadoDefeito)
+@receiver(post_delete, sender=ItemInspecionadoDefeito)
+def defeito_alterado(sender, instance, raw=False, **kwargs):
+    """ Na exclusão o fato sai em cascata; na gravação é inserido ou corrigido. """
+    if raw:
+        return
+    if kwargs['signal'] is post_save:
+        atualizar_fatos_defeito([instance.pk])
+    invalidar_pareto()
+
+
+# -----------------------------------------------------------------------------
+# SCORECARD
+# -----------------------------------------------------------------------------
+# Modelo excluído -> (parâmetro de registrar_exclusoes, atributo com o id)
+EXCLUSOES_NO_SCORECARD = {
+    Recebimento: ('recebimentos', 'pk'),
+    InspecaoQualidade: ('recebimentos', 'recebimento_id'),
+    ItemRecebido: ('recebimentos', 'recebimento_id'),
+    ItemPlanoCompra: ('planos', 'plano_compra_id'),
+    ItemNotaFiscal: ('notas', 'nota_fiscal_id'),
+    ItemInspecionadoDefeito: ('itens_recebidos', 'item_recebido_id'),
+}
+# Exclusões marcadas na hora mesmo dentro de adiar_conciliacao: o recebimento (ou o
+# item recebido do defeito) pode sumir antes do final do bloco
+EXCLUSOES_IMEDIATAS = {Recebimento, ItemInspecionadoDefeito}
+
+
+@receiver(pre_delete, sender=Recebimento)
+@receiver(pre_delete, sender=InspecaoQualidade)
+@receiver(pre_delete, sender=ItemRecebido)
+@receiver(pre_delete, sender=ItemPlanoCompra)
+@receiver(pre_delete, sender=ItemNotaFiscal)
+@receiver(pre_delete, sender=ItemInspecionadoDefeito)
+def exclusao_no_scorecard(sender, instance, origin=None, **kwargs):
+    """ A exclusão não deixa updated_at: o dia do recebimento fica pendente para o scorecard. """
+    modelo_origem = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and modelo_origem is not sender and modelo_origem in EXCLUSOES_NO_SCORECARD:
+        # Quem começou a exclusão (ex.: o recebimento inteiro) já marcou o dia
+        return
+    parametro, atributo = EXCLUSOES_NO_SCORECARD[sender]
+    pendentes = getattr(_estado, 'pendentes', None)
+    if pendentes is not None and sender not in EXCLUSOES_IMEDIATAS:
+        pendentes['exclusoes'][parametro].add(getattr(instance, atributo))
+        return
+    registrar_exclusoes(**{parametro: [getattr(instance, atributo)]})
+
+
+# -----------------------------------------------------------------------------
+# CACHE DE GRUPOS
+# -----------------------------------------------------------------------------
+@receiver(m2m_changed, sender=User.groups.through)
+def grupos_do_usuario_alterados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        # user.groups.add(...) / remove(...) / clear()
+        instance.__dict__.pop('_grupos_cache', None)
+        invalidar_grupos([instance.pk])
+    elif action == 'pre_clear':
+        # group.user_set.clear(): os usuários precisam ser lidos antes de sumirem
+        invalidar_grupos(instance.user_set.values_list('pk', flat=True))
+    else:
+        # group.user_set.add(...) / remove(...)
+        invalidar_grupos(pk_set or [])
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def grupo_alterado(sender, instance, raw=False, **kwargs):
+    """ Renomear ou excluir um grupo muda os nomes vistos por todos os seus usuários. """
+    if raw or instance.pk is None:
+        return
+    invalidar_grupos(instance.user_set.values_list('pk', flat=True))
+
+
+# -----------------------------------------------------------------------------
+# CACHE DE TOKENS
+# -----------------------------------------------------------------------------
+@receiver(post_delete, sender=Token)
+def token_excluido(sender, instance, **kwargs):
+    """
+    Token revogado deixa de autenticar imediatamente (nos demais processos, só com
+    TOKEN_CACHE['USAR_CACHE_DJANGO']; ver core/authentication.py).
+    """
+    cache_tokens.remover([instance.key])
+
+
+@receiver(post_save, sender=User)
+def usuario_alterado(sender, instance, raw=False, update_fields=None, **kwargs):
+    """ Usuário desativado (ou alterado) não pode continuar sendo servido pelo cache. """
+    if raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    cache_tokens.remover(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
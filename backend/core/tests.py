@@ -1,3 +1,1492 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import nfe, nfe_lote
+from .analise_defeitos import atualizar_fatos_defeito
+from .conciliacao import classificar_divergencia, conciliar_com_snapshot, conciliar_por_grade, conciliar_recebimento
+from .conciliacao_lote import CheckpointLote
+from .authentication import CacheTokens, cache_tokens
+from .busca import fornecedores_similares, materiais_similares, trigramas_disponiveis
+from .checks import cache_de_grupos_compartilhado, cache_de_tokens_compartilhado
+from .instrumentacao import agregado_rotas, fingerprint_sql
+from .jobs import TAREFAS, enfileirar, processar_fila, recuperar_expirados, reservar, tarefa
+from .models import (
+    ConciliacaoItem, Defeito, FatoDefeito, Fornecedor, InspecaoQualidade, ItemInspecionadoDefeito, ItemNotaFiscal,
+    ItemPlanoCompra, ItemRecebido, Job, Material, NotaFiscal, PlanoCompra, ProgressoPlanoMaterial, Recebimento,
+    ScorecardDiaPendente,
+)
+from .permissions import grupos_do_usuario
+from .progresso import atualizar_status_planos, reconstruir_progresso
+from .roteamento import CHAVE_CACHE_PRIMARIO, RoteamentoMiddleware
+from .scorecard import atualizar_scorecard
+from .serializers import RecebimentoSerializer
+
+
+class DadosZeniteMixin:
+    """ Monta planos, notas, recebimentos e inspeções completos para os testes. """
+
+    @classmethod
+    def criar_usuario(cls, username, *grupos):
+        usuario = User.objects.create_user(username=username, password='senha-teste')
+        for nome in grupos:
+            usuario.groups.add(Group.objects.get_or_create(name=nome)[0])
+        return usuario
+
+    @classmethod
+    def criar_recebimento(cls, usuario, indice, qtd_materiais=3):
+        fornecedor = Fornecedor.objects.create(razao_social=f"Fornecedor {indice}", cnpj=f"{indice:014d}")
+        materiais = [
+            Material.objects.create(codigo_interno=f"MAT-{indice}-{n}", descricao=f"Material {n}", unidade_medida='par')
+            for n in range(qtd_materiais)
+        ]
+        plano = PlanoCompra.objects.create(
+            codigo_plano=f"PC-{indice}", fornecedor=fornecedor, data_emissao='2025-06-01',
+            data_prevista_entrega='2025-06-15', usuario_criador=usuario,
+        )
+        nota = NotaFiscal.objects.create(
+            numero=f"{indice}", fornecedor=fornecedor, data_emissao='2025-06-10', valor_total=100,
+        )
+        recebimento = Recebimento.objects.create(plano_compra=plano, nota_fiscal=nota, conferente=usuario)
+        defeito = Defeito.objects.get_or_create(nome='Costura solta')[0]
+        for material in materiais:
+            ItemPlanoCompra.objects.create(plano_compra=plano, material=material, quantidade_prevista=10, preco_unitario=5)
+            ItemNotaFiscal.objects.create(nota_fiscal=nota, material=material, quantidade=10, valor_unitario=5)
+            item = ItemRecebido.objects.create(recebimento=recebimento, material=material, quantidade_contada=9)
+            ItemInspecionadoDefeito.objects.create(item_recebido=item, defeito=defeito, quantidade_defeituosa=1)
+        InspecaoQualidade.objects.create(recebimento=recebimento, revisor=usuario)
+        return recebimento
+
+
+# Expansão completa do recebimento, como antes do ?expand= (relações aninhadas)
+EXPANDIR_RECEBIMENTO = 'plano_compra.itens,nota_fiscal.itens_nf,itens_recebidos.defeitos_encontrados'
+
+
+def conciliacao_item_a_item(recebimento):
+    """ A conciliação original (um dicionário por fonte, em Python), usada como referência. """
+    plano = {item.material_id: item.quantidade_prevista for item in recebimento.plano_compra.itens.all()}
+    nf = {item.material_id: item.quantidade for item in recebimento.nota_fiscal.itens_nf.all()}
+    recebido = {item.material_id: item.quantidade_contada for item in recebimento.itens_recebidos.all()}
+    resultado = []
+    for material in Material.objects.filter(id__in=set(plano) | set(nf) | set(recebido)):
+        qtds = (plano.get(material.pk, 0), nf.get(material.pk, 0), recebido.get(material.pk, 0))
+        if not qtds[0] == qtds[1] == qtds[2]:
+            resultado.append({
+                'material_codigo': material.codigo_interno, 'material_descricao': material.descricao,
+                'qtd_plano': qtds[0], 'qtd_nf': qtds[1], 'qtd_recebida': qtds[2],
+                'tipo_divergencia': classificar_divergencia(*qtds),
+            })
+    return sorted(resultado, key=lambda linha: linha['material_codigo'])
+
+
+class ConciliacaoTest(DadosZeniteMixin, TestCase):
+    """ A conciliação agregada no banco devolve o mesmo que a original, em uma consulta. """
+
+    def setUp(self):
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        # 3 materiais: plano e NF com 10, recebido 9; mais um material só em cada fonte
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+        so_plano, so_nf, so_recebido = (
+            Material.objects.create(codigo_interno=f"EXTRA-{n}", descricao=f"Extra {n}", unidade_medida='par')
+            for n in range(3)
+        )
+        ItemPlanoCompra.objects.create(plano_compra=self.recebimento.plano_compra, material=so_plano,
+                                       quantidade_prevista=5, preco_unitario=1)
+        ItemNotaFiscal.objects.create(nota_fiscal=self.recebimento.nota_fiscal, material=so_nf, quantidade=4, valor_unitario=1)
+        ItemRecebido.objects.create(recebimento=self.recebimento, material=so_recebido, quantidade_contada=3)
+
+    def test_mesmo_resultado_da_conciliacao_original(self):
+        esperado = conciliacao_item_a_item(self.recebimento)
+        self.assertEqual(len(esperado), 6)
+        self.assertEqual(self.recebimento.realizar_conciliacao(), esperado)
+        extra = next(linha for linha in esperado if linha['material_codigo'] == 'EXTRA-2')
+        self.assertEqual(extra['tipo_divergencia'], ['Recebido a mais que a NF', 'Item não consta no Plano de Compra'])
+        # A fonte sem o material continua sendo o inteiro 0
+        self.assertIs(type(extra['qtd_plano']), int)
+
+    def test_linhas_repetidas_do_material_sao_somadas(self):
+        item = self.recebimento.itens_recebidos.get(material__codigo_interno='MAT-1-0')
+        ItemRecebido.objects.create(recebimento=self.recebimento, material=item.material, quantidade_contada=1)
+        ItemPlanoCompra.objects.create(plano_compra=self.recebimento.plano_compra, material=item.material,
+                                       quantidade_prevista=0, preco_unitario=1)
+        codigos = [linha['material_codigo'] for linha in conciliar_recebimento(self.recebimento.pk)]
+        # 10 no plano (10 + 0), 10 na NF e 10 recebidos (9 + 1): sem divergência
+        self.assertNotIn('MAT-1-0', codigos)
+
+    def test_uma_consulta_qualquer_que_seja_o_tamanho(self):
+        grande = self.criar_recebimento(self.usuario, 2, qtd_materiais=40)
+        for recebimento in (self.recebimento, grande):
+            with self.assertNumQueries(1):
+                recebimento.realizar_conciliacao()
+
+
+class ConciliacaoLoteTest(DadosZeniteMixin, TestCase):
+    """ Comando conciliar_lote (com checkpoint) e a listagem em streaming da API. """
+
+    def setUp(self):
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        # 3 recebimentos com 3 divergências cada (plano e NF com 10, recebido 9)
+        self.ids = [self.criar_recebimento(self.usuario, indice).pk for indice in range(1, 4)]
+        self.pasta = TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.saida = os.path.join(self.pasta.name, 'divergencias.jsonl')
+
+    def conciliar(self, **opcoes):
+        saida = io.StringIO()
+        call_command('conciliar_lote', self.saida, tamanho_lote=1, workers=1, stdout=saida, **opcoes)
+        with open(self.saida, 'rb') as arquivo:
+            return arquivo.read(), saida.getvalue()
+
+    def test_comando_grava_as_divergencias(self):
+        conteudo, _ = self.conciliar()
+        linhas = [json.loads(linha) for linha in conteudo.decode('utf-8').splitlines()]
+        self.assertEqual([linha['recebimento_id'] for linha in linhas], [pk for pk in self.ids for _ in range(3)])
+        self.assertEqual(linhas[0]['tipo_divergencia'], ['Recebido a menos que a NF'])
+        self.assertFalse(os.path.exists(f'{self.saida}.checkpoint.json'))
+
+    def test_retomada_descarta_a_escrita_parcial(self):
+        completo, _ = self.conciliar()
+        primeiro_lote = b''.join(completo.splitlines(keepends=True)[:3])
+
+        # Interrompido depois do primeiro lote, no meio da escrita do segundo
+        with open(self.saida, 'wb') as arquivo:
+            arquivo.write(primeiro_lote + b'{"recebimento_id": ')
+        parametros = {'fornecedor': None, 'data_inicio': None, 'data_fim': None, 'status_plano': None, 'formato': 'jsonl'}
+        CheckpointLote(self.saida, parametros).registrar([self.ids[0]], len(primeiro_lote))
+
+        retomado, saida = self.conciliar(retomar=True)
+        self.assertEqual(retomado, completo)
+        self.assertIn('Retomando: 1 lote(s)', saida)
+        self.assertIn('2 recebimento(s) em 2 lote(s)', saida)
+
+    def test_retomada_com_outros_filtros(self):
+        with open(self.saida, 'wb'):
+            pass
+        CheckpointLote(self.saida, {'formato': 'jsonl'}).registrar([self.ids[0]], 0)
+        with self.assertRaises(CommandError):
+            self.conciliar(retomar=True)
+
+    def test_endpoint_em_streaming_sem_processos(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        with mock.patch('core.conciliacao_lote.ProcessPoolExecutor', side_effect=AssertionError):
+            resposta = self.client.get('/api/recebimentos/conciliar-lote/', {'formato': 'csv', 'tamanho_lote': 2})
+            self.assertEqual(resposta.status_code, 200)
+            linhas = list(csv.DictReader(io.StringIO(b''.join(resposta.streaming_content).decode('utf-8'))))
+        self.assertEqual(resposta['X-Total-Recebimentos'], '3')
+        self.assertEqual(len(linhas), 9)
+        self.assertEqual(linhas[0]['tipo_divergencia'], 'Recebido a menos que a NF')
+
+
+class SnapshotConciliacaoTest(DadosZeniteMixin, TestCase):
+    """ O snapshot é montado no primeiro pedido e mantido pelos signals a cada alteração de item. """
+
+    def setUp(self):
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        # 3 materiais: plano e NF com 10, recebido 9
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+        self.url = f'/api/recebimentos/{self.recebimento.pk}/conciliar/'
+
+    def conciliar(self, **params):
+        resposta = self.client.get(self.url, params)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta
+
+    def snapshot(self):
+        return dict(
+            ConciliacaoItem.objects.filter(recebimento=self.recebimento)
+            .values_list('material__codigo_interno', 'qtd_recebida')
+        )
+
+    def test_montado_no_primeiro_pedido(self):
+        self.assertFalse(ConciliacaoItem.objects.exists())
+        primeira = self.conciliar()
+        self.assertEqual(primeira['X-Conciliacao-Origem'], 'recalculado')
+        self.assertEqual(len(self.snapshot()), 3)
+        segunda = self.conciliar()
+        self.assertEqual(segunda['X-Conciliacao-Origem'], 'snapshot')
+        self.assertEqual(segunda.data, primeira.data)
+
+    def test_alteracao_e_exclusao_de_itens_atualizam_o_snapshot(self):
+        self.conciliar()
+        item = self.recebimento.itens_recebidos.get(material__codigo_interno='MAT-1-0')
+        item.quantidade_contada = 10
+        item.save()
+        self.assertEqual(self.snapshot()['MAT-1-0'], 10)
+        resposta = self.conciliar()
+        self.assertEqual(resposta['X-Conciliacao-Origem'], 'snapshot')
+        self.assertEqual([linha['material_codigo'] for linha in resposta.data], ['MAT-1-1', 'MAT-1-2'])
+
+        item.delete()
+        self.assertEqual(self.snapshot()['MAT-1-0'], 0)
+        ItemNotaFiscal.objects.get(nota_fiscal=self.recebimento.nota_fiscal, material=item.material).delete()
+        ItemPlanoCompra.objects.get(plano_compra=self.recebimento.plano_compra, material=item.material).delete()
+        # Sem o material em nenhuma fonte, a linha sai do snapshot
+        self.assertNotIn('MAT-1-0', self.snapshot())
+
+    def test_fresh_recalcula_e_informa_o_drift(self):
+        self.conciliar()
+        # Alteração que não passa pelos signals deixa o snapshot desatualizado
+        ItemRecebido.objects.filter(recebimento=self.recebimento).update(quantidade_contada=10)
+        self.assertEqual(len(self.conciliar().data), 3)
+
+        with self.assertLogs('core.conciliacao', 'WARNING'):
+            resposta = self.conciliar(fresh='1')
+        self.assertEqual((resposta['X-Conciliacao-Origem'], resposta['X-Conciliacao-Drift']), ('recalculado', '3'))
+        self.assertEqual(resposta.data, [])
+        self.assertEqual(self.conciliar(fresh='1')['X-Conciliacao-Drift'], '0')
+
+
+class ConsultasPorEndpointTest(DadosZeniteMixin, TestCase):
+    """
+    O número de consultas das listagens e dos detalhes não pode crescer com a
+    quantidade de registros nem com a quantidade de itens de cada registro, e
+    relações não expandidas não são consultadas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = cls.criar_usuario('analista', 'Analista')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def assertConsultasConstantes(self, url, consultas, criar_mais):
+        # A primeira requisição aquece o cache de grupos do usuário
+        self.client.get(url)
+        with self.assertNumQueries(consultas):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        criar_mais()
+        with self.assertNumQueries(consultas):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def criar_lote(self, quantidade=5, qtd_materiais=4):
+        inicio = Recebimento.objects.count() + 1
+        return [self.criar_recebimento(self.usuario, inicio + n, qtd_materiais) for n in range(quantidade)]
+
+    def test_listagem_de_recebimentos(self):
+        self.criar_lote(1, 1)
+        self.assertConsultasConstantes('/api/recebimentos/', 1, self.criar_lote)
+        self.assertConsultasConstantes(f'/api/recebimentos/?expand={EXPANDIR_RECEBIMENTO}', 5, self.criar_lote)
+
+    def adicionar_itens(self, recebimento, quantidade=5):
+        inicio = Material.objects.count()
+        for n in range(inicio, inicio + quantidade):
+            material = Material.objects.create(codigo_interno=f"EXTRA-{recebimento.pk}-{n}", descricao='Extra', unidade_medida='un')
+            ItemPlanoCompra.objects.create(plano_compra=recebimento.plano_compra, material=material, quantidade_prevista=1, preco_unitario=1)
+            ItemNotaFiscal.objects.create(nota_fiscal=recebimento.nota_fiscal, material=material, quantidade=1, valor_unitario=1)
+            ItemRecebido.objects.create(recebimento=recebimento, material=material, quantidade_contada=1)
+
+    # Os detalhes incluem a consulta de versão do ETag (core/condicional.py)
+    def test_detalhe_de_recebimento(self):
+        recebimento = self.criar_recebimento(self.usuario, 1, 1)
+        url = f'/api/recebimentos/{recebimento.pk}/'
+        self.assertConsultasConstantes(url, 2, lambda: self.adicionar_itens(recebimento))
+        self.assertConsultasConstantes(
+            f'{url}?expand={EXPANDIR_RECEBIMENTO}', 6, lambda: self.adicionar_itens(recebimento)
+        )
+
+    def test_listagem_de_inspecoes(self):
+        self.criar_lote(1, 1)
+        self.assertConsultasConstantes('/api/inspecoes-qualidade/', 1, self.criar_lote)
+        expandir = ','.join(f'recebimento.{caminho}' for caminho in EXPANDIR_RECEBIMENTO.split(','))
+        self.assertConsultasConstantes(f'/api/inspecoes-qualidade/?expand={expandir}', 5, self.criar_lote)
+
+    def test_detalhe_de_inspecao(self):
+        recebimento = self.criar_recebimento(self.usuario, 1, 1)
+        url = f'/api/inspecoes-qualidade/{recebimento.inspecao.pk}/'
+        self.assertConsultasConstantes(url, 2, lambda: self.adicionar_itens(recebimento))
+        expandir = ','.join(f'recebimento.{caminho}' for caminho in EXPANDIR_RECEBIMENTO.split(','))
+        self.assertConsultasConstantes(f'{url}?expand={expandir}', 6, lambda: self.adicionar_itens(recebimento))
+
+    def test_listagem_de_planos_e_notas(self):
+        self.criar_lote(1, 1)
+        self.assertConsultasConstantes('/api/planos-compra/', 1, self.criar_lote)
+        self.assertConsultasConstantes('/api/planos-compra/?expand=itens', 2, self.criar_lote)
+        self.assertConsultasConstantes('/api/notas-fiscais/', 1, self.criar_lote)
+        self.assertConsultasConstantes('/api/notas-fiscais/?expand=itens_nf', 2, self.criar_lote)
+
+
+class CamposDinamicosTest(DadosZeniteMixin, TestCase):
+    """ ?fields= e ?expand= definem a forma da resposta; relações vêm como id por padrão. """
+
+    def setUp(self):
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        self.recebimento = self.criar_recebimento(self.usuario, 1, 2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_relacoes_como_id_por_padrao(self):
+        dados = self.client.get(f'/api/recebimentos/{self.recebimento.pk}/').data
+        self.assertEqual(dados['plano_compra'], self.recebimento.plano_compra_id)
+        self.assertEqual(dados['nota_fiscal'], self.recebimento.nota_fiscal_id)
+        self.assertNotIn('itens_recebidos', dados)
+
+    def test_expansao_aninhada_e_campos(self):
+        url = (f'/api/inspecoes-qualidade/{self.recebimento.inspecao.pk}/'
+               '?expand=recebimento.itens_recebidos.defeitos_encontrados'
+               '&fields=id,recebimento.itens_recebidos,recebimento.plano_compra')
+        dados = self.client.get(url).data
+        self.assertEqual(set(dados), {'id', 'recebimento'})
+        self.assertEqual(set(dados['recebimento']), {'itens_recebidos', 'plano_compra'})
+        self.assertEqual(dados['recebimento']['plano_compra'], self.recebimento.plano_compra_id)
+        item = dados['recebimento']['itens_recebidos'][0]
+        self.assertEqual(item['defeitos_encontrados'][0]['defeito_nome'], 'Costura solta')
+
+    def test_escrita_ignora_a_forma(self):
+        material = Material.objects.create(codigo_interno='NOVO-1', descricao='Novo', unidade_medida='un')
+        resposta = self.client.post('/api/recebimentos/?fields=id', {
+            'plano_compra_id': self.recebimento.plano_compra_id,
+            'nota_fiscal_id': self.recebimento.nota_fiscal_id,
+            'itens_a_receber': [{'material_id': material.pk, 'quantidade_contada': '2.00'}],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.data['plano_compra'], self.recebimento.plano_compra_id)
+
+
+class CriacaoRecebimentoTest(DadosZeniteMixin, TestCase):
+    """ O recebimento e os itens são gravados juntos, com validação em consultas constantes. """
+
+    def setUp(self):
+        self.usuario = self.criar_usuario('conferente', 'Conferente')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.base = self.criar_recebimento(self.usuario, 1)
+        self.materiais = list(Material.objects.filter(codigo_interno__startswith='MAT-1-').order_by('id'))
+
+    def serializer(self, itens, **dados):
+        request = APIRequestFactory().post('/api/recebimentos/')
+        request.user = self.usuario
+        return RecebimentoSerializer(data={
+            'plano_compra_id': self.base.plano_compra_id, 'nota_fiscal_id': self.base.nota_fiscal_id,
+            'itens_a_receber': itens, **dados,
+        }, context={'request': request})
+
+    def itens(self, quantidade):
+        return [
+            {'material_id': self.materiais[n % 3].pk, 'quantidade_contada': '1.50'}
+            for n in range(quantidade)
+        ]
+
+    def test_validacao_com_consultas_constantes(self):
+        # Plano, nota fiscal e uma única consulta para todos os materiais
+        for quantidade in (3, 600):
+            serializer = self.serializer(self.itens(quantidade))
+            with self.assertNumQueries(3):
+                self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_erros_por_linha(self):
+        serializer = self.serializer([
+            {'material_id': self.materiais[0].pk, 'quantidade_contada': '1'},
+            {'material_id': 'x', 'quantidade_contada': '1.234'},
+        ])
+        self.assertFalse(serializer.is_valid())
+        erros = serializer.errors['itens_a_receber']
+        self.assertEqual(erros[0], {})
+        self.assertEqual(set(erros[1]), {'material_id', 'quantidade_contada'})
+
+        serializer = self.serializer([
+            {'material_id': self.materiais[0].pk, 'quantidade_contada': '1'},
+            {'material_id': 999999, 'quantidade_contada': '1'},
+        ])
+        self.assertFalse(serializer.is_valid())
+        erros = serializer.errors['itens_a_receber']
+        self.assertEqual(erros[0], {})
+        self.assertIn('999999', str(erros[1]['material_id']))
+
+    def test_falha_na_gravacao_desfaz_tudo(self):
+        serializer = self.serializer(self.itens(3))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        antes = (Recebimento.objects.count(), ItemRecebido.objects.count())
+        # Falha depois de cabeçalho e itens já inseridos: nada pode sobrar
+        with mock.patch('core.serializers.registrar_progresso', side_effect=IntegrityError('falha')):
+            with self.assertRaises(IntegrityError):
+                serializer.save()
+        self.assertEqual((Recebimento.objects.count(), ItemRecebido.objects.count()), antes)
+
+    def test_mesclar_duplicados(self):
+        serializer = self.serializer(self.itens(6), mesclar_duplicados=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        recebimento = serializer.save()
+        self.assertEqual(
+            sorted(recebimento.itens_recebidos.values_list('material_id', 'quantidade_contada')),
+            [(material.pk, Decimal('3.00')) for material in self.materiais],
+        )
+        # Sem mesclar, cada linha vira um item
+        serializer = self.serializer(self.itens(6))
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.save().itens_recebidos.count(), 6)
+
+
+class CacheDeGruposTest(DadosZeniteMixin, TestCase):
+    """ A permissão IsInGroup lê os grupos do cache, que é invalidado por m2m_changed. """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = self.criar_usuario('revisor', 'Revisor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_grupos_ficam_em_cache_entre_requisicoes(self):
+        self.assertEqual(self.client.get('/api/inspecoes-qualidade/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/inspecoes-qualidade/').status_code, 200)
+
+    def test_alteracao_de_grupos_invalida_o_cache(self):
+        def status_fornecedores():
+            # Cada requisição real recebe um objeto de usuário novo
+            self.client.force_authenticate(User.objects.get(pk=self.usuario.pk))
+            return self.client.get('/api/fornecedores/').status_code
+
+        self.assertEqual(status_fornecedores(), 403)
+        Group.objects.get_or_create(name='Analista')[0].user_set.add(self.usuario)
+        self.assertEqual(status_fornecedores(), 200)
+        self.usuario.groups.clear()
+        self.assertEqual(status_fornecedores(), 403)
+
+    def test_cache_local_do_processo_e_recusado(self):
+        self.assertEqual(cache_de_grupos_compartilhado(None), [])
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([erro.id for erro in cache_de_grupos_compartilhado(None)], ['core.E002'])
+            with override_settings(GRUPOS_CACHE_TTL=0):
+                self.assertEqual(cache_de_grupos_compartilhado(None), [])
+                # Sem cache, os grupos vêm do banco a cada requisição
+                Group.objects.get_or_create(name='Qualidade')[0].user_set.add(self.usuario)
+                for _ in range(2):
+                    usuario = User.objects.get(pk=self.usuario.pk)
+                    with self.assertNumQueries(1):
+                        self.assertEqual(grupos_do_usuario(usuario), {'Revisor', 'Qualidade'})
+
+
+class CacheDeTokensTest(DadosZeniteMixin, TestCase):
+    """ O token é resolvido pelo cache, mas revogar o token ou desativar o usuário vale na hora. """
+
+    def setUp(self):
+        cache.clear()
+        cache_tokens.limpar()
+        self.usuario = self.criar_usuario('conferente')
+        self.token = Token.objects.create(user=self.usuario)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_em_cache_nao_consulta_o_banco(self):
+        self.assertEqual(self.client.get('/api/planos-compra/').status_code, 200)
+        # Resta apenas a consulta da listagem (vazia, sem prefetch)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/planos-compra/').status_code, 200)
+
+    def test_revogacao_e_desativacao_invalidam_o_cache(self):
+        self.assertEqual(self.client.get('/api/planos-compra/').status_code, 200)
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertEqual(self.client.get('/api/planos-compra/').status_code, 401)
+
+        self.usuario.is_active = True
+        self.usuario.save()
+        self.assertEqual(self.client.get('/api/planos-compra/').status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/planos-compra/').status_code, 401)
+
+    @override_settings(TOKEN_CACHE={'TTL': 60, 'USAR_CACHE_DJANGO': True})
+    def test_revogacao_vale_para_todos_os_processos(self):
+        # Dois processos com o LRU local próprio e o mesmo cache do Django
+        processo_a, processo_b = CacheTokens(), CacheTokens()
+        processo_a.guardar(self.token.key, self.usuario, self.token)
+        self.assertIsNotNone(processo_b.obter(self.token.key))
+        self.assertEqual(processo_b.estatisticas()['acertos_cache_django'], 1)
+        self.assertIsNotNone(processo_b.obter(self.token.key))
+        self.assertEqual(processo_b.estatisticas()['acertos'], 1)
+
+        # Só o processo A recebe o signal da revogação
+        processo_a.remover([self.token.key])
+        self.assertIsNone(processo_a.obter(self.token.key))
+        self.assertIsNone(processo_b.obter(self.token.key))
+        self.assertEqual(processo_b.estatisticas()['revogados'], 1)
+
+    @override_settings(TOKEN_CACHE={'TTL': 60, 'USAR_CACHE_DJANGO': True})
+    def test_copia_local_nao_reinicia_o_ttl(self):
+        processo_a, processo_b = CacheTokens(), CacheTokens()
+        processo_a.guardar(self.token.key, self.usuario, self.token)
+        # O processo B encontra a entrada compartilhada 50 s depois de gravada
+        with mock.patch('core.authentication.time.time', return_value=time.time() + 50):
+            self.assertIsNotNone(processo_b.obter(self.token.key))
+        expira_em = processo_b._itens[self.token.key][0]
+        self.assertLessEqual(expira_em - time.monotonic(), 10)
+
+    def test_cache_local_do_processo_e_recusado(self):
+        self.assertEqual(cache_de_tokens_compartilhado(None), [])
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([erro.id for erro in cache_de_tokens_compartilhado(None)], ['core.E001'])
+        with override_settings(TOKEN_CACHE={'USAR_CACHE_DJANGO': False}):
+            self.assertEqual([erro.id for erro in cache_de_tokens_compartilhado(None)], ['core.W001'])
+
+
+NFE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">
+  <NFe><infNFe versao="4.00">
+    <ide><nNF>{numero}</nNF><dhEmi>2025-06-10T09:30:00-03:00</dhEmi></ide>
+    <emit><CNPJ>{cnpj}</CNPJ><xNome>Fornecedor</xNome></emit>
+    {itens}
+    <total><ICMSTot><vNF>{total}</vNF></ICMSTot></total>
+  </infNFe></NFe>
+</nfeProc>"""
+
+NFE_ITEM = """<det nItem="1"><prod><cProd>{codigo}</cProd><qCom>{quantidade}</qCom><vUnCom>{valor}</vUnCom></prod></det>"""
+
+
+class ImportacaoNFeTest(DadosZeniteMixin, TestCase):
+    """ Upload de XML de NF-e em /api/notas-fiscais/importar-xml/. """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.criar_usuario('analista', 'Analista'))
+        self.fornecedor = Fornecedor.objects.create(razao_social='Curtume', cnpj='12345678000199')
+        for codigo in ('COURO-1', 'COURO-2'):
+            Material.objects.create(codigo_interno=codigo, descricao=codigo, unidade_medida='m²')
+
+    def enviar(self, numero='1001', itens=(('COURO-1', '10.5000', '20.0000000000'),), cnpj='12345678000199'):
+        xml = NFE_XML.format(
+            numero=numero, cnpj=cnpj, total='210.00',
+            itens=''.join(NFE_ITEM.format(codigo=c, quantidade=q, valor=v) for c, q, v in itens),
+        )
+        arquivo = SimpleUploadedFile(f'{numero}.xml', xml.encode('utf-8'), content_type='text/xml')
+        return self.client.post('/api/notas-fiscais/importar-xml/', {'arquivos': [arquivo]}, format='multipart')
+
+    def test_cria_e_depois_atualiza_a_nota(self):
+        with self.settings(MEDIA_ROOT=self.enterContext(TemporaryDirectory())):
+            resposta = self.enviar()
+            self.assertEqual(resposta.status_code, 201, resposta.data)
+            self.assertEqual(resposta.data[0]['status'], 'criada')
+            nota = NotaFiscal.objects.get(numero='1001', fornecedor=self.fornecedor)
+            self.assertEqual(nota.itens_nf.get().quantidade, Decimal('10.50'))
+            self.assertTrue(nota.arquivo_xml.name.endswith('.xml'))
+
+            resposta = self.enviar(itens=(('COURO-1', '1', '1'), ('COURO-2', '2', '1')))
+            self.assertEqual(resposta.data[0]['status'], 'atualizada')
+            self.assertEqual(NotaFiscal.objects.count(), 1)
+            self.assertEqual(nota.itens_nf.count(), 2)
+
+    def test_fornecedor_ou_material_desconhecido(self):
+        resposta = self.enviar(itens=(('NAO-EXISTE', '1', '1'),), cnpj='00000000000000')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(len(resposta.data[0]['erros']), 2)
+        self.assertFalse(NotaFiscal.objects.exists())
+
+    def test_reimportacao_atualiza_o_snapshot(self):
+        # NF 7 com MAT-7-0..2 (10 cada), já conciliada
+        recebimento = self.criar_recebimento(self.criar_usuario('conferente'), 7)
+        conciliar_com_snapshot(recebimento)
+        with self.settings(MEDIA_ROOT=self.enterContext(TemporaryDirectory())):
+            resposta = self.enviar(numero='7', cnpj=f'{7:014d}', itens=(('MAT-7-0', '12', '5'),))
+        self.assertEqual(resposta.data[0]['status'], 'atualizada')
+        self.assertEqual(
+            dict(recebimento.conciliacao_itens.values_list('material__codigo_interno', 'qtd_nf')),
+            {'MAT-7-0': 12, 'MAT-7-1': 0, 'MAT-7-2': 0},
+        )
+
+    def test_reimportacao_nao_consulta_por_item_excluido(self):
+        # NF 7 com 2 itens e NF 8 com 30, ambas já conciliadas
+        usuario = self.criar_usuario('conferente')
+        self.client.get('/api/notas-fiscais/')  # grupos do usuário já em cache
+        consultas = []
+        for indice, qtd_materiais in ((7, 2), (8, 30)):
+            recebimento = self.criar_recebimento(usuario, indice, qtd_materiais=qtd_materiais)
+            conciliar_com_snapshot(recebimento)
+            with self.settings(MEDIA_ROOT=self.enterContext(TemporaryDirectory())):
+                with CaptureQueriesContext(connection) as contexto:
+                    resposta = self.enviar(numero=str(indice), cnpj=f'{indice:014d}', itens=((f'MAT-{indice}-0', '12', '5'),))
+            self.assertEqual(resposta.data[0]['status'], 'atualizada')
+            self.assertEqual(recebimento.conciliacao_itens.get(material__codigo_interno=f'MAT-{indice}-1').qtd_nf, 0)
+            consultas.append(len(contexto))
+        self.assertEqual(consultas[0], consultas[1])
+
+    def test_leitura_descarta_os_itens_processados(self):
+        itens = ''.join(NFE_ITEM.format(codigo=f'COURO-{n % 2 + 1}', quantidade='1', valor='1') for n in range(50))
+        xml = NFE_XML.format(numero='1', cnpj='12345678000199', total='50.00', itens=itens)
+        raizes = []
+        iterparse_original = nfe.iterparse
+
+        def iterparse(*args, **kwargs):
+            for evento, elemento in iterparse_original(*args, **kwargs):
+                if not raizes:
+                    raizes.append(elemento)
+                yield evento, elemento
+
+        with mock.patch('core.nfe.iterparse', iterparse):
+            nota = nfe.ler_nfe(io.BytesIO(xml.encode('utf-8')))
+        self.assertEqual(len(nota['itens']), 50)
+        self.assertFalse([elemento for elemento in raizes[0].iter() if elemento.tag.endswith('det')])
+
+
+class ImportacaoLoteNFeTest(DadosZeniteMixin, TestCase):
+    """ Importação de um ZIP de XMLs: duplicadas puladas sem consulta e arquivos inválidos reportados. """
+
+    def setUp(self):
+        self.fornecedor = Fornecedor.objects.create(razao_social='Curtume', cnpj='12345678000199')
+        Material.objects.create(codigo_interno='COURO-1', descricao='Couro', unidade_medida='m²')
+        NotaFiscal.objects.create(numero='3000', fornecedor=self.fornecedor, data_emissao='2025-06-01', valor_total=1)
+
+    def xml(self, numero):
+        itens = NFE_ITEM.format(codigo='COURO-1', quantidade='1', valor='1')
+        return NFE_XML.format(numero=numero, cnpj='12345678000199', total='1', itens=itens)
+
+    def test_zip_com_duplicadas_e_arquivo_invalido(self):
+        conteudo = io.BytesIO()
+        with zipfile.ZipFile(conteudo, 'w') as arquivo_zip:
+            arquivo_zip.writestr('3000.xml', self.xml('3000'))  # já cadastrada
+            arquivo_zip.writestr('3001.xml', self.xml('3001'))
+            arquivo_zip.writestr('quebrado.xml', '<nfeProc><NFe>')
+            arquivo_zip.writestr('leia-me.txt', 'ignorado')
+            arquivo_zip.writestr('copia/3001.xml', self.xml('3001'))  # repetida em outro lote
+        conteudo.seek(0)
+
+        resultados = [
+            resultado
+            for lote in nfe_lote.importar_arquivos(conteudo, tamanho_lote=2)
+            for resultado in lote
+        ]
+        self.assertEqual(
+            [(resultado['arquivo'], resultado['status']) for resultado in resultados],
+            [('3000.xml', 'duplicada'), ('3001.xml', 'criada'), ('quebrado.xml', 'erro'), ('copia/3001.xml', 'duplicada')],
+        )
+        self.assertIn('XML inválido', resultados[2]['erros'][0])
+        self.assertEqual(NotaFiscal.objects.filter(numero='3001').count(), 1)
+
+    def test_endpoint_le_no_proprio_processo(self):
+        conteudo = io.BytesIO()
+        with zipfile.ZipFile(conteudo, 'w') as arquivo_zip:
+            arquivo_zip.writestr('3001.xml', self.xml('3001'))
+            arquivo_zip.writestr('3002.xml', self.xml('3002'))
+        arquivo = SimpleUploadedFile('notas.zip', conteudo.getvalue(), content_type='application/zip')
+        self.client = APIClient()
+        self.client.force_authenticate(self.criar_usuario('analista', 'Analista'))
+        with mock.patch('core.nfe_lote.ProcessPoolExecutor', side_effect=AssertionError):
+            resposta = self.client.post('/api/notas-fiscais/importar-lote/?workers=4', {'arquivo': arquivo}, format='multipart')
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        self.assertEqual(resposta.data['resumo']['criada'], 2)
+
+
+class InstrumentacaoTest(DadosZeniteMixin, TestCase):
+    """ Server-Timing em todas as respostas e percentis por rota em /api/metricas/. """
+
+    def setUp(self):
+        cache.clear()
+        agregado_rotas.limpar()
+        self.client = APIClient()
+
+    def test_server_timing_e_metricas(self):
+        self.criar_recebimento(self.criar_usuario('conferente'), 1)
+        self.client.force_authenticate(self.criar_usuario('admin', 'Administrador'))
+        resposta = self.client.get('/api/recebimentos/')
+        self.assertIn('db;dur=', resposta['Server-Timing'])
+        self.assertRegex(resposta['Server-Timing'], r'ser;dur=\d+\.\d')
+
+        metricas = self.client.get('/api/metricas/').data
+        self.assertEqual(metricas['rotas']['GET recebimento-list']['requisicoes'], 1)
+        self.assertIn('cache_tokens', metricas)
+
+    def test_metricas_apenas_para_administradores(self):
+        self.client.force_authenticate(self.criar_usuario('analista', 'Analista'))
+        self.assertEqual(self.client.get('/api/metricas/').status_code, 403)
+
+    def test_fingerprint_agrupa_consultas_iguais(self):
+        self.assertEqual(
+            fingerprint_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) AND nome = 'a'"),
+            fingerprint_sql("SELECT *  FROM t WHERE id IN (%s) AND nome = 'outro'"),
+        )
+
+
+class ProgressoPlanoTest(DadosZeniteMixin, TestCase):
+    """ Totais recebidos por plano mantidos por deltas, e o status do plano calculado a partir deles. """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        # Plano com 3 materiais x 10 previstos; o recebimento inicial conta 9 de cada
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+        self.plano = self.recebimento.plano_compra
+
+    def progresso(self):
+        return self.client.get(f'/api/planos-compra/{self.plano.pk}/progresso/').data
+
+    def test_criacao_edicao_e_exclusao_atualizam_totais_e_status(self):
+        dados = self.progresso()
+        self.assertEqual(dados['status'], 'Parcial')
+        self.assertEqual(dados['qtd_recebida'], 27)
+
+        # Um segundo recebimento pelo serializer completa o plano
+        materiais = [item.material_id for item in self.plano.itens.all()]
+        resposta = self.client.post('/api/recebimentos/', {
+            'plano_compra_id': self.plano.pk, 'nota_fiscal_id': self.recebimento.nota_fiscal_id,
+            'itens_a_receber': [{'material_id': material, 'quantidade_contada': '1'} for material in materiais],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        dados = self.progresso()
+        self.assertEqual((dados['status'], dados['qtd_recebida'], dados['percentual']), ('Concluido', 30, 100))
+
+        # Editar e excluir itens devolvem o plano para Parcial
+        item = self.recebimento.itens_recebidos.first()
+        item.quantidade_contada = 5
+        item.save()
+        self.assertEqual(self.progresso()['qtd_recebida'], 26)
+        Recebimento.objects.get(pk=resposta.data['id']).delete()
+        dados = self.progresso()
+        self.assertEqual((dados['status'], dados['qtd_recebida']), ('Parcial', 23))
+
+        self.recebimento.delete()
+        self.assertEqual(self.progresso()['status'], 'Aberto')
+
+    def test_plano_cancelado_nao_muda_e_reconstrucao_corrige_divergencia(self):
+        PlanoCompra.objects.filter(pk=self.plano.pk).update(status='Cancelado')
+        ProgressoPlanoMaterial.objects.filter(plano_compra=self.plano).update(quantidade_recebida=999)
+        self.assertEqual(reconstruir_progresso([self.plano.pk]), 3)
+        self.assertEqual(atualizar_status_planos([self.plano.pk]), {})
+        dados = self.progresso()
+        self.assertEqual((dados['status'], dados['qtd_recebida']), ('Cancelado', 27))
+
+
+class ScorecardFornecedorTest(DadosZeniteMixin, TestCase):
+    """ Scorecard diário atualizado de forma incremental e consultado por período. """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        # 3 materiais: plano 10, NF 10 e recebido 9 de cada, 1 defeito por item, inspecionado
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+        self.fornecedor = self.recebimento.plano_compra.fornecedor
+
+    def scorecard(self, **params):
+        return self.client.get(f'/api/fornecedores/{self.fornecedor.pk}/scorecard/', params).data
+
+    def test_indicadores_e_atualizacao_incremental(self):
+        self.assertEqual(atualizar_scorecard(), 1)
+        dados = self.scorecard()
+        self.assertEqual(dados['recebimentos'], 1)
+        self.assertEqual(dados['atendimento'], 90.0)
+        self.assertEqual(dados['acuracia_nf'], 100.0)
+        self.assertEqual(dados['taxa_defeitos'], round(3 / 27 * 100, 2))
+
+        # Um novo defeito entra na próxima atualização incremental
+        item = self.recebimento.itens_recebidos.first()
+        ItemInspecionadoDefeito.objects.create(item_recebido=item, defeito=Defeito.objects.get(), quantidade_defeituosa=6)
+        self.assertEqual(atualizar_scorecard(), 1)
+        self.assertEqual(self.scorecard()['taxa_defeitos'], round(9 / 27 * 100, 2))
+
+        # Fora do período não há recebimentos
+        self.assertEqual(self.scorecard(data_fim='2000-01-01')['recebimentos'], 0)
+
+    def envelhecer(self):
+        """ Tira da janela da marca tudo o que foi gravado até agora. """
+        for modelo in (
+            Recebimento, PlanoCompra, NotaFiscal, InspecaoQualidade, ItemInspecionadoDefeito,
+            ItemPlanoCompra, ItemNotaFiscal, ItemRecebido,
+        ):
+            modelo.objects.update(updated_at=timezone.now() - timedelta(days=1))
+
+    def test_itens_e_exclusoes_marcam_o_dia(self):
+        atualizar_scorecard()
+        self.envelhecer()
+        self.assertEqual(atualizar_scorecard(), 0)
+
+        # Quantidades dos itens do plano, da NF e do recebimento
+        item_nf = ItemNotaFiscal.objects.filter(nota_fiscal=self.recebimento.nota_fiscal).first()
+        item_nf.quantidade = 8
+        item_nf.save()
+        self.assertEqual(atualizar_scorecard(), 1)
+        self.assertEqual(self.scorecard()['acuracia_nf'], round(2 / 3 * 100, 2))
+        self.envelhecer()
+        item = self.recebimento.itens_recebidos.first()
+        item.quantidade_contada = 10
+        item.save()
+        self.assertEqual(atualizar_scorecard(), 1)
+        self.assertEqual(self.scorecard()['atendimento'], round(28 / 30 * 100, 2))
+
+        # Exclusões ficam pendentes até a próxima atualização
+        self.envelhecer()
+        ItemPlanoCompra.objects.filter(plano_compra=self.recebimento.plano_compra, material=item.material).delete()
+        self.assertEqual(ScorecardDiaPendente.objects.count(), 1)
+        self.assertEqual(atualizar_scorecard(), 1)
+        self.assertFalse(ScorecardDiaPendente.objects.exists())
+        self.assertEqual(self.scorecard()['atendimento'], 90.0)
+
+        self.envelhecer()
+        self.recebimento.delete()
+        self.assertEqual(atualizar_scorecard(), 1)
+        self.assertEqual(self.scorecard()['recebimentos'], 0)
+
+    def test_ranking(self):
+        outro = self.criar_recebimento(self.usuario, 2)
+        PlanoCompra.objects.filter(pk=self.recebimento.plano_compra_id).update(data_prevista_entrega='2100-01-01')
+        PlanoCompra.objects.filter(pk=outro.plano_compra_id).update(data_prevista_entrega='2000-01-01')
+        atualizar_scorecard(completo=True)
+        ranking = self.client.get('/api/fornecedores/ranking/', {'ordenar': 'pontualidade'}).data['fornecedores']
+        self.assertEqual([item['fornecedor_id'] for item in ranking], [self.fornecedor.pk, outro.plano_compra.fornecedor_id])
+        self.assertEqual([item['pontualidade'] for item in ranking], [100.0, 0.0])
+        self.assertEqual(self.client.get('/api/fornecedores/ranking/', {'ordenar': 'x'}).status_code, 400)
+
+
+class ParetoDefeitosTest(DadosZeniteMixin, TestCase):
+    """ Fatos de defeito gravados pelos signals e Pareto com cache invalidado por novos defeitos. """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = self.criar_usuario('revisor', 'Revisor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        # 3 materiais por recebimento, 1 defeito "Costura solta" em cada item
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+        self.criar_recebimento(self.usuario, 2)
+
+    def pareto(self, **params):
+        return self.client.get('/api/defeitos/pareto/', params)
+
+    def test_fatos_gravados_e_desnormalizados(self):
+        self.assertEqual(FatoDefeito.objects.count(), 6)
+        fato = FatoDefeito.objects.filter(recebimento=self.recebimento).first()
+        self.assertEqual(fato.fornecedor_id, self.recebimento.plano_compra.fornecedor_id)
+        FatoDefeito.objects.all().delete()
+        self.assertEqual(atualizar_fatos_defeito(), 6)
+
+    def test_pareto_com_top_e_cache(self):
+        item = self.recebimento.itens_recebidos.order_by('id').first()
+        defeito = Defeito.objects.create(nome='Mancha')
+        ItemInspecionadoDefeito.objects.create(item_recebido=item, defeito=defeito, quantidade_defeituosa=2)
+
+        dados = self.pareto(agrupar='defeito').data
+        self.assertEqual([linha['rotulo'] for linha in dados['itens']], ['Costura solta', 'Mancha'])
+        self.assertEqual([linha['percentual_acumulado'] for linha in dados['itens']], [75.0, 100.0])
+
+        dados = self.pareto(agrupar='material', top=2, fornecedor=self.recebimento.plano_compra.fornecedor_id).data
+        self.assertEqual(dados['itens'][0]['quantidade'], 3)
+        self.assertEqual(dados['outros']['grupos'], 1)
+        self.assertEqual(dados['outros']['percentual_acumulado'], 100.0)
+
+        # A repetição vem do cache; um defeito novo invalida o resultado
+        with self.assertNumQueries(0):
+            self.pareto(agrupar='material', top=2, fornecedor=self.recebimento.plano_compra.fornecedor_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemInspecionadoDefeito.objects.create(item_recebido=item, defeito=defeito, quantidade_defeituosa=5)
+        self.assertEqual(self.pareto(agrupar='defeito').data['itens'][0]['rotulo'], 'Mancha')
+
+        self.assertEqual(self.pareto(agrupar='x').status_code, 400)
+
+
+class ExportacaoTest(DadosZeniteMixin, TestCase):
+    """ Exportações em streaming (CSV e XLSX) com os filtros das listagens. """
+
+    def setUp(self):
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        # 3 materiais: plano 10, NF 10 e recebido 9 de cada
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+        self.criar_recebimento(self.usuario, 2)
+
+    def baixar(self, url, **params):
+        resposta = self.client.get(url, params)
+        self.assertEqual(resposta.status_code, 200)
+        return b''.join(resposta.streaming_content)
+
+    def test_csv_com_filtro_e_conciliacao(self):
+        fornecedor = self.recebimento.plano_compra.fornecedor_id
+        conteudo = self.baixar('/api/recebimentos/exportar/', fornecedor=fornecedor, conciliacao='1')
+        linhas = list(csv.DictReader(io.StringIO(conteudo.decode('utf-8-sig'))))
+        self.assertEqual(len(linhas), 3)
+        self.assertEqual({linha['recebimento_id'] for linha in linhas}, {str(self.recebimento.pk)})
+        self.assertEqual(linhas[0]['qtd_nf'], '10.00')
+        self.assertEqual(linhas[0]['tipo_divergencia'], 'Recebido a menos que a NF')
+
+        planos = self.baixar('/api/planos-compra/exportar/', conciliacao='1').decode('utf-8-sig')
+        self.assertEqual(list(csv.DictReader(io.StringIO(planos)))[0]['saldo'], '1.00')
+        self.assertEqual(self.client.get('/api/recebimentos/exportar/', {'formato': 'pdf'}).status_code, 400)
+
+    def test_xlsx(self):
+        conteudo = self.baixar('/api/notas-fiscais/exportar/', formato='xlsx')
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+            self.assertIn('xl/workbook.xml', pacote.namelist())
+            planilha = pacote.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        # Cabeçalho + 3 itens de cada uma das 2 notas
+        self.assertEqual(planilha.count('<row>'), 7)
+        self.assertIn('MAT-1-0', planilha)
+
+
+class BuscaTest(DadosZeniteMixin, TestCase):
+    """ Autocompletar de materiais e fornecedores. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = cls.criar_usuario('conferente')
+        cls.criar_recebimento(cls.usuario, 1)
+        cls.criar_recebimento(cls.usuario, 12)
+        Material.objects.create(codigo_interno='CAB-100', descricao='Cabedal sintético preto', unidade_medida='m²')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def buscar(self, recurso, **params):
+        resposta = self.client.get(f'/api/{recurso}/busca/', params)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.data
+
+    def test_materiais(self):
+        # Prefixo do código, sem diferenciar maiúsculas
+        codigos = [linha['codigo_interno'] for linha in self.buscar('materiais', q='mat-1', limite=2)]
+        self.assertEqual(codigos, ['MAT-1-0', 'MAT-1-1'])
+        # Parte da descrição
+        self.assertEqual(self.buscar('materiais', q='sintético')[0]['codigo_interno'], 'CAB-100')
+        self.assertEqual(self.buscar('materiais', q=''), [])
+
+    def test_fornecedores(self):
+        # CNPJ com pontuação usa o prefixo
+        resultado = self.buscar('fornecedores', q='00.000.000/0000')
+        self.assertEqual(sorted(linha['razao_social'] for linha in resultado), ['Fornecedor 1', 'Fornecedor 12'])
+        self.assertEqual(self.buscar('fornecedores', q='Fornecedor 12')[0]['cnpj'], f'{12:014d}')
+
+    def test_busca_por_trecho_usa_os_indices(self):
+        if not trigramas_disponiveis():
+            self.skipTest('Extensão pg_trgm indisponível: a busca usa ILIKE, sem índice.')
+        # Na tabela pequena o planejador preferiria ler tudo; sem seq scan, qualquer
+        # ramo do OR que nenhum índice atenda ainda obrigaria a ler a tabela inteira.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for consulta in (materiais_similares('sintético'), fornecedores_similares('fornecedor')):
+            self.assertNotIn('Seq Scan', consulta.explain())
+
+
+class RespostaCondicionalTest(DadosZeniteMixin, TestCase):
+    """ ETag/Last-Modified e 304 sem serializar quando nada mudou. """
+
+    def setUp(self):
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+
+    def test_detalhe_com_dependencias(self):
+        url = f'/api/recebimentos/{self.recebimento.pk}/'
+        resposta = self.client.get(url)
+        etag = resposta['ETag']
+        self.assertTrue(resposta.has_header('Last-Modified'))
+
+        # Sem mudanças: 304 com uma consulta de versão (mais as de autenticação/permissão)
+        with self.assertNumQueries(1):
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+        # Alterar um item aninhado muda a versão
+        item = self.recebimento.itens_recebidos.first()
+        item.quantidade_contada = 8
+        item.save()
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+        # Excluir um defeito (sem outra alteração) também
+        etag = resposta['ETag']
+        ItemInspecionadoDefeito.objects.filter(item_recebido__recebimento=self.recebimento).first().delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_listagem_de_fornecedores(self):
+        resposta = self.client.get('/api/fornecedores/')
+        self.assertEqual(self.client.get('/api/fornecedores/', HTTP_IF_NONE_MATCH=resposta['ETag']).status_code, 304)
+        Fornecedor.objects.create(razao_social='Novo', cnpj='99999999999999')
+        self.assertEqual(self.client.get('/api/fornecedores/', HTTP_IF_NONE_MATCH=resposta['ETag']).status_code, 200)
+
+
+@override_settings(PARALELO_CONN_MAX_AGE=0)  # sem conexões abertas em outras threads ao fim dos testes
+class ViewsAssincronasTest(DadosZeniteMixin, TransactionTestCase):
+    """
+    As leituras em /api/async/ devolvem o mesmo que as síncronas. TransactionTestCase:
+    as consultas em paralelo usam outras conexões, que precisam ver os dados.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.cabecalhos = {'Authorization': f'Token {Token.objects.create(user=self.usuario).key}'}
+        self.cliente_async = AsyncClient()
+
+    def get_async(self, url, **cabecalhos):
+        return async_to_sync(self.cliente_async.get)(url, headers={**self.cabecalhos, **cabecalhos})
+
+    def test_detalhe_expandido_e_304(self):
+        caminho = f'recebimentos/{self.recebimento.pk}/?expand=plano_compra.itens,nota_fiscal.itens_nf,itens_recebidos.defeitos_encontrados'
+        resposta = self.get_async(f'/api/async/{caminho}')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json(), self.client.get(f'/api/{caminho}').json())
+        self.assertIn('db;dur=', resposta['Server-Timing'])
+        self.assertEqual(self.get_async(f'/api/async/{caminho}', If_None_Match=resposta['ETag']).status_code, 304)
+
+    def test_listagem_e_conciliacao(self):
+        self.criar_recebimento(self.usuario, 2)
+        for caminho in ('inspecoes-qualidade/?expand=recebimento.itens_recebidos&page_size=1', 'fornecedores/',
+                        f'recebimentos/{self.recebimento.pk}/conciliar/?fresh=1'):
+            resposta = self.get_async(f'/api/async/{caminho}')
+            self.assertEqual(resposta.status_code, 200, caminho)
+            sincrona = self.client.get(f'/api/{caminho}').json()
+            if 'results' in sincrona:
+                self.assertEqual(resposta.json()['results'], sincrona['results'])
+                self.assertIn('/api/async/inspecoes-qualidade/', resposta.json()['next'])
+            else:
+                self.assertEqual(resposta.json(), sincrona)
+
+    def test_autenticacao_e_metodo(self):
+        resposta = async_to_sync(self.cliente_async.post)('/api/async/recebimentos/', headers=self.cabecalhos)
+        self.assertEqual(resposta.status_code, 405)
+        self.cabecalhos = {}
+        self.assertEqual(self.get_async('/api/async/recebimentos/').status_code, 401)
+
+
+class JobsTest(DadosZeniteMixin, TestCase):
+    """ ?async=1 devolve 202 com o job, executado depois por processar_fila (zenite_worker). """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_conciliacao_em_segundo_plano(self):
+        caminho = f'/api/recebimentos/{self.recebimento.pk}/conciliar/'
+        resposta = self.client.get(f'{caminho}?async=1')
+        self.assertEqual(resposta.status_code, 202)
+        job_id = resposta.data['id']
+        self.assertTrue(resposta['Location'].endswith(f'/api/jobs/{job_id}/'))
+        self.assertEqual(resposta.data['status'], Job.PENDENTE)
+        # O mesmo pedido ainda na fila reaproveita o job
+        self.assertEqual(self.client.get(f'{caminho}?async=1').data['id'], job_id)
+
+        self.assertEqual(processar_fila('teste', uma_vez=True), 1)
+        job = self.client.get(f'/api/jobs/{job_id}/').json()
+        self.assertEqual((job['status'], job['progresso'], job['tentativas']), (Job.CONCLUIDO, 100, 1))
+        self.assertEqual(job['resultado']['divergencias'], self.client.get(caminho).json())
+
+        # Jobs de outros usuários só para administradores
+        self.client.force_authenticate(self.criar_usuario('outro', 'Analista'))
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/').status_code, 404)
+        self.client.force_authenticate(self.criar_usuario('admin', 'Administrador'))
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/').status_code, 200)
+
+    def test_nova_tentativa_com_espera_e_falha(self):
+        @tarefa('teste_falha')
+        def falhar(parametros, progresso):
+            progresso(40, 'quase')
+            raise RuntimeError('falha de teste')
+        self.addCleanup(TAREFAS.pop, 'teste_falha')
+
+        job = enfileirar('teste_falha', usuario=self.usuario, max_tentativas=2)
+        with self.assertLogs('core.jobs', 'WARNING'):
+            processar_fila('teste', uma_vez=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.tentativas, job.progresso, job.erro), (Job.PENDENTE, 1, 40, 'falha de teste'))
+        self.assertGreater(job.executar_apos, timezone.now())
+        # Ainda esperando a próxima tentativa
+        self.assertEqual(processar_fila('teste', uma_vez=True), 0)
+
+        Job.objects.filter(pk=job.pk).update(executar_apos=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            processar_fila('teste', uma_vez=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.tentativas), (Job.FALHOU, 2))
+        self.assertIsNotNone(job.concluido_em)
+
+    def test_job_sem_sinal_do_worker_volta_para_a_fila(self):
+        job = enfileirar('scorecard')
+        self.assertEqual(reservar('teste').pk, job.pk)
+        Job.objects.filter(pk=job.pk).update(batimento_em=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(recuperar_expirados(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.PENDENTE, ''))
+
+    def test_importacao_de_lote_em_segundo_plano(self):
+        Fornecedor.objects.create(razao_social='Curtume', cnpj='12345678000199')
+        Material.objects.create(codigo_interno='COURO-1', descricao='Couro', unidade_medida='m²')
+        conteudo = io.BytesIO()
+        with zipfile.ZipFile(conteudo, 'w') as arquivo_zip:
+            for numero in ('2001', '2002'):
+                itens = NFE_ITEM.format(codigo='COURO-1', quantidade='1', valor='1')
+                arquivo_zip.writestr(f'{numero}.xml', NFE_XML.format(numero=numero, cnpj='12345678000199', total='1', itens=itens))
+        arquivo = SimpleUploadedFile('notas.zip', conteudo.getvalue(), content_type='application/zip')
+
+        media = self.enterContext(TemporaryDirectory())
+        # O job lê os XMLs no próprio processo, mesmo que o cliente peça workers
+        self.enterContext(mock.patch('core.nfe_lote.ProcessPoolExecutor', side_effect=AssertionError))
+        with self.settings(MEDIA_ROOT=media):
+            resposta = self.client.post('/api/notas-fiscais/importar-lote/?async=1&workers=4', {'arquivo': arquivo}, format='multipart')
+            self.assertEqual(resposta.status_code, 202)
+            processar_fila('teste', uma_vez=True)
+            job = Job.objects.get(pk=resposta.data['id'])
+            self.assertEqual(job.status, Job.CONCLUIDO, job.erro)
+            self.assertEqual(job.resultado['resumo']['criada'], 2)
+            self.assertEqual(NotaFiscal.objects.filter(numero__in=['2001', '2002']).count(), 2)
+            # O ZIP enviado é removido depois da importação
+            self.assertEqual([arquivos for _, _, arquivos in os.walk(os.path.join(media, 'jobs')) if arquivos], [])
+
+        invalido = SimpleUploadedFile('notas.zip', b'nao e zip')
+        resposta = self.client.post('/api/notas-fiscais/importar-lote/?async=1', {'arquivo': invalido}, format='multipart')
+        self.assertEqual(resposta.status_code, 400)
+
+
+class FilaDeJobsTest(TransactionTestCase):
+    """ SKIP LOCKED: um job travado por outro worker é pulado, sem espera. """
+
+    def test_workers_nao_pegam_o_mesmo_job(self):
+        primeiro, segundo = enfileirar('scorecard'), enfileirar('fatos_defeito')
+        travado, liberar = threading.Event(), threading.Event()
+
+        def outro_worker():
+            try:
+                with transaction.atomic():
+                    Job.objects.select_for_update().get(pk=primeiro.pk)
+                    travado.set()
+                    liberar.wait(10)
+            finally:
+                # A conexão da thread não pode sobrar para a remoção do banco de testes
+                connection.close()
+
+        thread = threading.Thread(target=outro_worker)
+        thread.start()
+        try:
+            travado.wait(10)
+            self.assertEqual(reservar('teste').pk, segundo.pk)
+            self.assertIsNone(reservar('teste'))
+        finally:
+            liberar.set()
+            thread.join()
+        self.assertEqual(reservar('teste').pk, primeiro.pk)
+
+
+class RegistrarDefeitosEmLoteTest(DadosZeniteMixin, TestCase):
+    """ /api/inspecoes-qualidade/<id>/registrar_defeitos/: várias linhas, consultas constantes. """
+
+    def setUp(self):
+        cache.clear()
+        usuario = self.criar_usuario('revisor', 'Revisor')
+        self.recebimento = self.criar_recebimento(usuario, 1)
+        self.url = f'/api/inspecoes-qualidade/{self.recebimento.inspecao.pk}/registrar_defeitos/'
+        self.itens = list(self.recebimento.itens_recebidos.order_by('id').values_list('id', flat=True))
+        self.defeito = Defeito.objects.create(nome='Mancha')
+        grupos_do_usuario(usuario)
+        self.client = APIClient()
+        self.client.force_authenticate(usuario)
+
+    def enviar(self, linhas):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.post(self.url, linhas, format='json')
+        return resposta, len(consultas)
+
+    def test_grava_o_lote_e_os_fatos(self):
+        linhas = [{'item_recebido_id': item, 'defeito_id': self.defeito.pk, 'quantidade_defeituosa': '1'} for item in self.itens]
+        resposta, consultas_tres = self.enviar({'defeitos': linhas})
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        self.assertEqual(FatoDefeito.objects.filter(item_defeito__in=resposta.data['ids']).count(), 3)
+        resposta, consultas_uma = self.enviar(linhas[:1])
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        self.assertEqual(consultas_uma, consultas_tres)
+        self.assertEqual(ItemInspecionadoDefeito.objects.filter(defeito=self.defeito).count(), 4)
+
+    def test_erros_por_linha_e_nada_gravado(self):
+        outro_item = self.criar_recebimento(self.recebimento.conferente, 2).itens_recebidos.first().pk
+        linhas = [
+            {'item_recebido_id': self.itens[0], 'defeito_id': self.defeito.pk, 'quantidade_defeituosa': '5'},
+            {'item_recebido_id': outro_item, 'defeito_id': self.defeito.pk, 'quantidade_defeituosa': '1'},
+            {'item_recebido_id': self.itens[1], 'defeito_id': 999999, 'quantidade_defeituosa': '1'},
+            # 9 contados e 1 já apontado: 5 + 4 excede
+            {'item_recebido_id': self.itens[0], 'defeito_id': self.defeito.pk, 'quantidade_defeituosa': '4'},
+            {'item_recebido_id': self.itens[2], 'defeito_id': self.defeito.pk, 'quantidade_defeituosa': 'x'},
+        ]
+        resposta, _ = self.enviar(linhas)
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.data['defeitos'][4].keys(), {'quantidade_defeituosa'})
+
+        resposta, _ = self.enviar(linhas[:4])
+        self.assertEqual(resposta.status_code, 400)
+        erros = resposta.data['defeitos']
+        self.assertEqual(erros[0], {})
+        self.assertEqual(list(erros[1]), ['item_recebido_id'])
+        self.assertEqual(list(erros[2]), ['defeito_id'])
+        self.assertEqual(list(erros[3]), ['quantidade_defeituosa'])
+        self.assertFalse(ItemInspecionadoDefeito.objects.filter(defeito=self.defeito).exists())
+
+
+class CatalogoMateriaisTest(DadosZeniteMixin, TestCase):
+    """ Importação do catálogo do ERP: insere, atualiza e pula os materiais iguais. """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.criar_usuario('analista', 'Analista'))
+        self.existente = Material.objects.create(codigo_interno='MAT-A', descricao='Antiga', unidade_medida='un')
+
+    def importar(self, conteudo, nome='catalogo.csv'):
+        arquivo = SimpleUploadedFile(nome, conteudo.encode('utf-8-sig'))
+        return self.client.post('/api/materiais/importar/', {'arquivo': arquivo}, format='multipart')
+
+    def test_csv_insere_atualiza_e_pula(self):
+        conteudo = (
+            'codigo_interno;descricao;unidade_medida\n'
+            'MAT-A;Couro curtido;m²\n'
+            'MAT-B;Solado;par\n'
+            'MAT-C;Linha;kg\n'
+            'MAT-C;Linha encerada;kg\n'
+            'MAT-D;Cola;litro\n'
+        )
+        resposta = self.importar(conteudo)
+        self.assertEqual(resposta.status_code, 200, resposta.data)
+        contagens = {chave: resposta.data[chave] for chave in ('linhas', 'inseridos', 'atualizados', 'inalterados', 'invalidos')}
+        self.assertEqual(contagens, {'linhas': 5, 'inseridos': 2, 'atualizados': 1, 'inalterados': 1, 'invalidos': 1})
+        self.assertEqual(resposta.data['erros'][0]['linha'], 6)
+        self.assertEqual(Material.objects.get(codigo_interno='MAT-C').descricao, 'Linha encerada')
+        self.existente.refresh_from_db()
+        self.assertEqual((self.existente.descricao, self.existente.unidade_medida), ('Couro curtido', 'm²'))
+
+        # O mesmo arquivo de novo: nada é gravado
+        atualizado_em = self.existente.updated_at
+        resposta = self.importar(conteudo)
+        self.assertEqual((resposta.data['inseridos'], resposta.data['atualizados'], resposta.data['inalterados']), (0, 0, 4))
+        self.existente.refresh_from_db()
+        self.assertEqual(self.existente.updated_at, atualizado_em)
+
+        self.assertEqual(self.importar('codigo;descricao\nX;Y\n').status_code, 400)
+        self.assertEqual(self.importar('{}', nome='catalogo.xlsx').status_code, 400)
+
+    def test_comando_jsonl_em_lotes(self):
+        linhas = [{'codigo_interno': f'JS-{n}', 'descricao': f'Material {n}', 'unidade_medida': 'un'} for n in range(5)]
+        conteudo = '\n'.join([json.dumps(linha) for linha in linhas] + ['nao e json', '[1]'])
+        with TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, 'catalogo.jsonl')
+            with open(caminho, 'w', encoding='utf-8') as arquivo:
+                arquivo.write(conteudo)
+            saida = io.StringIO()
+            call_command('importar_materiais', caminho, tamanho_lote=2, stdout=saida)
+        self.assertEqual(Material.objects.filter(codigo_interno__startswith='JS-').count(), 5)
+        self.assertIn('5 inserido(s)', saida.getvalue())
+        self.assertIn('2 inválido(s)', saida.getvalue())
+
+
+@override_settings(REPLICAS_LEITURA=['replica1'])
+class RoteamentoReplicasTest(DadosZeniteMixin, TransactionTestCase):
+    """
+    GETs leem da réplica; escritas, transações e a janela depois de uma escrita
+    ficam no primário. TransactionTestCase: o atomic do TestCase prenderia tudo
+    ao primário. Só o banco escolhido é verificado (replica1 não existe aqui).
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = self.criar_usuario('conferente', 'Conferente')
+        self.fabrica = RequestFactory()
+
+    def requisitar(self, metodo, acao=None, status=200):
+        bancos = {}
+
+        def view(request):
+            request.user = self.usuario
+            bancos['antes'] = Recebimento.objects.all().db
+            bancos['token'] = Token.objects.all().db
+            if acao:
+                acao()
+            bancos['depois'] = Recebimento.objects.all().db
+            with transaction.atomic():
+                bancos['transacao'] = Recebimento.objects.all().db
+            return HttpResponse(status=status)
+
+        RoteamentoMiddleware(view)(getattr(self.fabrica, metodo)('/api/recebimentos/'))
+        return bancos
+
+    def test_leitura_na_replica(self):
+        bancos = self.requisitar('get')
+        self.assertEqual(bancos, {'antes': 'replica1', 'token': 'default', 'depois': 'replica1', 'transacao': 'default'})
+        # Fora de uma requisição (comandos, workers), tudo vai ao primário
+        self.assertEqual(Recebimento.objects.all().db, 'default')
+
+    def test_escrita_prende_o_usuario_ao_primario(self):
+        bancos = self.requisitar('get', acao=lambda: Defeito.objects.create(nome='Mancha'))
+        self.assertEqual((bancos['antes'], bancos['depois']), ('replica1', 'default'))
+        self.assertTrue(cache.get(CHAVE_CACHE_PRIMARIO.format(self.usuario.pk)))
+        self.assertEqual(self.requisitar('get')['antes'], 'default')
+
+        # Passada a janela, volta para a réplica
+        cache.delete(CHAVE_CACHE_PRIMARIO.format(self.usuario.pk))
+        self.assertEqual(self.requisitar('get')['antes'], 'replica1')
+
+    def test_snapshot_montado_no_get_nao_prende_o_usuario(self):
+        recebimento = self.criar_recebimento(self.usuario, 1)
+
+        def view(request):
+            request.user = self.usuario
+            divergencias, recalculado, _ = conciliar_com_snapshot(Recebimento.objects.using('default').get(pk=recebimento.pk))
+            # As divergências recém-gravadas são lidas do primário
+            self.assertEqual((len(divergencias), recalculado), (3, True))
+            return HttpResponse()
+
+        RoteamentoMiddleware(view)(self.fabrica.get('/api/recebimentos/'))
+        self.assertIsNone(cache.get(CHAVE_CACHE_PRIMARIO.format(self.usuario.pk)))
+        self.assertEqual(self.requisitar('get')['antes'], 'replica1')
+
+    def test_resposta_em_streaming_le_da_replica(self):
+        bancos = []
+
+        def view(request):
+            request.user = self.usuario
+
+            def gerar():
+                for _ in range(2):
+                    bancos.append(Recebimento.objects.all().db)
+                    yield b'linha\n'
+            return StreamingHttpResponse(gerar())
+
+        resposta = RoteamentoMiddleware(view)(self.fabrica.get('/api/recebimentos/exportar/'))
+        # O conteúdo só é gerado aqui, depois do middleware
+        self.assertEqual(b''.join(resposta.streaming_content), b'linha\nlinha\n')
+        self.assertEqual(bancos, ['replica1', 'replica1'])
+        self.assertEqual(Recebimento.objects.all().db, 'default')
+
+    def test_metodos_de_escrita(self):
+        self.assertEqual(self.requisitar('post', status=400)['antes'], 'default')
+        self.assertIsNone(cache.get(CHAVE_CACHE_PRIMARIO.format(self.usuario.pk)))
+        self.requisitar('post', status=201)
+        self.assertEqual(self.requisitar('get')['antes'], 'default')
+
+
+class ConciliacaoPorGradeTest(DadosZeniteMixin, TestCase):
+    """ Uma grade trocada diverge por numeração mesmo com o total do material conferindo. """
+
+    def setUp(self):
+        self.usuario = self.criar_usuario('analista', 'Analista')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        # 3 materiais: plano e NF com 10, recebido 9; o primeiro ganha grade, com o recebido trocado
+        self.recebimento = self.criar_recebimento(self.usuario, 1)
+        self.material = Material.objects.get(codigo_interno='MAT-1-0')
+        grade = {'37': 4, '38': 6}
+        ItemPlanoCompra.objects.filter(material=self.material).update(cor='Preto', grade_numeracao=grade)
+        ItemNotaFiscal.objects.filter(material=self.material).update(cor='Preto', grade_numeracao=grade)
+        ItemRecebido.objects.filter(material=self.material).update(
+            cor='Preto', quantidade_contada=10, grade_numeracao={'37': 6, '38': 4}
+        )
+
+    def test_divergencias_por_celula(self):
+        self.assertNotIn('MAT-1-0', [linha['material_codigo'] for linha in conciliar_recebimento(self.recebimento.pk)])
+
+        with self.assertNumQueries(1):
+            linhas = conciliar_por_grade(self.recebimento.pk)
+        celulas = [
+            (linha['material_codigo'], linha['cor'], linha['numeracao'], linha['qtd_plano'], linha['qtd_nf'], linha['qtd_recebida'])
+            for linha in linhas
+        ]
+        self.assertEqual(celulas, [
+            ('MAT-1-0', 'Preto', '37', 4, 4, 6),
+            ('MAT-1-0', 'Preto', '38', 6, 6, 4),
+            # Sem grade: o item inteiro, sem numeração
+            ('MAT-1-1', '', None, 10, 10, 9),
+            ('MAT-1-2', '', None, 10, 10, 9),
+        ])
+        self.assertEqual(linhas[0]['tipo_divergencia'], ['Recebido a mais que a NF'])
+
+    def celulas(self, numeracao=None):
+        return [
+            (linha['material_codigo'], linha['cor'], linha['numeracao'], linha['qtd_plano'], linha['qtd_nf'], linha['qtd_recebida'])
+            for linha in conciliar_por_grade(self.recebimento.pk, numeracao)
+        ]
+
+    def test_celula_nao_numerica_compara_pelo_total(self):
+        for grade in ({'37': '6 pares', '38': 3}, {'37': '', '38': 3}):
+            ItemRecebido.objects.filter(material=self.material).update(quantidade_contada=9, grade_numeracao=grade)
+            self.assertEqual(self.celulas()[0], ('MAT-1-0', 'Preto', None, 10, 10, 9))
+        # Uma quantidade numérica gravada como texto continua valendo
+        ItemRecebido.objects.filter(material=self.material).update(grade_numeracao={'37': ' 4 ', '38': '6.0'})
+        self.assertEqual([celula[0] for celula in self.celulas()], ['MAT-1-1', 'MAT-1-2'])
+
+    def test_fonte_sem_grade_compara_pelo_total(self):
+        # A NF não traz cor nem grade: o material é comparado pelo total, sem divergência célula a célula
+        ItemNotaFiscal.objects.filter(material=self.material).update(cor='', grade_numeracao=None)
+        ItemRecebido.objects.filter(material=self.material).update(grade_numeracao={'37': 4, '38': 6})
+        self.assertEqual([celula[0] for celula in self.celulas()], ['MAT-1-1', 'MAT-1-2'])
+        self.assertEqual(self.celulas('38'), [])
+
+        ItemNotaFiscal.objects.filter(material=self.material).update(cor='Preto', quantidade=8)
+        self.assertEqual(self.celulas()[0], ('MAT-1-0', 'Preto', None, 10, 8, 10))
+
+    def test_api(self):
+        url = f'/api/recebimentos/{self.recebimento.pk}/conciliar/'
+        resposta = self.client.get(url, {'nivel': 'grade', 'numeracao': '38'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([(linha['numeracao'], linha['qtd_recebida']) for linha in resposta.data], [('38', 4)])
+        self.assertEqual(self.client.get(url, {'nivel': 'cor'}).status_code, 400)
+
+    def test_grade_do_recebimento_precisa_somar_a_quantidade(self):
+        item = {'material_id': self.material.pk, 'quantidade_contada': '10', 'cor': 'Preto'}
+        dados = {'plano_compra_id': self.recebimento.plano_compra_id, 'nota_fiscal_id': self.recebimento.nota_fiscal_id}
+        resposta = self.client.post('/api/recebimentos/', {
+            **dados, 'itens_a_receber': [{**item, 'grade_numeracao': {'37': 4, '38': 5}}],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('grade_numeracao', resposta.data['itens_a_receber'][0])
+
+        # Linhas repetidas do mesmo material e cor somam as grades
+        resposta = self.client.post('/api/recebimentos/', {
+            **dados, 'mesclar_duplicados': True, 'itens_a_receber': [
+                {**item, 'quantidade_contada': '4', 'grade_numeracao': {'37': 4}},
+                {**item, 'quantidade_contada': '6', 'grade_numeracao': {'37': 1, '38': 5}},
+            ],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        recebido = ItemRecebido.objects.get(recebimento_id=resposta.data['id'])
+        self.assertEqual((recebido.quantidade_contada, recebido.grade_numeracao), (10, {'37': 5, '38': 5}))
+
+        # Uma linha sem grade do mesmo material e cor vira um item à parte
+        resposta = self.client.post('/api/recebimentos/', {
+            **dados, 'mesclar_duplicados': True, 'itens_a_receber': [
+                {**item, 'quantidade_contada': '4', 'grade_numeracao': {'37': 4}},
+                {**item, 'quantidade_contada': '3'},
+                {**item, 'quantidade_contada': '6', 'grade_numeracao': {'37': 1, '38': 5}},
+                {**item, 'quantidade_contada': '2'},
+            ],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 201, resposta.data)
+        self.assertEqual(
+            sorted(
+                ItemRecebido.objects.filter(recebimento_id=resposta.data['id'])
+                .values_list('quantidade_contada', 'grade_numeracao')
+            ),
+            [(5, None), (10, {'37': 5, '38': 5})],
+        )
 
-# Create your tests here.
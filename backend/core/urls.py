@@ -1,22 +1,36 @@
 # core/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, views_async
 
 # Cria um roteador
 router = DefaultRouter()
 # Registra nosso ViewSet com o roteador, definindo o prefixo da URL
 router.register(r'planos-compra', views.PlanoCompraViewSet, basename='planocompra')
 router.register(r'fornecedores', views.FornecedorViewSet, basename='fornecedor')
+router.register(r'materiais', views.MaterialViewSet, basename='material')
 router.register(r'notas-fiscais', views.NotaFiscalViewSet, basename='notafiscal')
 router.register(r'recebimentos', views.RecebimentoViewSet, basename='recebimento')
 router.register(r'defeitos', views.DefeitoViewSet, basename='defeito')
 router.register(r'inspecoes-qualidade', views.InspecaoQualidadeViewSet, basename='inspecaoqualidade')
+router.register(r'jobs', views.JobViewSet, basename='job')
+
+# Leituras assíncronas (ASGI) dos mesmos recursos, em /api/async/ (ver core/views_async.py)
+rotas_async = [
+    path('recebimentos/<int:recebimento_id>/conciliar/', views_async.conciliar_recebimento, name='conciliar-recebimento-async'),
+]
+for prefixo, viewset, basename in router.registry:
+    rotas_async += [
+        path(f'{prefixo}/', views_async.leitura_assincrona(viewset, 'list'), name=f'{basename}-list-async'),
+        path(f'{prefixo}/<int:pk>/', views_async.leitura_assincrona(viewset, 'retrieve'), name=f'{basename}-detail-async'),
+    ]
 
 # Nossas URLs agora são compostas pelas rotas geradas pelo roteador
 # e pelo nosso endpoint customizado que já existia.
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/', include(rotas_async)),
     path('recebimentos/<int:recebimento_id>/conciliar/', views.conciliar_recebimento, name='conciliar-recebimento'),
+    path('metricas/', views.metricas, name='metricas'),
     path('api-token-auth/', views.CustomLoginView.as_view(), name='api_token_auth'),
 ]
\ No newline at end of file
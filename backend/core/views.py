@@ -1,32 +1,153 @@
+import logging
+import zipfile
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework import permissions
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.reverse import reverse
 from rest_framework import viewsets, status, serializers
 
 
-from .permissions import IsInGroup
-from .models import NotaFiscal, Recebimento, ItemRecebido, Material, Defeito, InspecaoQualidade, ItemInspecionadoDefeito, PlanoCompra, Fornecedor
-from .serializers import NotaFiscalSerializer, RecebimentoSerializer, UserSerializer, DefeitoSerializer, InspecaoQualidadeSerializer, RegistrarDefeitoSerializer, PlanoCompraSerializer, FornecedorSerializer
+from .analise_defeitos import pareto
+from .pagination import KeysetPagination
+from .progresso import progresso_do_plano
+from .scorecard import INDICADORES, marca_scorecard, ranking_fornecedores, scorecard_do_fornecedor
+from .permissions import IsInGroup, grupos_do_usuario
+from .conciliacao import NIVEIS_CONCILIACAO, conciliar_no_nivel
+from .conciliacao_lote import FORMATOS, dividir_em_lotes, executar_em_lotes, formatar_linhas
+from .authentication import cache_tokens
+from .catalogo import ErroCatalogo, ResumoCatalogo, formato_do_arquivo, importar_catalogo
+from .busca import LIMITE_MAXIMO, LIMITE_PADRAO, buscar_fornecedores, buscar_materiais
+from .condicional import (
+    DEPENDENCIAS_INSPECAO, DEPENDENCIAS_NOTA_FISCAL, DEPENDENCIAS_PLANO, DEPENDENCIAS_RECEBIMENTO, RespostaCondicionalMixin
+)
+from .exportacao import FORMATOS_EXPORTACAO, exportar_notas_fiscais, exportar_planos_compra, exportar_recebimentos, resposta_exportacao
+from .filtros import filtrar_notas_fiscais, filtrar_planos_compra, filtrar_recebimentos, ler_periodo
+from .instrumentacao import agregado_rotas
+from .jobs import enfileirar, guardar_envios
+from .nfe import importar_xmls
+from .nfe_lote import ResumoImportacao, importar_arquivos
+from .models import NotaFiscal, Recebimento, ItemRecebido, Material, Defeito, InspecaoQualidade, ItemInspecionadoDefeito, PlanoCompra, Fornecedor, ItemPlanoCompra, ItemNotaFiscal, Job
+from .serializers import forma_da_requisicao, MaterialSerializer, NotaFiscalSerializer, RecebimentoSerializer, UserSerializer, DefeitoSerializer, InspecaoQualidadeSerializer, RegistrarDefeitoSerializer, RegistrarDefeitosSerializer, PlanoCompraSerializer, FornecedorSerializer, JobSerializer
+
+logger = logging.getLogger(__name__)
+
+# Ações que devolvem a representação do serializer (com as relações pedidas em ?expand=)
+ACOES_COM_DETALHES = ('list', 'retrieve', 'update', 'partial_update')
+
+# Ações que aceitam os filtros da listagem (core/filtros.py)
+ACOES_FILTRADAS = ('list', 'exportar')
+
+
+def ler_opcoes_exportacao(params):
+    """ Lê ?formato=csv|xlsx e ?conciliacao=1 das exportações. """
+    formato = params.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACAO:
+        raise serializers.ValidationError({'formato': f"Formato inválido. Use: {', '.join(FORMATOS_EXPORTACAO)}."})
+    return formato, params.get('conciliacao') in ('1', 'true')
+
+
+def responder_busca(request, buscar):
+    """ Lê ?q= e ?limite= (até LIMITE_MAXIMO) e devolve o resultado de `buscar`. """
+    try:
+        limite = int(request.query_params.get('limite', LIMITE_PADRAO))
+    except ValueError:
+        return Response({'error': 'limite deve ser um número inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+    limite = min(max(limite, 1), LIMITE_MAXIMO)
+    return Response(buscar(request.query_params.get('q', ''), limite))
+
+
+def ler_opcoes_conciliacao(params):
+    """ Lê ?fresh=1, ?nivel=material|grade e ?numeracao= da conciliação (os parâmetros do job). """
+    nivel = params.get('nivel', 'material')
+    if nivel not in NIVEIS_CONCILIACAO:
+        raise serializers.ValidationError({'nivel': f"Nível inválido. Use: {', '.join(NIVEIS_CONCILIACAO)}."})
+    opcoes = {'fresh': params.get('fresh') in ('1', 'true')}
+    if nivel == 'grade':
+        opcoes.update(nivel=nivel, numeracao=params.get('numeracao') or None)
+    return opcoes
+
+
+def em_segundo_plano(request):
+    """ ?async=1: a ação vira um job (core/jobs.py), executado pelo zenite_worker. """
+    return request.query_params.get('async') in ('1', 'true')
+
+
+def responder_job(request, job):
+    """ 202 Accepted com o job; o Location aponta para o acompanhamento em /api/jobs/<id>/. """
+    url = reverse('job-detail', args=[job.pk], request=request)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+
+
+# -----------------------------------------------------------------------------
+# ÁRVORES DE PREFETCH - seguem o ?expand= da requisição (ver CamposDinamicosMixin):
+# relações não expandidas não são consultadas
+# -----------------------------------------------------------------------------
+def expansao(request):
+    """ Árvore do ?expand= da requisição (vazia em escritas). """
+    return forma_da_requisicao(request)[1]
+
+
+def otimizar_planos(queryset, expandir, prefixo=''):
+    if 'itens' in expandir:
+        queryset = queryset.prefetch_related(
+            Prefetch(f'{prefixo}itens', queryset=ItemPlanoCompra.objects.select_related('material'))
+        )
+    return queryset
+
+
+def otimizar_notas_fiscais(queryset, expandir, prefixo=''):
+    if 'itens_nf' in expandir:
+        queryset = queryset.prefetch_related(
+            Prefetch(f'{prefixo}itens_nf', queryset=ItemNotaFiscal.objects.select_related('material'))
+        )
+    return queryset
+
+
+def otimizar_recebimentos(queryset, expandir, prefixo=''):
+    """ Aplica os select_related/prefetch que o RecebimentoSerializer vai usar com `expandir`. """
+    queryset = queryset.select_related(f'{prefixo}conferente', f'{prefixo}inspecao')
+    if 'plano_compra' in expandir:
+        queryset = otimizar_planos(
+            queryset.select_related(f'{prefixo}plano_compra'), expandir['plano_compra'], f'{prefixo}plano_compra__'
+        )
+    if 'nota_fiscal' in expandir:
+        queryset = otimizar_notas_fiscais(
+            queryset.select_related(f'{prefixo}nota_fiscal'), expandir['nota_fiscal'], f'{prefixo}nota_fiscal__'
+        )
+    if 'itens_recebidos' in expandir:
+        itens = ItemRecebido.objects.select_related('material')
+        if 'defeitos_encontrados' in expandir['itens_recebidos']:
+            itens = itens.prefetch_related(
+                Prefetch('defeitos_encontrados', queryset=ItemInspecionadoDefeito.objects.select_related('defeito'))
+            )
+        queryset = queryset.prefetch_related(Prefetch(f'{prefixo}itens_recebidos', queryset=itens))
+    return queryset
+
 
 @api_view(['GET']) # Este decorator diz que esta view só aceita requisições do tipo GET
 def conciliar_recebimento(request, recebimento_id):
     """
     Endpoint da API para disparar a conciliação de um recebimento específico.
+
+    O resultado vem do snapshot persistido (ConciliacaoItem), que é mantido
+    pelos signals. Com ?fresh=1 a conciliação é recalculada e o cabeçalho
+    X-Conciliacao-Drift informa quantas linhas do snapshot estavam desatualizadas.
+    Com ?nivel=grade as divergências são por material, cor e numeração (só da
+    ?numeracao= informada, se houver). Com ?async=1 a conciliação roda em um job
+    e a resposta é 202.
     """
     try:
         # 1. Busca o recebimento no banco de dados pelo ID fornecido na URL
-        recebimento = Recebimento.objects.get(pk=recebimento_id)
-
-        # 2. Executa o método que já criamos e testamos
-        resultado_divergencias = recebimento.realizar_conciliacao()
-
-        # 3. Retorna o resultado como uma resposta JSON
-        return Response(resultado_divergencias, status=status.HTTP_200_OK)
-
+        recebimento = Recebimento.objects.only('id', 'conciliacao_atualizada_em').get(pk=recebimento_id)
     except Recebimento.DoesNotExist:
         # Se o ID não for encontrado, retorna um erro 404
         return Response(
@@ -34,18 +155,154 @@ def conciliar_recebimento(request, recebimento_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
+    opcoes = ler_opcoes_conciliacao(request.query_params)
+    if em_segundo_plano(request):
+        # Um pedido igual ainda na fila é reaproveitado
+        job = enfileirar('conciliacao', {'recebimento_id': recebimento.pk, **opcoes}, request.user, unico=True)
+        return responder_job(request, job)
+
+    # 2. Recalcula se for pedido explicitamente ou se o snapshot ainda não existe,
+    #    e lê as divergências do snapshot (consulta indexada por recebimento);
+    #    a grade é sempre calculada, em uma única consulta
+    divergencias, recalculado, drift = conciliar_no_nivel(recebimento, **opcoes)
+    resposta = Response(divergencias, status=status.HTTP_200_OK)
+    resposta['X-Conciliacao-Origem'] = 'recalculado' if recalculado else 'snapshot'
+    if opcoes['fresh']:
+        resposta['X-Conciliacao-Drift'] = str(drift)
+    return resposta
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated, IsInGroup('Administrador')])
+def metricas(request):
+    """
+    Percentis de latência (p50/p95/p99) e consultas médias por rota, medidos pelo
+    InstrumentacaoMiddleware neste processo, e as estatísticas do cache de tokens.
+    DELETE zera os contadores.
+    """
+    if request.method == 'DELETE':
+        agregado_rotas.limpar()
+        cache_tokens.zerar_estatisticas()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({'rotas': agregado_rotas.resumo(), 'cache_tokens': cache_tokens.estatisticas()})
+
 
-class PlanoCompraViewSet(viewsets.ModelViewSet):
+class PlanoCompraViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     """
     ViewSet para visualizar, criar, editar e deletar Planos de Compra.
     """
-    queryset = PlanoCompra.objects.all().order_by('-data_emissao')
+    queryset = PlanoCompra.objects.all().order_by('-data_emissao', '-id')
     serializer_class = PlanoCompraSerializer
+    dependencias_etag = DEPENDENCIAS_PLANO
+    pagination_class = KeysetPagination
+    ordering = ('-data_emissao', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ACOES_COM_DETALHES:
+            queryset = otimizar_planos(queryset, expansao(self.request))
+        if self.action in ACOES_FILTRADAS:
+            queryset = filtrar_planos_compra(queryset, self.request.query_params)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """
+        Exporta os itens dos planos filtrados (fornecedor, data_inicio, data_fim, status)
+        em streaming, em CSV ou XLSX (?formato=). Com ?conciliacao=1 inclui o recebido e o saldo.
+        """
+        formato, conciliacao = ler_opcoes_exportacao(request.query_params)
+        colunas, linhas = exportar_planos_compra(self.get_queryset(), conciliacao)
+        return resposta_exportacao('planos_compra', formato, colunas, linhas)
 
-class FornecedorViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def progresso(self, request, pk=None):
+        """
+        Previsto x recebido por material, somando todos os recebimentos do plano.
+        Lê os totais mantidos em ProgressoPlanoMaterial, sem varrer os recebimentos.
+        """
+        return Response(progresso_do_plano(self.get_object()))
+
+class FornecedorViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     queryset = Fornecedor.objects.all().order_by('nome_fantasia')
     serializer_class = FornecedorSerializer
+    etag_na_listagem = True
+    permission_classes = [permissions.IsAuthenticated, IsInGroup('Administrador', 'Analista')]
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def busca(self, request):
+        """ Autocompletar: ?q= (prefixo do CNPJ, razão social ou nome fantasia) e ?limite=. """
+        return responder_busca(request, buscar_fornecedores)
+
+    @action(detail=True, methods=['get'])
+    def scorecard(self, request, pk=None):
+        """
+        Pontualidade, atendimento do plano, acurácia da NF e taxa de defeitos do
+        fornecedor no período (data_inicio, data_fim), somados do scorecard diário.
+        """
+        fornecedor = self.get_object()
+        data_inicio, data_fim = ler_periodo(request.query_params)
+        return Response(scorecard_do_fornecedor(fornecedor.pk, data_inicio, data_fim))
+
+    @action(detail=False, methods=['get'])
+    def ranking(self, request):
+        """ Fornecedores ordenados por um indicador (?ordenar=) no período (data_inicio, data_fim). """
+        data_inicio, data_fim = ler_periodo(request.query_params)
+        ordenar = request.query_params.get('ordenar', 'pontualidade')
+        if ordenar not in INDICADORES:
+            return Response({'error': f"Indicador inválido. Use: {', '.join(INDICADORES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            minimo = int(request.query_params.get('minimo_recebimentos', 1))
+        except ValueError:
+            return Response({'error': 'minimo_recebimentos deve ser um número inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'data_inicio': data_inicio,
+            'data_fim': data_fim,
+            'ordenar': ordenar,
+            'atualizado_ate': marca_scorecard(),
+            'fornecedores': ranking_fornecedores(data_inicio, data_fim, ordenar, minimo),
+        })
+
+class MaterialViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
+    """ API para visualizar e gerenciar os Materiais. """
+    queryset = Material.objects.all().order_by('codigo_interno')
+    serializer_class = MaterialSerializer
     permission_classes = [permissions.IsAuthenticated, IsInGroup('Administrador', 'Analista')]
+    pagination_class = KeysetPagination
+    ordering = ('codigo_interno',)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def busca(self, request):
+        """ Autocompletar: ?q= (prefixo do código interno ou parte da descrição) e ?limite=. """
+        return responder_busca(request, buscar_materiais)
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def importar(self, request):
+        """
+        Importa o catálogo do ERP (campo "arquivo", CSV ou JSONL; ?formato= ou pela
+        extensão): cria os materiais novos, atualiza os alterados e pula os iguais.
+        Devolve as contagens, linhas/s e os erros por linha. Com ?async=1 a
+        importação roda em um job e a resposta é 202.
+        """
+        arquivo = request.FILES.get('arquivo')
+        if arquivo is None:
+            return Response({'error': 'Envie o catálogo no campo "arquivo".'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            formato = formato_do_arquivo(arquivo.name, request.query_params.get('formato'))
+        except ErroCatalogo as erro:
+            return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+        if em_segundo_plano(request):
+            job = enfileirar('importacao_materiais', {'arquivo': guardar_envios([arquivo])[0], 'formato': formato}, request.user)
+            return responder_job(request, job)
+
+        resumo = ResumoCatalogo()
+        try:
+            for lote in importar_catalogo(arquivo, formato):
+                resumo.registrar(lote)
+        except (ErroCatalogo, UnicodeDecodeError) as erro:
+            # Os lotes anteriores ao erro já foram gravados
+            return Response({'error': str(erro), 'resumo': resumo.como_dict()}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resumo.como_dict(), status=status.HTTP_200_OK)
 
 class CustomLoginView(ObtainAuthToken):
     def post(self, request, *args, **kwargs):
@@ -63,15 +320,96 @@ class CustomLoginView(ObtainAuthToken):
             'user': user_serializer.data
         })
 
-class NotaFiscalViewSet(viewsets.ModelViewSet):
-    queryset = NotaFiscal.objects.all().order_by('-data_emissao')
+class NotaFiscalViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
+    queryset = NotaFiscal.objects.all().order_by('-data_emissao', '-id')
     serializer_class = NotaFiscalSerializer
+    dependencias_etag = DEPENDENCIAS_NOTA_FISCAL
     permission_classes = [permissions.IsAuthenticated, IsInGroup('Administrador', 'Analista')]
+    pagination_class = KeysetPagination
+    ordering = ('-data_emissao', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ACOES_COM_DETALHES:
+            queryset = otimizar_notas_fiscais(queryset, expansao(self.request))
+        if self.action in ACOES_FILTRADAS:
+            queryset = filtrar_notas_fiscais(queryset, self.request.query_params)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """
+        Exporta os itens das notas filtradas (fornecedor, data_inicio, data_fim, numero)
+        em streaming, em CSV ou XLSX (?formato=).
+        """
+        formato, _ = ler_opcoes_exportacao(request.query_params)
+        colunas, linhas = exportar_notas_fiscais(self.get_queryset())
+        return resposta_exportacao('notas_fiscais', formato, colunas, linhas)
+
+    @action(detail=False, methods=['post'], url_path='importar-xml', parser_classes=[MultiPartParser])
+    def importar_xml(self, request):
+        """
+        Importa um ou mais XMLs de NF-e (campo "arquivos" do formulário) e cria ou
+        atualiza as notas e os seus itens. O resultado vem na ordem dos arquivos.
+        Com ?async=1 os arquivos são importados em um job e a resposta é 202.
+        """
+        arquivos = request.FILES.getlist('arquivos') or request.FILES.getlist('arquivo')
+        if not arquivos:
+            return Response({'error': 'Envie ao menos um arquivo XML no campo "arquivos".'}, status=status.HTTP_400_BAD_REQUEST)
+        if em_segundo_plano(request):
+            job = enfileirar('importacao_xml', {'arquivos': guardar_envios(arquivos)}, request.user)
+            return responder_job(request, job)
+
+        resultados = importar_xmls(arquivos)
+        sucesso = any(resultado['status'] in ('criada', 'atualizada') for resultado in resultados)
+        return Response(resultados, status=status.HTTP_201_CREATED if sucesso else status.HTTP_400_BAD_REQUEST)
 
-class RecebimentoViewSet(viewsets.ModelViewSet):
-    queryset = Recebimento.objects.all().order_by('-data_recebimento')
+    @action(detail=False, methods=['post'], url_path='importar-lote', parser_classes=[MultiPartParser])
+    def importar_lote(self, request):
+        """
+        Importa um arquivo ZIP com XMLs de NF-e (campo "arquivo"). Notas já cadastradas
+        são puladas. Devolve o resumo (com arquivos/s e linhas/s) e o resultado por arquivo.
+        Com ?async=1 o ZIP é importado em um job e a resposta é 202.
+
+        Os XMLs são lidos no próprio processo (da requisição ou do job): a leitura
+        em vários processos é a do comando `manage.py importar_nfes`.
+        """
+        arquivo = request.FILES.get('arquivo')
+        if arquivo is None:
+            return Response({'error': 'Envie o arquivo ZIP no campo "arquivo".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if em_segundo_plano(request):
+            if not zipfile.is_zipfile(arquivo):
+                return Response({'error': 'O arquivo enviado não é um ZIP válido.'}, status=status.HTTP_400_BAD_REQUEST)
+            arquivo.seek(0)
+            job = enfileirar('importacao_lote', {'arquivo': guardar_envios([arquivo])[0]}, request.user)
+            return responder_job(request, job)
+
+        resumo = ResumoImportacao()
+        arquivos = []
+        try:
+            for resultados in importar_arquivos(arquivo):
+                resumo.registrar(resultados)
+                arquivos.extend(resultados)
+        except zipfile.BadZipFile:
+            return Response({'error': 'O arquivo enviado não é um ZIP válido.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'resumo': resumo.como_dict(), 'arquivos': arquivos}, status=status.HTTP_200_OK)
+
+class RecebimentoViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
+    queryset = Recebimento.objects.all().order_by('-data_recebimento', '-id')
     serializer_class = RecebimentoSerializer
+    dependencias_etag = DEPENDENCIAS_RECEBIMENTO
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering = ('-data_recebimento', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ACOES_COM_DETALHES:
+            queryset = otimizar_recebimentos(queryset, expansao(self.request))
+        if self.action in ACOES_FILTRADAS:
+            queryset = filtrar_recebimentos(queryset, self.request.query_params)
+        return queryset
 
     def perform_create(self, serializer):
         """Salva o recebimento associando o usuário logado como o conferente."""
@@ -95,18 +433,91 @@ class RecebimentoViewSet(viewsets.ModelViewSet):
         serializer = InspecaoQualidadeSerializer(nova_inspecao)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-class DefeitoViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'], url_path='conciliar-lote',
+            permission_classes=[IsAuthenticated, IsInGroup('Administrador', 'Analista')])
+    def conciliar_lote(self, request):
+        """
+        Concilia em lote os recebimentos filtrados (fornecedor, data_inicio, data_fim,
+        status_plano) e devolve as divergências em streaming, em JSONL ou CSV.
+
+        Os lotes rodam em sequência, no próprio processo da requisição: a versão
+        em vários processos é a do comando `manage.py conciliar_lote`.
+        """
+        formato = request.query_params.get('formato', 'jsonl')
+        if formato not in FORMATOS:
+            return Response({'error': f"Formato inválido. Use: {', '.join(FORMATOS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            tamanho_lote = max(1, int(request.query_params.get('tamanho_lote', 500)))
+        except ValueError:
+            return Response({'error': 'tamanho_lote deve ser um número inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = filtrar_recebimentos(Recebimento.objects.all(), request.query_params)
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        lotes = dividir_em_lotes(ids, tamanho_lote)
+
+        def gerar():
+            if formato == 'csv':
+                yield formatar_linhas([], formato, incluir_cabecalho=True)
+            for _, _, linhas in executar_em_lotes(lotes):
+                yield formatar_linhas(linhas, formato)
+
+        content_type = 'application/x-ndjson' if formato == 'jsonl' else 'text/csv; charset=utf-8'
+        resposta = StreamingHttpResponse(gerar(), content_type=content_type)
+        resposta['Content-Disposition'] = f'attachment; filename="conciliacao.{formato}"'
+        resposta['X-Total-Recebimentos'] = str(len(ids))
+        return resposta
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated, IsInGroup('Administrador', 'Analista')])
+    def exportar(self, request):
+        """
+        Exporta os itens dos recebimentos filtrados (fornecedor, data_inicio, data_fim,
+        status_plano) em streaming, em CSV ou XLSX (?formato=). Com ?conciliacao=1
+        inclui as quantidades de plano, NF e recebido e o tipo de divergência.
+        """
+        formato, conciliacao = ler_opcoes_exportacao(request.query_params)
+        colunas, linhas = exportar_recebimentos(self.get_queryset(), conciliacao)
+        return resposta_exportacao('recebimentos', formato, colunas, linhas)
+
+class DefeitoViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     """ API para visualizar e gerenciar os tipos de defeito. """
     queryset = Defeito.objects.all().order_by('nome')
     serializer_class = DefeitoSerializer
+    etag_na_listagem = True
     permission_classes = [permissions.IsAuthenticated, IsInGroup('Administrador')]
 
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated, IsInGroup('Administrador', 'Analista', 'Revisor')])
+    def pareto(self, request):
+        """
+        Pareto dos defeitos apontados: ?agrupar=defeito|material|fornecedor,
+        ?medida=quantidade|ocorrencias, ?top=N e os filtros data_inicio, data_fim,
+        fornecedor, material e defeito. Lê a tabela FatoDefeito, com cache.
+        """
+        return Response(pareto(request.query_params))
+
 
-class InspecaoQualidadeViewSet(viewsets.ModelViewSet):
+class InspecaoQualidadeViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     """ API para visualizar e gerenciar as Inspeções de Qualidade. """
-    queryset = InspecaoQualidade.objects.all().order_by('-created_at')
+    queryset = InspecaoQualidade.objects.all().order_by('-created_at', '-id')
     serializer_class = InspecaoQualidadeSerializer
+    dependencias_etag = DEPENDENCIAS_INSPECAO
     permission_classes = [permissions.IsAuthenticated, IsInGroup('Administrador', 'Analista', 'Revisor')]
+    pagination_class = KeysetPagination
+    ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ACOES_COM_DETALHES:
+            queryset = queryset.select_related('revisor')
+            expandir = expansao(self.request)
+            if 'recebimento' in expandir:
+                queryset = otimizar_recebimentos(
+                    queryset.select_related('recebimento'), expandir['recebimento'], prefixo='recebimento__'
+                )
+        elif self.action == 'registrar_defeito':
+            queryset = queryset.select_related('recebimento')
+        return queryset
 
     def perform_create(self, serializer):
         """ Associa o usuário logado como o revisor da inspeção. """
@@ -132,4 +543,46 @@ class InspecaoQualidadeViewSet(viewsets.ModelViewSet):
             except (ItemRecebido.DoesNotExist, Defeito.DoesNotExist):
                 return Response({'error': 'Item ou Defeito inválido.'}, status=status.HTTP_400_BAD_REQUEST)
         else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['post'])
+    def registrar_defeitos(self, request, pk=None):
+        """
+        Registra vários defeitos de uma vez: uma lista (ou {"defeitos": [...]}) de
+        {item_recebido_id, defeito_id, quantidade_defeituosa}. Se alguma linha for
+        inválida nada é gravado e a resposta traz os erros de cada linha, na ordem enviada.
+        """
+        inspecao = self.get_object()
+        dados = {'defeitos': request.data} if isinstance(request.data, list) else request.data
+        serializer = RegistrarDefeitosSerializer(data=dados, context={'recebimento_id': inspecao.recebimento_id})
+        # Validação e gravação na mesma transação (os itens ficam travados até o fim)
+        with transaction.atomic():
+            serializer.is_valid(raise_exception=True)
+            defeitos = serializer.save()
+        return Response(
+            {'status': f'{len(defeitos)} defeito(s) registrado(s)', 'ids': [defeito.pk for defeito in defeitos]},
+            status=status.HTTP_201_CREATED
+        )
+
+
+class JobViewSet(RespostaCondicionalMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Acompanhamento dos jobs em segundo plano (status, progresso e resultado).
+    Cada usuário vê os jobs que criou; administradores veem todos. O ETag permite
+    consultar o andamento com If-None-Match e receber 304 enquanto nada mudou.
+    """
+    queryset = Job.objects.all().order_by('-created_at', '-id')
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('criado_por')
+        if 'Administrador' not in grupos_do_usuario(self.request.user):
+            queryset = queryset.filter(criado_por=self.request.user)
+        if self.action == 'list':
+            for parametro in ('status', 'tipo'):
+                if self.request.query_params.get(parametro):
+                    queryset = queryset.filter(**{parametro: self.request.query_params[parametro]})
+        return queryset
@@ -0,0 +1,223 @@
+# core/views_async.py
+"""
+Leituras da API em views assíncronas, para o deploy ASGI (config/asgi.py).
+
+As views síncronas prendem uma thread do servidor enquanto esperam o
+PostgreSQL. Aqui a autenticação, as permissões, os filtros, a paginação e a
+forma da resposta (?fields=/?expand=) continuam sendo as dos viewsets de
+core/views.py, mas as consultas usam o ORM assíncrono e as que não dependem
+umas das outras rodam ao mesmo tempo, cada uma na sua conexão:
+
+1. no detalhe, a versão do ETag junto com a busca do objeto;
+2. depois, cada prefetch pedido em ?expand= (ex.: itens do plano, itens da NF
+   e itens recebidos de um recebimento).
+
+As rotas ficam em /api/async/ e devolvem o mesmo conteúdo das síncronas.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import prefetch_related_objects
+from django.http import Http404
+from rest_framework import status
+from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .conciliacao import conciliar_no_nivel
+from .condicional import versao
+from .jobs import enfileirar
+from .models import Recebimento
+from .views import em_segundo_plano, ler_opcoes_conciliacao, responder_job
+
+
+# -----------------------------------------------------------------------------
+# CONSULTAS EM PARALELO
+# -----------------------------------------------------------------------------
+def em_paralelo(funcao):
+    """
+    Versão assíncrona de `funcao` que roda fora da thread da requisição, com a
+    própria conexão, para ser combinada com asyncio.gather.
+
+    As threads do executor são fixas, então a conexão de cada uma é reaproveitada
+    por até PARALELO_CONN_MAX_AGE segundos (abrir uma conexão por consulta
+    custaria mais do que o paralelismo economiza).
+    """
+    def executar(*args, **kwargs):
+        for conexao in connections.all(initialized_only=True):
+            conexao.close_if_unusable_or_obsolete()
+        abertas = {conexao.alias for conexao in connections.all(initialized_only=True) if conexao.connection is not None}
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            idade_maxima = getattr(settings, 'PARALELO_CONN_MAX_AGE', 60)
+            for conexao in connections.all(initialized_only=True):
+                if conexao.alias not in abertas and conexao.connection is not None:
+                    conexao.close_at = time.monotonic() + idade_maxima
+                conexao.close_if_unusable_or_obsolete()
+    return sync_to_async(executar, thread_sensitive=False)
+
+
+async def prefetch_em_paralelo(objetos, lookups):
+    """ Executa cada lookup de prefetch ao mesmo tempo (eles não dependem uns dos outros). """
+    if objetos and lookups:
+        await asyncio.gather(*(em_paralelo(prefetch_related_objects)(objetos, lookup) for lookup in lookups))
+
+
+# -----------------------------------------------------------------------------
+# CICLO DO DRF (autenticação, permissões e negociação de conteúdo)
+# -----------------------------------------------------------------------------
+def _iniciar(classe, request, kwargs, acao=None, preparar=None):
+    """
+    Faz o que o dispatch do DRF faz antes de chamar o handler e, na mesma
+    thread, `preparar(view)`. Devolve (view, resposta de erro ou None, preparado).
+    """
+    metodo = request.method.lower()
+    iniciais = {'args': (), 'kwargs': kwargs}
+    if acao:
+        iniciais['action_map'] = {'get': acao, 'head': acao}
+    vista = classe(**iniciais)
+    vista.request = vista.initialize_request(request, **kwargs)
+    vista.headers = vista.default_response_headers
+    try:
+        vista.initial(vista.request, **kwargs)
+        if metodo not in ('get', 'head'):
+            raise MethodNotAllowed(request.method)
+        preparado = preparar(vista) if preparar else None
+    except Exception as exc:
+        return vista, vista.handle_exception(exc), None
+    return vista, None, preparado
+
+
+async def _executar(classe, request, kwargs, handler, acao=None, preparar=None):
+    vista, resposta, preparado = await sync_to_async(_iniciar)(classe, request, kwargs, acao, preparar)
+    if resposta is None:
+        try:
+            resposta = await handler(vista, preparado)
+        except Exception as exc:
+            resposta = vista.handle_exception(exc)
+    return vista.finalize_response(vista.request, resposta)
+
+
+# -----------------------------------------------------------------------------
+# LISTAGEM E DETALHE DOS VIEWSETS
+# -----------------------------------------------------------------------------
+def _queryset(vista):
+    """ Queryset da ação, separado dos lookups de prefetch (que rodam em paralelo). """
+    queryset = vista.get_queryset()
+    if vista.action == 'list':
+        queryset = vista.filter_queryset(queryset)
+    return queryset.prefetch_related(None), queryset._prefetch_related_lookups
+
+
+async def _serializar(vista, instancia, **kwargs):
+    # Em uma thread: um campo fora do prefetch ainda pode ir ao banco
+    return await sync_to_async(lambda: vista.get_serializer(instancia, **kwargs).data)()
+
+
+async def _detalhar(vista, preparado):
+    queryset, lookups = preparado
+    filtro = {vista.lookup_field: vista.kwargs[vista.lookup_url_kwarg or vista.lookup_field]}
+    (atualizado_em, total), objeto = await asyncio.gather(
+        em_paralelo(versao)(queryset.filter(**filtro), vista.dependencias_etag),
+        queryset.filter(**filtro).afirst(),
+    )
+    if objeto is None or atualizado_em is None:
+        raise Http404
+    vista.check_object_permissions(vista.request, objeto)
+
+    etag, ultima_modificacao, atualizado = vista._validadores(vista.request, atualizado_em, total)
+    if atualizado:
+        resposta = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        await prefetch_em_paralelo([objeto], lookups)
+        resposta = Response(await _serializar(vista, objeto))
+    return vista._marcar_validadores(resposta, etag, ultima_modificacao)
+
+
+async def _listar(vista, preparado):
+    queryset, lookups = preparado
+    paginador = vista.paginator
+    if paginador is None:
+        pagina = _todos(queryset)
+    else:
+        pagina = paginador.apaginate_queryset(queryset, vista.request, view=vista)
+
+    validadores = None
+    if vista.etag_na_listagem:
+        (atualizado_em, total), objetos = await asyncio.gather(
+            em_paralelo(versao)(queryset, vista.dependencias_etag), pagina
+        )
+        if atualizado_em is not None:
+            validadores = vista._validadores(vista.request, atualizado_em, total)
+    else:
+        objetos = await pagina
+
+    if validadores and validadores[2]:
+        resposta = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        await prefetch_em_paralelo(objetos, lookups)
+        dados = await _serializar(vista, objetos, many=True)
+        resposta = paginador.get_paginated_response(dados) if paginador is not None else Response(dados)
+    if validadores:
+        resposta = vista._marcar_validadores(resposta, validadores[0], validadores[1])
+    return resposta
+
+
+async def _todos(queryset):
+    return [objeto async for objeto in queryset]
+
+
+def leitura_assincrona(viewset, acao):
+    """ View assíncrona da ação 'list' ou 'retrieve' de um viewset de core/views.py. """
+    handler = _detalhar if acao == 'retrieve' else _listar
+
+    async def view(request, **kwargs):
+        return await _executar(viewset, request, kwargs, handler, acao, _queryset)
+
+    # Usados pelo InstrumentacaoMiddleware para identificar a rota
+    view.cls = viewset
+    view.actions = {'get': acao}
+    view.__name__ = f'{viewset.__name__}_{acao}_async'
+    return view
+
+
+# -----------------------------------------------------------------------------
+# CONCILIAÇÃO
+# -----------------------------------------------------------------------------
+async def conciliar_recebimento(request, recebimento_id):
+    """
+    Versão assíncrona de views.conciliar_recebimento, com a mesma resposta e
+    os mesmos cabeçalhos. As quantidades de plano, NF e recebido já vêm de uma
+    única consulta agregada (core/conciliacao.py).
+    """
+    async def conciliar(vista, _):
+        # 1. Busca o recebimento
+        try:
+            recebimento = await Recebimento.objects.only('id', 'conciliacao_atualizada_em').aget(pk=recebimento_id)
+        except Recebimento.DoesNotExist:
+            return Response(
+                {"error": f"Recebimento com ID {recebimento_id} não encontrado."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        opcoes = ler_opcoes_conciliacao(vista.request.query_params)
+        if em_segundo_plano(vista.request):
+            job = await sync_to_async(enfileirar)(
+                'conciliacao', {'recebimento_id': recebimento.pk, **opcoes}, vista.request.user, unico=True
+            )
+            return responder_job(vista.request, job)
+
+        # 2. Recalcula (com ?fresh=1 ou sem snapshot) e lê as divergências do snapshot,
+        #    ou calcula as da grade (?nivel=grade)
+        divergencias, recalculado, drift = await sync_to_async(conciliar_no_nivel)(recebimento, **opcoes)
+        resposta = Response(divergencias, status=status.HTTP_200_OK)
+        resposta['X-Conciliacao-Origem'] = 'recalculado' if recalculado else 'snapshot'
+        if opcoes['fresh']:
+            resposta['X-Conciliacao-Drift'] = str(drift)
+        return resposta
+
+    return await _executar(APIView, request, {'recebimento_id': recebimento_id}, conciliar)
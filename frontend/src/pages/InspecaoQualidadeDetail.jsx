@@ -23,7 +23,7 @@ function InspecaoQualidadeDetail() {
     try {
       // Fazemos as duas chamadas em paralelo
       const [inspecaoRes, defeitosRes] = await axios.all([
-        axios.get(`http://127.0.0.1:8000/api/inspecoes-qualidade/${id}/`),
+        axios.get(`http://127.0.0.1:8000/api/inspecoes-qualidade/${id}/?expand=recebimento.itens_recebidos.defeitos_encontrados`),
         axios.get('http://127.0.0.1:8000/api/defeitos/')
       ]);
       setInspecao(inspecaoRes.data);
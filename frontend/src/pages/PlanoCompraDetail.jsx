@@ -13,7 +13,7 @@ function PlanoCompraDetail() {
   useEffect(() => {
     setLoading(true);
     // Usamos o ID da URL para buscar os dados do plano específico
-    axios.get(`http://127.0.0.1:8000/api/planos-compra/${id}/`)
+    axios.get(`http://127.0.0.1:8000/api/planos-compra/${id}/?expand=itens`)
       .then(response => {
         setPlano(response.data);
         setLoading(false);
@@ -15,7 +15,8 @@ function PlanoCompraList() {
 
       axios.get('http://127.0.0.1:8000/api/planos-compra/')
         .then(response => {
-          setPlanos(response.data);
+          // A listagem é paginada por cursor: os registros vêm em 'results'
+          setPlanos(response.data.results);
         })
         .catch(error => {
           console.error('Ocorreu um erro ao buscar os dados:', error);
@@ -36,11 +36,12 @@ function RecebimentoCreate() {
                 };
                 // Busca os dados para os menus de seleção
                 const [planosRes, notasRes] = await axios.all([
-                    axios.get('http://127.0.0.1:8000/api/planos-compra/', config),
-                    axios.get('http://127.0.0.1:8000/api/notas-fiscais/', config)
+                    axios.get('http://127.0.0.1:8000/api/planos-compra/?page_size=500&fields=id,codigo_plano', config),
+                    axios.get('http://127.0.0.1:8000/api/notas-fiscais/?page_size=500&fields=id,numero', config)
                 ]);
-                setPlanos(planosRes.data);
-                setNotasFiscais(notasRes.data);
+                // As listagens são paginadas: os registros vêm em 'results'
+                setPlanos(planosRes.data.results);
+                setNotasFiscais(notasRes.data.results);
             } catch (error) {
                 console.error("Erro ao buscar dados para os formulários", error);
                 alert("Não foi possível carregar os dados dos menus. Verifique o console.");
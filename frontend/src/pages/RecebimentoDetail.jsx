@@ -28,7 +28,7 @@ function RecebimentoDetail() {
     // Função para buscar/atualizar os dados do recebimento
     const fetchRecebimento = async () => {
         try {
-            const response = await axios.get(`http://127.0.0.1:8000/api/recebimentos/${id}/`);
+            const response = await axios.get(`http://127.0.0.1:8000/api/recebimentos/${id}/?expand=plano_compra.itens,nota_fiscal,itens_recebidos.defeitos_encontrados`);
             console.log("Dados do Recebimento recebidos da API:", response.data);
             setRecebimento(response.data);
         } catch (err) {
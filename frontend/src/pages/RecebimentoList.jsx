@@ -14,7 +14,8 @@ function RecebimentoList() {
     setLoading(true);
     axios.get('http://127.0.0.1:8000/api/recebimentos/')
       .then(response => {
-        setRecebimentos(response.data);
+        // A listagem é paginada por cursor: os registros vêm em 'results'
+        setRecebimentos(response.data.results);
       })
       .catch(err => {
         console.error(err);